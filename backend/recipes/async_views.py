@@ -0,0 +1,187 @@
+"""
+Async versions of the read endpoints (catalog, uploaded, bookmarks, recipe detail), served under /api/recipes/async/.
+
+Each view reuses its sync DRF twin for the queryset, sparse fields and serializer, but runs the queries through
+Django's async ORM, so under ASGI a worker keeps serving other requests while one waits on the database. One
+request's queries still run one after another (the async ORM hands them all to the same thread), and they are the
+same queries the sync view runs. Authentication is the same JWT check the DRF views use.
+"""
+from abc import ABC, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from spice_bazaar.db_router import aread_alias_for, reading_from_replica, reset_read_alias, use_read_alias
+from users.cache import aget_bookmarked_ids, aget_bookmarks_version
+from .cache import aget_catalog_page
+from .etags import aget_list_etag, detail_etag, etag_matches
+from .filters import get_facet_filters, get_time_filters
+from .models import Recipes
+from .serializers import RecipeCatalogRowSerializer, RecipeViewSerializer
+from .views import RecipeCatalogView, UserRecipesView, BookmarkedRecipesView, RecipeViewView
+
+
+def render(data, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def render_exception(exc):
+    # same bodies as DRF's exception handler
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    headers = {}
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        headers['WWW-Authenticate'] = 'Bearer realm="api"'
+    return render(data, exc.status_code, headers)
+
+
+async def aauthenticate(request):
+    # the configured DRF authenticators, run in a thread since the token's user lookup is a sync query
+    for authenticator_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = await sync_to_async(authenticator_class().authenticate)(request)
+        if result is not None:
+            return result[0]
+    raise exceptions.NotAuthenticated()
+
+
+class AsyncReadView(ABC, View):
+    sync_view = None # the DRF view whose queryset, filters and serializer this one reuses
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            request.user = await aauthenticate(request)
+            if not request.user.is_active:
+                raise exceptions.AuthenticationFailed('User is inactive')
+
+            drf_request = Request(request)
+            drf_request.user = request.user # already authenticated above, skips DRF's own (sync) authentication
+            view = self.sync_view()
+            view.setup(drf_request, *args, **kwargs)
+            view.format_kwarg = None
+        except exceptions.APIException as exc:
+            return render_exception(exc)
+
+        # same replica choice as ReplicaReadMixin, the context var follows the async ORM into its worker threads
+        token = use_read_alias(await aread_alias_for(request.user)) if settings.REPLICA_DATABASES else None
+        try:
+            return await self.respond(request, view)
+        except exceptions.APIException as exc:
+            return render_exception(exc)
+        finally:
+            if token is not None:
+                reset_read_alias(token)
+
+    @abstractmethod
+    async def respond(self, request, view):
+        """The response for the authenticated request; `view` is the sync view, set up for it."""
+
+    def not_modified(self, etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        response['ETag'] = etag
+        return response
+
+    def with_etag(self, response, etag):
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class AsyncRecipeListView(AsyncReadView): # uploaded and bookmarked recipes
+    async def respond(self, request, view):
+        etag = await aget_list_etag(request)
+        if etag_matches(request, etag):
+            return self.not_modified(etag)
+
+        page = await self.get_page(view)
+        if view.etag_needs_primary and reading_from_replica(): # same rule as ConditionalMixin
+            return render(page)
+        return self.with_etag(render(page), etag)
+
+    async def get_page(self, view, bookmarked_ids=None):
+        queryset = view.filter_queryset(view.get_queryset())
+        paginator = view.paginator
+        rows = await paginator.apaginate_queryset(queryset, view.request, view)
+        if bookmarked_ids is None:
+            bookmarked_ids = await aget_bookmarked_ids(view.request.user)
+
+        context = {'request': view.request, 'view': view, 'bookmarked_ids': bookmarked_ids}
+        data = RecipeCatalogRowSerializer(rows, many=True, context=context).data
+        return paginator.get_paginated_response(data).data
+
+
+class AsyncUserRecipesView(AsyncRecipeListView):
+    sync_view = UserRecipesView
+
+
+class AsyncBookmarkedRecipesView(AsyncRecipeListView):
+    sync_view = BookmarkedRecipesView
+
+
+class AsyncRecipeCatalogView(AsyncRecipeListView): # RecipeCatalogView.list, with the shared page cache
+    sync_view = RecipeCatalogView
+
+    async def get_page(self, view, bookmarked_ids=None):
+        request = view.request
+        paginator = view.paginator
+        params = {
+            'cursor': request.query_params.get(paginator.cursor_query_param),
+            'page_size': paginator.get_page_size(request),
+            'filters': get_facet_filters(request.query_params),
+            'time': get_time_filters(request.query_params),
+            'ordering': view.keyset_ordering,
+            'fields': request.query_params.get('fields'),
+            'omit': request.query_params.get('omit'),
+        }
+
+        async def build_page():
+            page = await super(AsyncRecipeCatalogView, self).get_page(view, bookmarked_ids=frozenset())
+            return {
+                'rows': page['results'],
+                'next': paginator.get_next_cursor(),
+                'previous': paginator.get_previous_cursor(),
+            }
+
+        page = await aget_catalog_page(params, build_page)
+        user_bookmarks = {str(recipe_id) for recipe_id in await aget_bookmarked_ids(request.user)}
+        results = [
+            {**row, 'is_bookmarked': row['recipe_id'] in user_bookmarks} if 'is_bookmarked' in row else row
+            for row in page['rows']
+        ]
+        return paginator.get_cursor_response(request, results, page['next'], page['previous']).data
+
+
+class AsyncRecipeViewView(AsyncReadView):
+    sync_view = RecipeViewView
+
+    async def respond(self, request, view):
+        recipe_id = view.kwargs[view.lookup_field]
+        version = await Recipes.objects.filter(recipe_id=recipe_id).values_list('version', flat=True).afirst()
+        if version is None:
+            raise exceptions.NotFound('No Recipes matches the given query.')
+
+        etag = detail_etag(request, version, await aget_bookmarks_version(request.user.pk))
+        if etag_matches(request, etag):
+            return self.not_modified(etag)
+
+        try:
+            recipe = await view.filter_queryset(view.get_queryset()).aget(recipe_id=recipe_id)
+        except Recipes.DoesNotExist:
+            raise exceptions.NotFound('No Recipes matches the given query.')
+
+        context = {'request': view.request, 'view': view, 'bookmarked_ids': await aget_bookmarked_ids(request.user)}
+        serializer = RecipeViewSerializer(context=context)
+        if any(name in serializer.fields for name in ('your_review', 'reviews', 'reviews_next')):
+            # the same single query RecipeViewSerializer.get_review_page runs in the sync view
+            reviews = RecipeViewSerializer.review_page_queryset(recipe_id, request.user.pk)
+            context['review_page'] = RecipeViewSerializer.split_review_page([review async for review in reviews])
+
+        serializer.instance = recipe
+        return self.with_etag(render(serializer.data), etag)
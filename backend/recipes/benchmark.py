@@ -0,0 +1,225 @@
+"""
+Synthetic dataset and endpoint table for `manage.py benchmark_api`.
+
+Every named URL in recipes/urls.py, reviews/urls.py and users/urls.py needs an entry in ENDPOINTS with a
+query budget; the command refuses to run when one is missing, so new endpoints get a budget from day one.
+Budgets are the most SQL queries a single request may run (a cold cache included) and must not grow with
+the page size, which is what catches N+1 regressions.
+"""
+import base64
+import datetime
+import random
+import tempfile
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from recipes.models import Recipes
+from reviews.aggregates import rebuild_rating_aggregates
+from reviews.models import Reviews
+from users.counters import rebuild_user_counters
+from users.models import Users, Bookmarks
+
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PASSWORD = 'bench-password-1'
+CUISINES = ['Indian', 'Italian', 'Mexican', 'Thai', 'Chinese', 'French']
+COURSES = ['Main', 'Dessert', 'Snack', 'Breakfast']
+DIETS = ['Vegetarian', 'Vegan', 'High Protein', None]
+BENCH_IMAGE = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==') # 1x1 PNG
+WORDS = ['paneer', 'curry', 'spicy', 'lentil', 'tomato', 'garlic', 'cake', 'chocolate', 'rice', 'noodle', 'grilled', 'masala']
+
+
+@dataclass
+class Dataset:
+    user: Users # the account the requests are made as
+    own_recipe: Recipes
+    unreviewed_recipe: Recipes # one the user hasn't reviewed or bookmarked yet
+    bookmarked_recipe: Recipes
+    reviewed_recipe: Recipes
+    own_review: Reviews
+    popular_recipe: Recipes # the user's, bookmarked and reviewed by every other account
+    bookmarked_recipes: list # all of the user's bookmarks
+    sizes: dict = field(default_factory=dict)
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    # a throwaway test database (test_<NAME>) on the configured engine, so benchmarks run on postgres or sqlite
+    # without touching real data; uploaded images go to a temporary directory
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False, keepdb=keepdb)
+    try:
+        with tempfile.TemporaryDirectory() as media_root:
+            images = {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media_root}}
+            with override_settings(STORAGES={**settings.STORAGES, 'images': images}):
+                yield
+    finally:
+        teardown_databases(old_config, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def seed_dataset(recipes=2000, users=50, reviews_per_recipe=5, bookmarks_per_user=20, seed=0):
+    """Fills the (test) database with users, recipes, reviews and bookmarks using bulk inserts."""
+    rng = random.Random(seed)
+    password = make_password(BENCH_PASSWORD) # hashed once, every synthetic user shares it
+
+    accounts = [Users(email=BENCH_EMAIL, username='bench', password=password)]
+    accounts += [Users(email=f'user{i}@example.com', username=f'user{i}', password=password) for i in range(1, max(users, 2))]
+    Users.objects.bulk_create(accounts, batch_size=1000)
+
+    rows = []
+    for i in range(recipes):
+        recipe = Recipes(
+            title=f"{' '.join(rng.sample(WORDS, 3)).title()} {i}",
+            description=' '.join(rng.choices(WORDS, k=12)),
+            ingredients=[{'item': word, 'quantity': '1 cup'} for word in rng.sample(WORDS, 6)],
+            instructions=[f'Step {step}' for step in range(1, 6)],
+            cuisine=rng.choice(CUISINES),
+            course=rng.choice(COURSES),
+            diet=rng.choice(DIETS),
+            prep_time=datetime.time(0, rng.randrange(5, 60)),
+            cook_time=datetime.time(rng.randrange(0, 2), rng.randrange(0, 60)),
+            user=accounts[i % len(accounts)],
+            image=f'https://example.com/images/{i}.jpg',
+        )
+        recipe.set_derived_fields()
+        rows.append(recipe)
+    Recipes.objects.bulk_create(rows, batch_size=1000)
+
+    # upload_date is auto_now_add, so it's spread over the past year afterwards (none today, the upload limit stays free)
+    today = datetime.date.today()
+    for days in range(1, 366):
+        pks = [recipe.pk for recipe in rows[days - 1::365]]
+        if not pks:
+            break
+        Recipes.objects.filter(pk__in=pks).update(upload_date=today - datetime.timedelta(days=days))
+
+    # deleting it cascades to a bookmark and a review per account, which is what shows per-row work in the delete
+    popular = rows[len(accounts)] if len(rows) > len(accounts) else rows[0]
+
+    reviews = []
+    for recipe in rows:
+        reviewers = accounts[1:] if recipe is popular else rng.sample(accounts[1:], min(reviews_per_recipe, len(accounts) - 1))
+        for reviewer in reviewers:
+            reviews.append(Reviews(user=reviewer, recipe=recipe, rating=rng.randint(1, 5), comment='Tasty'))
+    bench = accounts[0]
+    reviewed = rows[1]
+    own_review = Reviews(user=bench, recipe=reviewed, rating=4, comment='Pretty good')
+    reviews.append(own_review)
+    Reviews.objects.bulk_create(reviews, batch_size=1000)
+    rebuild_rating_aggregates()
+
+    bookmarks = []
+    others = [recipe for recipe in rows[3:] if recipe is not popular]
+    for account in accounts:
+        for recipe in rng.sample(others, min(bookmarks_per_user, len(others))):
+            bookmarks.append(Bookmarks(user=account, recipe=recipe))
+        if account is not accounts[0]:
+            bookmarks.append(Bookmarks(user=account, recipe=popular))
+    Bookmarks.objects.bulk_create(bookmarks, batch_size=1000)
+    rebuild_user_counters()
+    bookmarked = next(bookmark.recipe for bookmark in bookmarks if bookmark.user_id == bench.pk)
+
+    return Dataset(
+        user=bench,
+        own_recipe=rows[0],
+        unreviewed_recipe=rows[2],
+        bookmarked_recipe=bookmarked,
+        reviewed_recipe=reviewed,
+        own_review=own_review,
+        popular_recipe=popular,
+        bookmarked_recipes=[bookmark.recipe for bookmark in bookmarks if bookmark.user_id == bench.pk],
+        sizes={
+            'users': len(accounts),
+            'recipes': len(rows),
+            'reviews': len(reviews),
+            'bookmarks': len(bookmarks),
+        },
+    )
+
+
+@dataclass
+class Endpoint:
+    name: str # URL name
+    method: str
+    budget: int # max SQL queries per request
+    path: Callable # (dataset, tokens) -> path
+    data: Optional[Callable] = None # (dataset, tokens) -> request body
+    authenticated: bool = True
+    format: str = 'json'
+    variant: str = '' # tells apart several entries for one URL name
+
+
+def recipe_payload(dataset, tokens):
+    return {
+        'title': f'Benchmark recipe {uuid.uuid4()}',
+        'description': 'Quick weeknight curry',
+        'ingredients': [{'item': 'paneer', 'quantity': '200 g'}],
+        'instructions': ['Cook it'],
+        'cuisine': 'Indian',
+        'course': 'Main',
+        'prep_time': '00:10:00',
+        'cook_time': '00:20:00',
+        'image': 'https://example.com/images/new.jpg',
+    }
+
+
+ENDPOINTS = [
+    # recipes/urls.py
+    Endpoint('catalog', 'GET', 8, lambda d, t: '/api/recipes/catalog/'),
+    Endpoint('uploaded-recipes', 'GET', 8, lambda d, t: '/api/recipes/uploaded/'),
+    Endpoint('bookmarked-recipes', 'GET', 8, lambda d, t: '/api/recipes/bookmarks/'),
+    Endpoint('search-recipes', 'GET', 8, lambda d, t: '/api/recipes/search/?q=paneer curry'),
+    Endpoint('recipe-facets', 'GET', 8, lambda d, t: '/api/recipes/facets/'),
+    Endpoint('recipe-batch', 'GET', 8, lambda d, t: f'/api/recipes/batch/?ids={d.own_recipe.pk},{d.reviewed_recipe.pk},{d.bookmarked_recipe.pk}'),
+    Endpoint('view-recipe', 'GET', 10, lambda d, t: f'/api/recipes/view/{d.reviewed_recipe.pk}/'),
+    Endpoint('upload-recipe', 'POST', 10, lambda d, t: '/api/recipes/upload/', recipe_payload),
+    Endpoint('edit-recipe', 'PUT', 10, lambda d, t: f'/api/recipes/edit/{d.own_recipe.pk}/', recipe_payload),
+    Endpoint('delete-recipe', 'DELETE', 10, lambda d, t: f'/api/recipes/delete/{d.own_recipe.pk}/'),
+    Endpoint('delete-recipe', 'DELETE', 10, lambda d, t: f'/api/recipes/delete/{d.popular_recipe.pk}/', variant='cascade'),
+    Endpoint('upload-image', 'POST', 8, lambda d, t: '/api/recipes/images/upload/',
+             lambda d, t: {'file': SimpleUploadedFile('bench.png', BENCH_IMAGE, content_type='image/png')}, format='multipart'),
+    Endpoint('async-catalog', 'GET', 8, lambda d, t: '/api/recipes/async/catalog/'),
+    Endpoint('async-uploaded-recipes', 'GET', 8, lambda d, t: '/api/recipes/async/uploaded/'),
+    Endpoint('async-bookmarked-recipes', 'GET', 8, lambda d, t: '/api/recipes/async/bookmarks/'),
+    Endpoint('async-view-recipe', 'GET', 10, lambda d, t: f'/api/recipes/async/view/{d.reviewed_recipe.pk}/'),
+
+    # reviews/urls.py
+    Endpoint('review-upload', 'POST', 10, lambda d, t: '/api/reviews/upload/',
+             lambda d, t: {'recipe': str(d.unreviewed_recipe.pk), 'rating': 5, 'comment': 'Lovely'}),
+    Endpoint('review-edit', 'PUT', 10, lambda d, t: f'/api/reviews/edit/{d.own_review.pk}/',
+             lambda d, t: {'rating': 2, 'comment': 'Changed my mind'}),
+    Endpoint('review-delete', 'DELETE', 10, lambda d, t: f'/api/reviews/delete/{d.own_review.pk}/'),
+    Endpoint('recipe-reviews', 'GET', 6, lambda d, t: f'/api/reviews/recipe/{d.reviewed_recipe.pk}/'),
+    Endpoint('rating-histograms', 'GET', 6, lambda d, t: f'/api/reviews/histograms/?ids={d.own_recipe.pk},{d.reviewed_recipe.pk}'),
+
+    # users/urls.py
+    Endpoint('register', 'POST', 6, lambda d, t: '/api/acc/register/',
+             lambda d, t: {'username': 'newcomer', 'email': 'newcomer@example.com', 'password': BENCH_PASSWORD},
+             authenticated=False),
+    Endpoint('login', 'POST', 8, lambda d, t: '/api/acc/login/',
+             lambda d, t: {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}, authenticated=False),
+    Endpoint('update-user', 'PATCH', 10, lambda d, t: '/api/acc/update/',
+             lambda d, t: {'old_password': BENCH_PASSWORD, 'username': 'bench-renamed'}),
+    Endpoint('async-login', 'POST', 8, lambda d, t: '/api/acc/async/login/',
+             lambda d, t: {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}, authenticated=False),
+    Endpoint('async-update-user', 'PATCH', 10, lambda d, t: '/api/acc/async/update/',
+             lambda d, t: {'old_password': BENCH_PASSWORD, 'username': 'bench-renamed'}),
+    Endpoint('user-stats', 'GET', 4, lambda d, t: '/api/acc/stats/'),
+    Endpoint('logout', 'POST', 10, lambda d, t: '/api/acc/logout/', lambda d, t: {'refresh': t['refresh']}),
+    Endpoint('token_refresh', 'POST', 14, lambda d, t: '/api/acc/token/refresh/', lambda d, t: {'refresh': t['refresh']},
+             authenticated=False),
+    Endpoint('create-bookmark', 'POST', 8, lambda d, t: '/api/acc/bookmark/', lambda d, t: {'recipe_id': str(d.unreviewed_recipe.pk)}),
+    Endpoint('batch-bookmarks', 'POST', 8, lambda d, t: '/api/acc/bookmarks/batch/',
+             lambda d, t: {'add': [str(d.unreviewed_recipe.pk), str(d.own_recipe.pk)], 'remove': [str(d.bookmarked_recipe.pk)]}),
+    Endpoint('batch-bookmarks', 'POST', 8, lambda d, t: '/api/acc/bookmarks/batch/',
+             lambda d, t: {'remove': [str(recipe.pk) for recipe in d.bookmarked_recipes]}, variant='remove all'),
+    Endpoint('delete-bookmark', 'DELETE', 8, lambda d, t: f'/api/acc/bookmark/{d.bookmarked_recipe.pk}/delete/'),
+]
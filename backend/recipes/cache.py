@@ -0,0 +1,83 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from spice_bazaar.db_router import primary_reads
+
+FACET_COUNTS_TIMEOUT = 60 * 60
+CATALOG_PAGE_TIMEOUT = 10 * 60
+
+
+def get_generation(name):
+    # generations are random tokens rather than counters, so an evicted key can never bring back an old cache entry
+    key = f'generation:{name}'
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(name):
+    key = f'generation:{name}'
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, uuid.uuid4().hex, None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def bump_generation(name):
+    cache.set(f'generation:{name}', uuid.uuid4().hex, None)
+
+
+def invalidate_recipe_listings():
+    # called on recipe upload, edit and delete; waits for the commit so a concurrent read can't re-cache old rows
+    transaction.on_commit(lambda: bump_generation('recipes'))
+
+
+def invalidate_review_listings():
+    # ratings shown in the listings changed; facet counts don't depend on reviews so they keep their generation
+    transaction.on_commit(lambda: bump_generation('reviews'))
+
+
+def make_key(prefix, generation, params):
+    digest = hashlib.md5(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    return f'{prefix}:{generation}:{digest}'
+
+
+def get_facet_counts(filters, compute):
+    key = make_key('facets', get_generation('recipes'), filters)
+    counts = cache.get(key)
+    if counts is None:
+        with primary_reads(): # stored under the current generation, so never from a replica that may be behind it
+            counts = compute(filters)
+        cache.set(key, counts, FACET_COUNTS_TIMEOUT)
+    return counts
+
+
+def get_catalog_page(params, compute):
+    # the user independent part of a catalog page; any recipe or review write moves one of the generations
+    generation = f"{get_generation('recipes')}.{get_generation('reviews')}"
+    key = make_key('catalog', generation, params)
+    page = cache.get(key)
+    if page is None:
+        with primary_reads():
+            page = compute()
+        cache.set(key, page, CATALOG_PAGE_TIMEOUT)
+    return page
+
+
+async def aget_catalog_page(params, compute):
+    # get_catalog_page for the async views, `compute` is a coroutine function
+    generation = f"{await aget_generation('recipes')}.{await aget_generation('reviews')}"
+    key = make_key('catalog', generation, params)
+    page = await cache.aget(key)
+    if page is None:
+        with primary_reads():
+            page = await compute()
+        await cache.aset(key, page, CATALOG_PAGE_TIMEOUT)
+    return page
@@ -0,0 +1,98 @@
+"""
+Parsing for `manage.py import_recipes`: CSV chunks in, plain dicts of Recipes fields out.
+
+The command's parser processes import this module on their own, and with the spawn start method (macOS, Windows)
+they don't run django.setup(), so it must not import Django or anything that loads models.
+"""
+import ast
+import csv
+import json
+from itertools import islice
+
+
+def parse_minutes(value):
+    # CSV times are minutes, the model stores a TimeField so anything a day or longer is capped at 23:59
+    try:
+        total_minutes = int(float(value))
+    except (ValueError, TypeError):
+        return "00:30:00"  # Default to 30 minutes
+
+    if total_minutes >= 24 * 60:
+        hours, minutes = 23, 59
+    else:
+        hours, minutes = divmod(total_minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:00"
+
+
+def parse_list(value):
+    try:
+        # First try standard JSON parsing
+        return json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        try:
+            # If that fails, try parsing it as a Python literal
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            return False
+
+
+def parse_row(row):
+    # runs in the worker processes, so it only touches plain python values
+    ingredients = parse_list(row.get('parsed_ingredients', '[]'))
+    instructions = parse_list(row.get('parsed_instructions', '[]'))
+    if not ingredients or not instructions:
+        return None
+
+    return {
+        'title': row.get('name', '').strip() or 'Untitled Recipe',
+        'description': row.get('description', ''),
+        'ingredients': ingredients,
+        'instructions': instructions,
+        'cuisine': row.get('cuisine', ''),
+        'course': row.get('course', ''),
+        'diet': row.get('diet', ''),
+        'prep_time': parse_minutes(row.get('prep_time (in mins)', 0)),
+        'cook_time': parse_minutes(row.get('cook_time (in mins)', 0)),
+        'image': row.get('image_url', ''),
+    }
+
+
+def parse_chunk(rows):
+    return [parse_row(row) for row in rows]
+
+
+def read_chunks(file, batch_size, start_row=0, resume_offset=None):
+    """
+    Streams a CSV opened in binary mode as (rows, rows read so far, byte offset) chunks.
+    The offset is where the next unread record starts, which is what the checkpoint stores.
+    """
+    offset = 0
+
+    def lines():
+        nonlocal offset
+        # csv.reader pulls one physical line at a time, so after each record `offset` is exactly its end
+        for line in iter(file.readline, b''):
+            offset += len(line)
+            yield line.decode('utf-8')
+
+    reader = csv.reader(lines())
+    fieldnames = next(reader, None)
+    if fieldnames is None:
+        return
+
+    row_number = start_row
+    if resume_offset is not None:
+        file.seek(resume_offset)
+        offset = resume_offset
+        reader = csv.reader(lines())
+    else:
+        # Skip rows until we reach the start row
+        for _ in islice(reader, start_row):
+            pass
+
+    while True:
+        records = list(islice(reader, batch_size))
+        if not records:
+            return
+        row_number += len(records)
+        yield [dict(zip(fieldnames, values)) for values in records if values], row_number, offset
@@ -0,0 +1,92 @@
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from spice_bazaar.db_router import reading_from_replica
+from users.cache import aget_bookmarks_version, get_bookmarks_version
+from .cache import aget_generation, get_generation
+from .models import Recipes
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def etag_matches(request, etag):
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return etag in etags or '*' in etags
+
+
+def not_modified(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
+
+
+class ConditionalMixin:
+    """
+    Answers If-None-Match with a 304 before the view touches the serializer.
+    Views provide get_etag(); returning None skips the check.
+
+    A tag built from cache generations is only handed out with a body read on the primary: a replica that is
+    behind the generation would otherwise pin its stale body to the new tag. Tags handed out earlier are still
+    honoured on replica reads.
+    """
+    etag_needs_primary = False
+
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag(request, *args, **kwargs)
+        if etag is not None and etag_matches(request, etag):
+            return not_modified(etag)
+
+        response = super().get(request, *args, **kwargs)
+        if self.etag_needs_primary and reading_from_replica():
+            etag = None
+        if etag is not None and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+def list_etag(request, recipes_generation, reviews_generation, bookmarks_version):
+    # a listing only changes when some recipe or review is written or the user's bookmarks change,
+    # so the tag is built from cache generations and costs no database query
+    return make_etag('list', request.get_full_path(), request.user.pk, recipes_generation, reviews_generation, bookmarks_version)
+
+
+def detail_etag(request, version, bookmarks_version):
+    # request.get_full_path() carries the recipe id and ?fields= / ?omit=, which change the body
+    return make_etag('detail', request.get_full_path(), version, request.user.pk, bookmarks_version)
+
+
+class RecipeListETagMixin(ConditionalMixin):
+    etag_needs_primary = True # views whose rows come from a cache filled on the primary turn this off
+    def get_etag(self, request, *args, **kwargs):
+        return list_etag(request, get_generation('recipes'), get_generation('reviews'), get_bookmarks_version(request.user.pk))
+
+
+class RecipeDetailETagMixin(ConditionalMixin):
+    # one primary key lookup for the recipe version, the bookmark overlay version comes from the cache;
+    # the version is read from the same database as the body, so the two always agree
+    def get_etag(self, request, *args, **kwargs):
+        version = Recipes.objects.filter(
+            recipe_id=kwargs[self.lookup_field]
+        ).values_list('version', flat=True).first()
+        if version is None:
+            return None # let the normal lookup produce the 404
+
+        return detail_etag(request, version, get_bookmarks_version(request.user.pk))
+
+
+async def aget_list_etag(request):
+    return list_etag(
+        request,
+        await aget_generation('recipes'),
+        await aget_generation('reviews'),
+        await aget_bookmarks_version(request.user.pk),
+    )
@@ -0,0 +1,78 @@
+import uuid
+
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+
+from .models import Recipes
+
+FACET_FIELDS = ('cuisine', 'course', 'diet')
+TIME_FILTERS = {'min_time': 'total_time_minutes__gte', 'max_time': 'total_time_minutes__lte'}
+
+
+def get_facet_filters(query_params):
+    # ?cuisine=Indian,Italian&diet=Vegetarian -> {'cuisine': ['Indian', 'Italian'], 'diet': ['Vegetarian']}
+    filters = {}
+    for field in FACET_FIELDS:
+        values = {value.strip() for raw in query_params.getlist(field) for value in raw.split(',')}
+        values.discard('')
+        if values:
+            filters[field] = sorted(values)
+    return filters
+
+
+def apply_facet_filters(queryset, filters, exclude=None):
+    # values inside one facet are OR'ed, different facets are AND'ed
+    for field, values in filters.items():
+        if field != exclude:
+            queryset = queryset.filter(**{f'{field}__in': values})
+    return queryset
+
+
+def count_facets(filters):
+    # each facet is counted under the other facets' filters, so picking a cuisine still shows the other cuisines
+    counts = {}
+    for field in FACET_FIELDS:
+        queryset = apply_facet_filters(Recipes.objects.all(), filters, exclude=field)
+        rows = (
+            queryset.exclude(**{f'{field}__isnull': True})
+            .exclude(**{field: ''})
+            .values(field)
+            .annotate(count=Count('pk'))
+            .order_by('-count', field)
+        )
+        counts[field] = [{'value': row[field], 'count': row['count']} for row in rows]
+    return counts
+
+
+def get_time_filters(query_params):
+    # ?min_time=10&max_time=30 -> {'min_time': 10, 'max_time': 30}, in total (prep + cook) minutes
+    filters = {}
+    for param in TIME_FILTERS:
+        raw = query_params.get(param, '').strip()
+        if not raw:
+            continue
+        try:
+            filters[param] = int(raw)
+        except ValueError:
+            raise ValidationError({param: "Must be a whole number of minutes."})
+        if filters[param] < 0:
+            raise ValidationError({param: "Must be a whole number of minutes."})
+    return filters
+
+
+def apply_time_filters(queryset, filters):
+    return queryset.filter(**{TIME_FILTERS[param]: minutes for param, minutes in filters.items()})
+
+
+def get_recipe_ids(query_params, max_ids):
+    # ?ids=<uuid>,<uuid>,... in the order given, duplicates dropped
+    raw_ids = [value.strip() for value in query_params.get('ids', '').split(',') if value.strip()]
+    if not raw_ids:
+        raise ValidationError({"ids": "This parameter is required."})
+    try:
+        recipe_ids = list(dict.fromkeys(uuid.UUID(value) for value in raw_ids))
+    except ValueError:
+        raise ValidationError({"ids": "Must be a comma separated list of recipe UUIDs."})
+    if len(recipe_ids) > max_ids:
+        raise ValidationError({"ids": f"At most {max_ids} ids per request."})
+    return recipe_ids
@@ -0,0 +1,194 @@
+"""
+Resized copies of recipe images, so a phone downloads a 320px WebP instead of the full-size original.
+
+store_image() keeps an upload (or a copy of a remote image, see `manage.py process_images --import-remote`) in the
+'images' storage as an ImageAsset. After the commit a background thread writes its IMAGE_VARIANT_FORMATS x
+IMAGE_VARIANT_WIDTHS variants and copies their names onto the recipes using it (Recipes.image_variants), which the
+catalog and detail serializers turn into URLs. Every file name includes the content digest (and the encoding
+quality), so a URL always means the same bytes and can be cached forever.
+
+Pillow is optional: without it uploads are still stored and served as they are, assets stay pending, and
+`manage.py process_images` makes their variants once Pillow is installed.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import connections, transaction
+from django.db.models import F
+
+from .cache import invalidate_recipe_listings
+from .models import ImageAsset, Recipes
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+logger = logging.getLogger('spice_bazaar.images')
+
+# leading bytes of the formats we accept -> file extension (WebP is checked separately, its marker is at offset 8)
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+SAVE_OPTIONS = {'webp': {'method': 4}, 'jpeg': {'optimize': True, 'progressive': True}}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_storage():
+    return storages['images']
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_PROCESSING_WORKERS, thread_name_prefix='image-variants')
+    return _executor
+
+
+def sniff_extension(data):
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return None
+
+
+def store_image(data, url=None):
+    """
+    Saves the original and returns its ImageAsset, the existing one when these bytes (or this remote url) were
+    stored before. None when the data isn't a JPEG, PNG, GIF or WebP image.
+    """
+    extension = sniff_extension(data)
+    if extension is None:
+        return None
+
+    digest = hashlib.sha256(data).hexdigest()
+    storage = get_storage()
+    name = f'images/{digest[:2]}/{digest}/original.{extension}'
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(data))
+
+    asset, _ = ImageAsset.objects.get_or_create(url=url or storage.url(name), defaults={'digest': digest, 'original': name})
+    return asset
+
+
+def schedule_variants(asset):
+    # after the commit, so the worker thread can see the asset
+    if Image is not None and asset.status == ImageAsset.PENDING:
+        asset_id = asset.pk
+        transaction.on_commit(lambda: get_executor().submit(make_variants_in_background, asset_id))
+
+
+def make_variants_in_background(asset_id):
+    try:
+        asset = ImageAsset.objects.filter(pk=asset_id, status=ImageAsset.PENDING).first()
+        if asset is not None:
+            make_variants(asset)
+    except Exception:
+        logger.exception('Making variants of image %s failed', asset_id) # left pending for `manage.py process_images`
+    finally:
+        connections.close_all() # this thread's connections, pool threads outlive requests
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def flatten(image): # JPEG has no alpha channel, transparent areas become white rather than black
+    if not has_alpha(image):
+        return image.convert('RGB')
+    rgba = image.convert('RGBA')
+    background = Image.new('RGB', rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
+
+
+def variant_name(digest, width, image_format):
+    quality = settings.IMAGE_QUALITY[image_format]
+    return f'images/{digest[:2]}/{digest}/{width}w-q{quality}.{EXTENSIONS[image_format]}'
+
+
+def make_variants(asset):
+    """Writes the asset's missing variants and publishes them to its recipes; undecodable images are marked failed."""
+    storage = get_storage()
+    try:
+        with storage.open(asset.original) as file:
+            image = Image.open(file)
+            if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+                raise ValueError(f'{image.width}x{image.height} is more than IMAGE_MAX_PIXELS')
+            image.load()
+        image = ImageOps.exif_transpose(image) # phones store the rotation in EXIF
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        ImageAsset.objects.filter(pk=asset.pk).update(status=ImageAsset.FAILED, error=str(exc)[:1000])
+        return ImageAsset.FAILED
+
+    variants = {}
+    widths = sorted({min(width, image.width) for width in settings.IMAGE_VARIANT_WIDTHS}) # never upscaled
+    for image_format in settings.IMAGE_VARIANT_FORMATS:
+        source = flatten(image) if image_format == 'jpeg' else image.convert('RGBA' if has_alpha(image) else 'RGB')
+        for width in widths:
+            name = variant_name(asset.digest, width, image_format)
+            if not storage.exists(name):
+                height = max(round(image.height * width / image.width), 1)
+                resized = source if width == image.width else source.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+                buffer = io.BytesIO()
+                resized.save(buffer, format=image_format.upper(), quality=settings.IMAGE_QUALITY[image_format], **SAVE_OPTIONS[image_format])
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            variants.setdefault(image_format, {})[str(width)] = name
+
+    with transaction.atomic():
+        ImageAsset.objects.filter(pk=asset.pk).update(
+            status=ImageAsset.READY, width=image.width, height=image.height, variants=variants, error='',
+        )
+        # recipes saved with this image but not committed yet are missed here, link_variants_on_commit() covers them
+        Recipes.objects.filter(image_asset=asset).update(image_variants=variants, version=F('version') + 1)
+    invalidate_recipe_listings()
+    return ImageAsset.READY
+
+
+def image_fields(url):
+    # Recipes.image_asset and image_variants for a recipe whose image is `url`
+    asset = ImageAsset.objects.filter(url=url).first() if url else None
+    return {
+        'image_asset': asset,
+        'image_variants': asset.variants if asset is not None and asset.status == ImageAsset.READY else {},
+    }
+
+
+def link_variants_on_commit(recipe):
+    # for a recipe saved with an image whose variants weren't ready: if make_variants() publishes them before this
+    # transaction commits, its UPDATE can't see the recipe, so the asset is read again once the recipe is committed
+    if recipe.image_asset_id is not None and not recipe.image_variants:
+        asset_id = recipe.image_asset_id
+        transaction.on_commit(lambda: link_variants(asset_id))
+
+
+def link_variants(asset_id):
+    # copies a ready asset's variants onto its recipes that still have none, returns how many were updated
+    asset = ImageAsset.objects.filter(pk=asset_id, status=ImageAsset.READY).first()
+    if asset is None:
+        return 0 # still pending (make_variants() will find the recipes) or failed
+    linked = Recipes.objects.filter(image_asset=asset, image_variants={}).update(image_variants=asset.variants, version=F('version') + 1)
+    if linked:
+        invalidate_recipe_listings()
+    return linked
+
+
+def variant_urls(variants):
+    # {"webp": {"320": url, ...}, "jpeg": {...}} from names stored in image_variants / ImageAsset.variants
+    storage = get_storage()
+    return {image_format: {width: storage.url(name) for width, name in names.items()} for image_format, names in variants.items()}
@@ -0,0 +1,147 @@
+import json
+import math
+import time
+import importlib
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from recipes.benchmark import ENDPOINTS, BENCH_EMAIL, BENCH_PASSWORD, benchmark_database, seed_dataset
+
+URLCONFS = ('recipes.urls', 'reviews.urls', 'users.urls')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway test database and measure latency, rows/sec and SQL queries for every API endpoint against its query budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=2000, help='Synthetic recipes to seed')
+        parser.add_argument('--users', type=int, default=50, help='Synthetic users to seed')
+        parser.add_argument('--reviews-per-recipe', type=int, default=5, help='Reviews seeded for each recipe')
+        parser.add_argument('--bookmarks-per-user', type=int, default=20, help='Bookmarks seeded for each user')
+        parser.add_argument('--iterations', type=int, default=20, help='Requests per endpoint')
+        parser.add_argument('--endpoint', action='append', help='Only run these URL names (repeatable)')
+        parser.add_argument('--output', type=str, help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs')
+
+    def handle(self, *args, **options):
+        self.check_coverage()
+        endpoints = [endpoint for endpoint in ENDPOINTS if not options['endpoint'] or endpoint.name in options['endpoint']]
+
+        with benchmark_database(keepdb=options['keepdb']):
+            report = self.run_suite(endpoints, options)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if report['failures']:
+            raise CommandError('\n'.join(report['failures']))
+
+    def check_coverage(self):
+        # every named URL must have a budget, otherwise a new endpoint could slip in unmeasured
+        covered = {endpoint.name for endpoint in ENDPOINTS}
+        missing = [
+            pattern.name for urlconf in URLCONFS
+            for pattern in importlib.import_module(urlconf).urlpatterns
+            if pattern.name and pattern.name not in covered
+        ]
+        if missing:
+            raise CommandError(f"No benchmark entry for: {', '.join(missing)} (add them to ENDPOINTS in recipes/benchmark.py)")
+
+    def run_suite(self, endpoints, options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            dataset = seed_dataset(
+                recipes=options['recipes'],
+                users=options['users'],
+                reviews_per_recipe=options['reviews_per_recipe'],
+                bookmarks_per_user=options['bookmarks_per_user'],
+            )
+        self.stderr.write(f"Seeded {dataset.sizes} in {time.perf_counter() - started:.1f}s")
+
+        client = APIClient()
+        tokens = client.post('/api/acc/login/', {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}, format='json').json()
+
+        results, failures = [], []
+        for endpoint in endpoints:
+            result = self.measure(client, endpoint, dataset, tokens, options['iterations'])
+            results.append(result)
+            label = f'{endpoint.name} ({endpoint.variant})' if endpoint.variant else endpoint.name
+            self.stderr.write(
+                f"{endpoint.method:6} {label:30} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                f"queries {result['max_queries']}/{endpoint.budget}"
+            )
+            if result['errors']:
+                failures.append(f"{label}: unexpected status {result['errors'][0]}")
+            if result['max_queries'] > endpoint.budget:
+                failures.append(f"{label}: {result['max_queries']} queries, budget is {endpoint.budget}")
+
+        return {
+            'generated_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': dataset.sizes,
+            'iterations': options['iterations'],
+            'endpoints': results,
+            'failures': failures,
+        }
+
+    def measure(self, client, endpoint, dataset, tokens, iterations):
+        # the cache is cleared once per endpoint, so the first request is cold and the rest show the warm path
+        cache.clear()
+        timings, query_counts, rows, errors = [], [], 0, []
+
+        for _ in range(max(iterations, 1)):
+            if endpoint.authenticated:
+                client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+            else:
+                client.credentials()
+            path = endpoint.path(dataset, tokens)
+            data = endpoint.data(dataset, tokens) if endpoint.data else None
+
+            # every request runs in a transaction that is rolled back, so writes (and deletes) can repeat on the same data
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = getattr(client, endpoint.method.lower())(path, data, format=endpoint.format)
+                    elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+
+            timings.append(elapsed)
+            query_counts.append(len(queries))
+            if response.status_code >= 400:
+                errors.append(f'{response.status_code} {getattr(response, "data", "")}')
+            elif response.get('Content-Type', '').startswith('application/json'):
+                body = response.json()
+                if isinstance(body, dict) and isinstance(body.get('results'), list):
+                    rows += len(body['results'])
+                elif isinstance(body, list):
+                    rows += len(body)
+
+        client.credentials()
+        total = sum(timings)
+        return {
+            'name': endpoint.name,
+            'variant': endpoint.variant,
+            'method': endpoint.method,
+            'path': endpoint.path(dataset, tokens),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+            'mean_ms': round(total / len(timings) * 1000, 3),
+            'rows_per_sec': round(rows / total, 1) if total else 0.0,
+            'max_queries': max(query_counts),
+            'median_queries': percentile(query_counts, 0.5),
+            'budget': endpoint.budget,
+            'errors': errors,
+        }
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import AsyncClient
+from rest_framework.test import APIClient
+from recipes.benchmark import BENCH_EMAIL, BENCH_PASSWORD, benchmark_database, seed_dataset
+
+# (label, sync path, async path)
+PAIRS = [
+    ('catalog', lambda d: '/api/recipes/catalog/', lambda d: '/api/recipes/async/catalog/'),
+    ('uploaded', lambda d: '/api/recipes/uploaded/', lambda d: '/api/recipes/async/uploaded/'),
+    ('bookmarks', lambda d: '/api/recipes/bookmarks/', lambda d: '/api/recipes/async/bookmarks/'),
+    ('view', lambda d: f'/api/recipes/view/{d.reviewed_recipe.pk}/', lambda d: f'/api/recipes/async/view/{d.reviewed_recipe.pk}/'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/sec of the sync and async read endpoints under concurrent load, in one process through the ASGI handler'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=2000, help='Synthetic recipes to seed')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once')
+        parser.add_argument('--output', type=str, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stderr.write('Note: sqlite serializes connections, run against postgres for numbers that mean anything')
+
+        with benchmark_database():
+            with transaction.atomic():
+                dataset = seed_dataset(recipes=options['recipes'])
+            tokens = APIClient().post('/api/acc/login/', {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}, format='json').json()
+            results = asyncio.run(self.run_pairs(dataset, tokens, options))
+
+        for result in results:
+            self.stdout.write(
+                f"{result['endpoint']:10} sync {result['sync_rps']:8.1f} req/s   async {result['async_rps']:8.1f} req/s   "
+                f"({result['async_rps'] / result['sync_rps']:.2f}x)" + (f"   {result['errors']} errors" if result['errors'] else '')
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'database': connection.vendor, 'concurrency': options['concurrency'], 'results': results}, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    async def run_pairs(self, dataset, tokens, options):
+        client = AsyncClient(AUTHORIZATION=f"Bearer {tokens['access']}") # AsyncClient defaults are sent as request headers
+        results = []
+        for label, sync_path, async_path in PAIRS:
+            sync_rps, sync_errors = await self.load(client, sync_path(dataset), options)
+            async_rps, async_errors = await self.load(client, async_path(dataset), options)
+            results.append({
+                'endpoint': label,
+                'sync_rps': round(sync_rps, 1),
+                'async_rps': round(async_rps, 1),
+                'errors': sync_errors + async_errors,
+            })
+        return results
+
+    async def load(self, client, path, options):
+        semaphore = asyncio.Semaphore(max(options['concurrency'], 1))
+        errors = 0
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors += 1
+
+        await client.get(path) # warm the caches, both paths share them
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(options['requests'])))
+        return options['requests'] / (time.perf_counter() - started), errors
@@ -0,0 +1,56 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from recipes.models import Recipes
+from recipes.serializers import RecipeCatalogSerializer, RecipeCatalogRowSerializer
+from users.models import Bookmarks
+
+class Command(BaseCommand):
+    help = 'Compare RecipeCatalogSerializer with the values() fast path: checks the JSON is identical and reports rows/sec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Number of catalog rows serialized per run')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer, the best run is reported')
+        parser.add_argument('--user', type=str, help='Email of a user whose bookmarks fill is_bookmarked')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = max(options['repeat'], 1)
+
+        bookmarked_ids = frozenset()
+        if options['user']:
+            bookmarked_ids = frozenset(Bookmarks.objects.filter(user__email=options['user']).values_list('recipe_id', flat=True))
+
+        recipes = Recipes.objects.order_by('-upload_date', '-recipe_id')
+        context = {'bookmarked_ids': bookmarked_ids}
+        columns = RecipeCatalogRowSerializer.get_columns()
+
+        def model_path():
+            page = list(recipes.select_related('user')[:rows])
+            return RecipeCatalogSerializer(page, many=True, context=context).data
+
+        def fast_path():
+            page = list(recipes.values(*columns)[:rows])
+            return RecipeCatalogRowSerializer(page, many=True, context=context).data
+
+        # both timings include the query, that is what a request pays
+        model_json, model_time = self.run(model_path, repeat)
+        fast_json, fast_time = self.run(fast_path, repeat)
+
+        if model_json != fast_json:
+            raise CommandError('The fast path JSON differs from RecipeCatalogSerializer')
+
+        count = len(fast_path())
+        self.stdout.write(f'Serialized {count} rows, best of {repeat} runs, output identical ({len(fast_json)} bytes)')
+        self.stdout.write(f'RecipeCatalogSerializer:    {count / model_time:,.0f} rows/sec ({model_time * 1000:.1f} ms)')
+        self.stdout.write(f'RecipeCatalogRowSerializer: {count / fast_time:,.0f} rows/sec ({fast_time * 1000:.1f} ms)')
+        self.stdout.write(self.style.SUCCESS(f'Fast path is {model_time / fast_time:.1f}x faster'))
+
+    def run(self, serialize, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rendered = JSONRenderer().render(serialize())
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return rendered, best
@@ -1,13 +1,18 @@
 import uuid
-import csv
 import os
-from django.core.management.base import BaseCommand
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from django.db import transaction
 from users.models import Users
+from users.counters import adjust_counters
 from recipes.models import Recipes
+from recipes.cache import invalidate_recipe_listings
+from recipes.csv_import import parse_chunk, read_chunks # the parser processes import only that module
 import json
-import ast
+
 
 class Command(BaseCommand):
     help = 'Import recipes from CSV file'
@@ -15,151 +20,174 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('csv_file', type=str, help='Path to the CSV file')
         parser.add_argument('--start-row', type=int, default=0, help='Start importing from this row (0-indexed, excluding header)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows parsed and committed per batch')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Parser processes (1 parses in this process)')
+        parser.add_argument('--checkpoint', type=str, help='Checkpoint file (defaults to <csv_file>.checkpoint.json)')
+        parser.add_argument('--resume', action='store_true', help='Continue from the last committed batch in the checkpoint')
+        parser.add_argument('--progress', choices=['text', 'json'], default='text', help='Progress output format, json prints one object per line')
 
     def handle(self, *args, **options):
         csv_file_path = options['csv_file']
-        start_row = options['start_row']
-        
+        batch_size = max(options['batch_size'], 1)
+        workers = max(options['workers'], 1)
+        self.progress_format = options['progress']
+
         if not os.path.exists(csv_file_path):
-            self.stdout.write(self.style.ERROR(f'File not found: {csv_file_path}'))
-            return
-        
+            raise CommandError(f'File not found: {csv_file_path}')
+
+        checkpoint_path = options['checkpoint'] or f'{csv_file_path}.checkpoint.json'
+        state = {
+            'file': os.path.abspath(csv_file_path),
+            'size': os.path.getsize(csv_file_path),
+            'row': options['start_row'],
+            'offset': None,
+            'imported': 0,
+            'skipped': 0,
+            'complete': False,
+        }
+        if options['resume']:
+            state = self.load_checkpoint(checkpoint_path, state)
+
+        started = time.monotonic()
+        rows_at_start = state['row']
+
         try:
             with transaction.atomic():
-                # Create or get Anonymous user
-                anonymous_id = uuid.uuid4()
-                anonymous_user, created = Users.objects.get_or_create(
-                    username='Anonymous',
-                    defaults={
-                        'id': anonymous_id,
-                        'email': 'anonymous@example.com',
-                        'reg_date': timezone.now().date()
-                    }
-                )
-                
-                if created:
-                    # Set a default password (but hashed) using set_password
-                    anonymous_user.set_password('pbkdf2_sha256$260000$randomhashhere')
-                    anonymous_user.save()
-                    self.stdout.write(self.style.SUCCESS('Created Anonymous user'))
-                else:
-                    self.stdout.write(self.style.SUCCESS('Using existing Anonymous user'))
-                    anonymous_id = anonymous_user.id
-                
-                # Read and import recipes
-                recipes_imported = 0
-                recipes_skipped = 0
-                current_row = 0
-                
-                with open(csv_file_path, 'r', encoding='utf-8') as file:
-                    reader = csv.DictReader(file)
-                    
-                    for row in reader:
-                        # Skip rows until we reach the start row
-                        if current_row < start_row:
-                            current_row += 1
-                            continue
-                            
-                        current_row += 1
-                        
-                        # Check if recipe with same name already exists
-                        recipe_name = row.get('name', '').strip()
-                        if not recipe_name:
-                            recipe_name = 'Untitled Recipe'
-                            
-                        # Skip if recipe already exists
-                        if Recipes.objects.filter(title=recipe_name).exists():
-                            recipes_skipped += 1
-                            if recipes_skipped % 50 == 0:
-                                self.stdout.write(f"Skipped {recipes_skipped} existing or invalid recipes...")
-                            continue
-                            
-                        # Map CSV columns to database fields
-                        recipe_id = uuid.uuid4()
-                        
-                        # Extract time values and convert to proper format
-                        try:
-                            prep_time_minutes = int(float(row.get('prep_time (in mins)', 0)))
-                            
-                            # Handle special case where time would be 24:00:00
-                            if prep_time_minutes >= 24 * 60:
-                                hours = 23
-                                minutes = 59
-                            else:
-                                hours, minutes = divmod(prep_time_minutes, 60)
-                                
-                            prep_time = f"{hours:02d}:{minutes:02d}:00"
-                        except (ValueError, TypeError):
-                            prep_time = "00:30:00"  # Default to 30 minutes
-
-                        try:
-                            cook_time_minutes = int(float(row.get('cook_time (in mins)', 0)))
-                            
-                            # Handle special case where time would be 24:00:00
-                            if cook_time_minutes >= 24 * 60:
-                                hours = 23
-                                minutes = 59
-                            else:
-                                hours, minutes = divmod(cook_time_minutes, 60)
-                                
-                            cook_time = f"{hours:02d}:{minutes:02d}:00"
-                        except (ValueError, TypeError):
-                            cook_time = "00:30:00"  # Default to 30 minutes
-                        
-                        try:
-                            # First try standard JSON parsing
-                            ingredients_json = json.loads(row.get('parsed_ingredients', '[]'))
-                        except json.JSONDecodeError:
-                            try:
-                                # If that fails, try parsing it as a Python literal
-                                ingredients_str = row.get('parsed_ingredients', '[]')
-                                ingredients_json = ast.literal_eval(ingredients_str)
-                            except:
-                                ingredients_json = False
-
-                        try:
-                            # First try standard JSON parsing
-                            instructions_json = json.loads(row.get('parsed_instructions', '[]'))
-                        except json.JSONDecodeError:
-                            try:
-                                # If that fails, try parsing it as a Python literal
-                                instructions_str = row.get('parsed_instructions', '[]')
-                                instructions_json = ast.literal_eval(instructions_str)
-                            except:
-                                instructions_json = False
-
-                        if not ingredients_json or not instructions_json:
-                            recipes_skipped += 1
-                            if recipes_skipped % 50 == 0:
-                                self.stdout.write(f"Skipped {recipes_skipped} existing or invalid recipes...")
+                anonymous_id = self.get_anonymous_user_id()
+
+            # one query up front instead of an exists() per row; titles accepted from this file are added as we go.
+            # Batches committed before an interruption are in here too, so resuming never inserts them twice
+            existing_titles = set(Recipes.objects.values_list('title', flat=True))
+            upload_date = timezone.now().date()
+
+            with open(csv_file_path, 'rb') as file:
+                chunks = read_chunks(file, batch_size, state['row'], state['offset'])
+
+                for rows_read, end_offset, parsed in self.parse_chunks(chunks, workers):
+                    batch = []
+                    skipped = rows_read - state['row'] - len(parsed)  # blank lines
+
+                    for recipe in parsed:
+                        # Skip invalid rows and recipes that already exist
+                        if recipe is None or recipe['title'] in existing_titles:
+                            skipped += 1
                             continue
 
-                        # Create recipe
-                        Recipes.objects.create(
-                            recipe_id=recipe_id,
-                            title=recipe_name,
-                            description=row.get('description', ''),
-                            ingredients=ingredients_json,
-                            instructions=instructions_json,
-                            cuisine=row.get('cuisine', ''),
-                            course=row.get('course', ''),
-                            diet=row.get('diet', ''),
-                            prep_time=prep_time,
-                            cook_time=cook_time,
-                            upload_date=timezone.now().date(),
+                        existing_titles.add(recipe['title'])
+                        instance = Recipes(
+                            recipe_id=uuid.uuid4(),
+                            upload_date=upload_date,
                             user_id=anonymous_id,
-                            image=row.get('image_url', '')
+                            **recipe
                         )
-                        
-                        recipes_imported += 1
-                        
-                        if recipes_imported % 100 == 0:
-                            self.stdout.write(f"Imported {recipes_imported} recipes...")
-                
-                self.stdout.write(self.style.SUCCESS(f'Successfully imported {recipes_imported} recipes'))
-                self.stdout.write(self.style.SUCCESS(f'Skipped {recipes_skipped} existing recipes'))
-                self.stdout.write(self.style.SUCCESS(f'Current row processed: {current_row}'))
-                
+                        instance.set_derived_fields() # bulk_create skips save()
+                        batch.append(instance)
+
+                    # each batch is its own short transaction, the checkpoint only moves once the batch is committed
+                    with transaction.atomic():
+                        Recipes.objects.bulk_create(batch, batch_size=batch_size)
+                        if batch:
+                            adjust_counters(anonymous_id, recipe_count=len(batch))
+                            invalidate_recipe_listings()
+
+                    state.update(
+                        row=rows_read,
+                        offset=end_offset,
+                        imported=state['imported'] + len(batch),
+                        skipped=state['skipped'] + skipped,
+                    )
+                    self.save_checkpoint(checkpoint_path, state)
+                    self.report('progress', state, rows_at_start, started)
+
+            state['complete'] = True
+            self.save_checkpoint(checkpoint_path, state)
+            self.report('done', state, rows_at_start, started)
+
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error importing recipes: {str(e)}'))
-            self.stdout.write(self.style.ERROR(f'Failed at row: {current_row}'))
+            if self.progress_format == 'json':
+                self.stdout.write(json.dumps({'event': 'error', 'row': state['row'], 'error': str(e)}))
+            else:
+                self.stdout.write(self.style.ERROR(f'Error importing recipes: {str(e)}'))
+                self.stdout.write(self.style.ERROR(f'Failed at row: {state["row"]}'))
+                self.stdout.write(self.style.ERROR('Everything before it is committed, re-run with --resume to continue'))
+            raise CommandError(f'Import stopped at row {state["row"]}') from e # non-zero exit status for scripts
+
+    def get_anonymous_user_id(self):
+        # Create or get Anonymous user
+        anonymous_user, created = Users.objects.get_or_create(
+            username='Anonymous',
+            defaults={
+                'id': uuid.uuid4(),
+                'email': 'anonymous@example.com',
+                'reg_date': timezone.now().date()
+            }
+        )
+
+        if created:
+            # Set a default password (but hashed) using set_password
+            anonymous_user.set_password('pbkdf2_sha256$260000$randomhashhere')
+            anonymous_user.save()
+            if self.progress_format == 'text':
+                self.stdout.write(self.style.SUCCESS('Created Anonymous user'))
+        elif self.progress_format == 'text':
+            self.stdout.write(self.style.SUCCESS('Using existing Anonymous user'))
+        return anonymous_user.id
+
+    def parse_chunks(self, chunks, workers):
+        # yields (rows read, byte offset, parsed rows) in file order while keeping at most two chunks
+        # per worker in flight, so the file is streamed rather than loaded into memory
+        if workers == 1:
+            for rows, rows_read, end_offset in chunks:
+                yield rows_read, end_offset, parse_chunk(rows)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for rows, rows_read, end_offset in chunks:
+                pending.append((rows_read, end_offset, executor.submit(parse_chunk, rows)))
+                if len(pending) >= workers * 2:
+                    rows_read, end_offset, future = pending.popleft()
+                    yield rows_read, end_offset, future.result()
+            while pending:
+                rows_read, end_offset, future = pending.popleft()
+                yield rows_read, end_offset, future.result()
+
+    def load_checkpoint(self, checkpoint_path, state):
+        try:
+            with open(checkpoint_path, 'r', encoding='utf-8') as file:
+                checkpoint = json.load(file)
+        except FileNotFoundError:
+            raise CommandError(f'No checkpoint to resume from: {checkpoint_path}')
+
+        # byte offsets are only meaningful for the exact file they were taken from
+        if checkpoint.get('file') != state['file'] or checkpoint.get('size') != state['size']:
+            raise CommandError(f'Checkpoint {checkpoint_path} belongs to a different or modified file')
+        return {**state, **checkpoint}
+
+    def save_checkpoint(self, checkpoint_path, state):
+        # write-then-rename so an interruption never leaves a half written checkpoint behind
+        temp_path = f'{checkpoint_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temp_path, checkpoint_path)
+
+    def report(self, event, state, rows_at_start, started):
+        elapsed = time.monotonic() - started
+        rows_per_sec = (state['row'] - rows_at_start) / elapsed if elapsed else 0.0
+
+        if self.progress_format == 'json':
+            self.stdout.write(json.dumps({
+                'event': event,
+                'row': state['row'],
+                'offset': state['offset'],
+                'imported': state['imported'],
+                'skipped': state['skipped'],
+                'elapsed': round(elapsed, 3),
+                'rows_per_sec': round(rows_per_sec, 1),
+            }))
+        elif event == 'progress':
+            self.stdout.write(f"Imported {state['imported']} recipes, skipped {state['skipped']} existing or invalid recipes ({rows_per_sec:.0f} rows/sec)...")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Successfully imported {state['imported']} recipes"))
+            self.stdout.write(self.style.SUCCESS(f"Skipped {state['skipped']} existing recipes"))
+            self.stdout.write(self.style.SUCCESS(f"Current row processed: {state['row']}"))
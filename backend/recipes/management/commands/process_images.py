@@ -0,0 +1,157 @@
+import http.client
+import ipaddress
+import socket
+import ssl
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Value
+from recipes.images import Image, link_variants, make_variants, store_image
+from recipes.models import ImageAsset, Recipes
+from recipes.pagination import RowCompare
+
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs): # a redirect could point at an internal address
+        return None
+
+
+class PinnedAddress:
+    # connects to the address fetch_remote checked instead of resolving the host name again, which could by then give
+    # an internal one (DNS rebinding); the Host header and TLS server name and certificate stay the host name's
+    def __init__(self, host, *args, address, **kwargs):
+        super().__init__(host, *args, **kwargs)
+        self.address = address
+
+    def open_socket(self):
+        return socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPConnection(PinnedAddress, http.client.HTTPConnection):
+    def connect(self):
+        self.sock = self.open_socket()
+
+
+class PinnedHTTPSConnection(PinnedAddress, http.client.HTTPSConnection):
+    def connect(self):
+        self.sock = ssl.create_default_context().wrap_socket(self.open_socket(), server_hostname=self.host)
+
+
+class PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, address):
+        super().__init__()
+        self.address = address
+
+    def http_open(self, req):
+        return self.do_open(PinnedHTTPConnection, req, address=self.address)
+
+
+class PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, address):
+        super().__init__()
+        self.address = address
+
+    def https_open(self, req):
+        return self.do_open(PinnedHTTPSConnection, req, address=self.address)
+
+
+def fetch_remote(url):
+    # the image at an http(s) URL, refusing hosts that resolve to private, loopback or link-local addresses
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('not an http(s) URL')
+    addresses = [address[0] for *_, address in socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))]
+    for address in addresses:
+        if not ipaddress.ip_address(address).is_global:
+            raise ValueError(f'{parts.hostname} resolves to a non-public address')
+
+    # no proxies from the environment either, a proxy would resolve the host name itself
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), NoRedirects, PinnedHTTPHandler(addresses[0]), PinnedHTTPSHandler(addresses[0]))
+    with opener.open(url, timeout=settings.IMAGE_IMPORT_TIMEOUT) as response:
+        data = response.read(settings.IMAGE_MAX_UPLOAD_BYTES + 1)
+    if len(data) > settings.IMAGE_MAX_UPLOAD_BYTES:
+        raise ValueError('larger than IMAGE_MAX_UPLOAD_BYTES')
+    return data
+
+
+class Command(BaseCommand):
+    help = 'Make the resized variants of stored images that are still pending (after an outage or once Pillow is installed), and optionally copy remote recipe images into image storage first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--import-remote', action='store_true', help='Download recipe images that link to other sites so they get variants too')
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry images that failed before')
+        parser.add_argument('--batch-size', type=int, default=200, help='Number of recipes (or images) handled per query')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError('Pillow is not installed, install it to make image variants')
+
+        if options['import_remote']:
+            self.import_remote(options['batch_size'])
+
+        statuses = [ImageAsset.PENDING, ImageAsset.FAILED] if options['retry_failed'] else [ImageAsset.PENDING]
+        results = defaultdict(int)
+        last = None
+        while True:
+            batch = ImageAsset.objects.filter(status__in=statuses).order_by('created_at', 'pk')
+            if last is not None:
+                # seeks past the last asset on (created_at, pk), assets created in the same instant aren't skipped
+                batch = batch.filter(RowCompare([F('created_at'), F('pk')], [
+                    Value(last.created_at, output_field=ImageAsset._meta.get_field('created_at')),
+                    Value(last.pk, output_field=ImageAsset._meta.pk),
+                ], '>'))
+            assets = list(batch[:options['batch_size']])
+            if not assets:
+                break
+            for asset in assets:
+                results[make_variants(asset)] += 1
+            last = assets[-1]
+            self.stdout.write(f"Processed {sum(results.values())} images...")
+
+        relinked = self.relink()
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully made variants of {results[ImageAsset.READY]} images ({results[ImageAsset.FAILED]} failed), "
+            f"updated {relinked} recipes"
+        ))
+
+    def import_remote(self, batch_size):
+        imported = skipped = 0
+        failed = set() # tried once per run
+        last_pk = None
+
+        # walk the recipes without an image asset in primary key order; recipes sharing an image share its asset
+        while True:
+            batch = Recipes.objects.filter(image_asset=None).exclude(image=None).exclude(image='').order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            rows = list(batch.values_list('pk', 'image')[:batch_size])
+            if not rows:
+                break
+
+            by_url = defaultdict(list)
+            for pk, url in rows:
+                by_url[url].append(pk)
+            for url, pks in by_url.items():
+                asset = None if url in failed else ImageAsset.objects.filter(url=url).first()
+                if asset is None and url not in failed:
+                    try:
+                        asset = store_image(fetch_remote(url), url=url)
+                    except (OSError, ValueError) as exc: # urllib's errors are OSErrors
+                        self.stderr.write(f"Skipped {url}: {exc}")
+                    if asset is None:
+                        failed.add(url)
+                if asset is None:
+                    skipped += len(pks)
+                    continue
+                Recipes.objects.filter(pk__in=pks).update(image_asset=asset)
+                imported += len(pks)
+
+            last_pk = rows[-1][0]
+            self.stdout.write(f"Imported images of {imported} recipes ({skipped} skipped)...")
+
+    def relink(self):
+        # recipes that still missed their image's variants (e.g. the process died before its on-commit link ran)
+        stale = Recipes.objects.filter(image_asset__status=ImageAsset.READY, image_variants={}).values_list('image_asset', flat=True).distinct()
+        return sum(link_variants(asset_id) for asset_id in list(stale))
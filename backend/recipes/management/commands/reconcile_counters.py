@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Recipes
+from reviews.aggregates import rebuild_rating_aggregates
+from users.counters import rebuild_user_counters
+from users.models import Users
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized review stats (average, count, sum, star histogram) stored on Recipes from the Reviews table, and the recipe / bookmark / review counters stored on Users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of recipes (or users) rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rebuilt = self.rebuild_in_batches(Recipes, rebuild_rating_aggregates, batch_size, 'rating stats', 'recipes')
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt rating stats for {rebuilt} recipes'))
+        rebuilt = self.rebuild_in_batches(Users, rebuild_user_counters, batch_size, 'counters', 'users')
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt counters for {rebuilt} users'))
+
+    def rebuild_in_batches(self, model, rebuild, batch_size, what, rows):
+        rebuilt = 0
+        last_pk = None
+
+        # walk the table in primary key order so each transaction only locks one batch of rows
+        while True:
+            batch = model.objects.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+
+            with transaction.atomic():
+                rebuilt += rebuild(model.objects.filter(pk__in=pks))
+
+            last_pk = pks[-1]
+            self.stdout.write(f"Rebuilt {what} for {rebuilt} {rows}...")
+
+        return rebuilt
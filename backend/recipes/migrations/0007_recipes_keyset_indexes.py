@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_alter_recipes_ingredients_alter_recipes_instructions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['upload_date', 'recipe_id'], name='recipes_upload_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['user', 'upload_date', 'recipe_id'], name='recipes_user_keyset_idx'),
+        ),
+    ]
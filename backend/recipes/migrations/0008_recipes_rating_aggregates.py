@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:57
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Recipes = apps.get_model('recipes', 'Recipes')
+    Reviews = apps.get_model('reviews', 'Reviews')
+
+    stats = Reviews.objects.order_by().values('recipe_id').annotate(count=Count('pk'), total=Sum('rating'))
+    for row in stats.iterator():
+        Recipes.objects.filter(pk=row['recipe_id']).update(
+            review_count=row['count'],
+            rating_sum=row['total'],
+            average_rating=row['total'] / row['count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipes_keyset_indexes'),
+        ('reviews', '0002_alter_reviews_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='average_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:58
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# title > description > ingredient text; jsonb_to_tsvector only picks up the string values of the ingredients list
+CREATE_TRIGGER_SQL = [
+    """
+CREATE OR REPLACE FUNCTION recipes_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.description, '')), 'B') ||
+        setweight(jsonb_to_tsvector('pg_catalog.english', coalesce(NEW.ingredients, '[]'::jsonb), '["string"]'), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+    """,
+    """
+CREATE TRIGGER recipes_search_vector_trigger
+BEFORE INSERT OR UPDATE OF title, description, ingredients ON "Recipes"
+FOR EACH ROW EXECUTE FUNCTION recipes_search_vector_update()
+    """,
+    'UPDATE "Recipes" SET title = title',  # fires the trigger once for existing rows
+    'CREATE INDEX recipes_search_vector_idx ON "Recipes" USING gin (search_vector)',
+]
+
+DROP_TRIGGER_SQL = [
+    'DROP INDEX IF EXISTS recipes_search_vector_idx',
+    'DROP TRIGGER IF EXISTS recipes_search_vector_trigger ON "Recipes"',
+    'DROP FUNCTION IF EXISTS recipes_search_vector_update()',
+]
+
+
+def create_search_trigger(apps, schema_editor):
+    # the trigger and GIN index are postgres only, other backends fall back to icontains in recipes/search.py
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in CREATE_TRIGGER_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in DROP_TRIGGER_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipes_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipes_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['cuisine', 'upload_date', 'recipe_id'], name='recipes_cuisine_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['course', 'upload_date', 'recipe_id'], name='recipes_course_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['diet', 'upload_date', 'recipe_id'], name='recipes_diet_keyset_idx'),
+        ),
+    ]
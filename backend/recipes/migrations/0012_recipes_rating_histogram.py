@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_histogram(apps, schema_editor):
+    Recipes = apps.get_model('recipes', 'Recipes')
+    Reviews = apps.get_model('reviews', 'Reviews')
+
+    stats = Reviews.objects.order_by().values('recipe_id', 'rating').annotate(count=Count('pk'))
+    for row in stats.iterator():
+        if 1 <= row['rating'] <= 5:
+            Recipes.objects.filter(pk=row['recipe_id']).update(**{f"rating_{row['rating']}_count": row['count']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipes_version'),
+        ('reviews', '0002_alter_reviews_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def time_to_minutes(value):
+    return value.hour * 60 + value.minute if value else 0
+
+
+def backfill_total_time_and_tags(apps, schema_editor):
+    # same rules as Recipes.set_derived_fields, the historical model doesn't have the method
+    Recipes = apps.get_model('recipes', 'Recipes')
+    batch = []
+    rows = Recipes.objects.only('prep_time', 'cook_time', 'cuisine', 'course', 'diet').order_by('pk')
+    for recipe in rows.iterator(chunk_size=2000):
+        recipe.total_time_minutes = time_to_minutes(recipe.prep_time) + time_to_minutes(recipe.cook_time)
+        recipe.tags = [tag for tag in (recipe.cuisine, recipe.course, recipe.diet) if tag]
+        batch.append(recipe)
+        if len(batch) >= 2000:
+            Recipes.objects.bulk_update(batch, ['total_time_minutes', 'tags'])
+            batch = []
+    if batch:
+        Recipes.objects.bulk_update(batch, ['total_time_minutes', 'tags'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipes_rating_histogram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='tags',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='total_time_minutes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_total_time_and_tags, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipes',
+            index=models.Index(fields=['total_time_minutes', 'recipe_id'], name='recipes_time_keyset_idx'),
+        ),
+    ]
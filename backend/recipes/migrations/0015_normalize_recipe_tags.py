@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def normalize_tag(value):
+    return ' '.join(value.split()).title() if value else ''
+
+
+def normalize_tags(apps, schema_editor):
+    # same rules as recipes.models.get_tags, for rows stored before it trimmed and folded the case
+    Recipes = apps.get_model('recipes', 'Recipes')
+    batch = []
+    rows = Recipes.objects.only('cuisine', 'course', 'diet', 'tags').order_by('pk')
+    for recipe in rows.iterator(chunk_size=2000):
+        tags = [tag for tag in map(normalize_tag, (recipe.cuisine, recipe.course, recipe.diet)) if tag]
+        if tags != recipe.tags:
+            recipe.tags = tags
+            batch.append(recipe)
+        if len(batch) >= 2000:
+            Recipes.objects.bulk_update(batch, ['tags'])
+            batch = []
+    if batch:
+        Recipes.objects.bulk_update(batch, ['tags'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_image_assets'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_tags, migrations.RunPython.noop),
+    ]
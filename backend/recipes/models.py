@@ -1,6 +1,44 @@
 import uuid
 from django.db import models
 from django.db.models import JSONField
+from django.contrib.postgres.search import SearchVectorField
+
+
+def time_to_minutes(value):
+    return value.hour * 60 + value.minute if value else 0
+
+
+def normalize_tag(value):
+    # " vegetarian ", "VEGETARIAN" and "Vegetarian" are one tag; title case because the app's pickers match on it
+    return ' '.join(value.split()).title() if value else ''
+
+
+def get_tags(cuisine, course, diet):
+    return [tag for tag in map(normalize_tag, (cuisine, course, diet)) if tag]
+
+
+class ImageAsset(models.Model):
+    # an image we hold a copy of, with resized variants made by recipes/images.py; files are named by content digest
+    PENDING, READY, FAILED = 'pending', 'ready', 'failed'
+
+    asset_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    url = models.CharField(max_length=1024, unique=True) # what Recipes.image holds: our upload URL, or the remote URL it was copied from
+    digest = models.CharField(max_length=64) # sha256 of the original
+    original = models.CharField(max_length=1024) # name in the images storage
+    status = models.CharField(max_length=16, choices=[(PENDING, 'Pending'), (READY, 'Ready'), (FAILED, 'Failed')], default=PENDING)
+    width = models.PositiveIntegerField(null=True)
+    height = models.PositiveIntegerField(null=True)
+    variants = JSONField(default=dict) # {"webp": {"320": name, ...}, "jpeg": {...}}
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.url
+
+    class Meta:
+        db_table = 'ImageAssets'
+        indexes = [models.Index(fields=['status', 'created_at'], name='imageassets_status_idx')]
+
 
 class Recipes(models.Model):
     recipe_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -17,10 +55,60 @@ class Recipes(models.Model):
     user = models.ForeignKey('users.Users', on_delete=models.CASCADE, related_name='recipes')
     image = models.CharField(max_length=1024, null=True)
     video_link = models.CharField(max_length=1024, null=True, blank=True)
+
+    # the resized copies of `image`, denormalized from its ImageAsset so listings don't join; empty until they're made
+    image_asset = models.ForeignKey(ImageAsset, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='recipes')
+    image_variants = JSONField(default=dict, editable=False)
+
+    # denormalized review stats, kept in step by reviews/aggregates.py inside the review write transaction
+    average_rating = models.FloatField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    # bumped whenever the detail payload changes (recipe edits, review writes, author renames); used for ETags
+    version = models.PositiveIntegerField(default=1)
+
+    # derived from prep/cook time and cuisine/course/diet in save() (bulk imports set them too), so time filters,
+    # quickest-first sorting and the catalog tags come straight from the row
+    total_time_minutes = models.PositiveIntegerField(default=0, editable=False)
+    tags = JSONField(default=list, editable=False)
+
+    # weighted tsvector over title, description and ingredients, filled by a postgres trigger (see migration 0009)
+    search_vector = SearchVectorField(null=True, editable=False)
     
     def __str__(self):
         return self.title
+
+    def set_derived_fields(self):
+        # prep_time / cook_time can still be "HH:MM:SS" strings when they come straight from a form or the importer
+        prep_time = self._meta.get_field('prep_time').to_python(self.prep_time)
+        cook_time = self._meta.get_field('cook_time').to_python(self.cook_time)
+        self.total_time_minutes = time_to_minutes(prep_time) + time_to_minutes(cook_time)
+        self.tags = get_tags(self.cuisine, self.course, self.diet)
+
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'total_time_minutes', 'tags'}
+        super().save(*args, **kwargs)
     
     class Meta:
         db_table = 'Recipes'
-        verbose_name_plural = "Recipes"
\ No newline at end of file
+        verbose_name_plural = "Recipes"
+        indexes = [
+            # keyset pagination seeks on (upload_date, recipe_id), see recipes/pagination.py
+            models.Index(fields=['upload_date', 'recipe_id'], name='recipes_upload_keyset_idx'),
+            models.Index(fields=['user', 'upload_date', 'recipe_id'], name='recipes_user_keyset_idx'),
+            # facet filters, keyed the same way so a filtered catalog page is still a single index range
+            models.Index(fields=['cuisine', 'upload_date', 'recipe_id'], name='recipes_cuisine_keyset_idx'),
+            models.Index(fields=['course', 'upload_date', 'recipe_id'], name='recipes_course_keyset_idx'),
+            models.Index(fields=['diet', 'upload_date', 'recipe_id'], name='recipes_diet_keyset_idx'),
+            # ?sort=time pages and ?min_time= / ?max_time= ranges
+            models.Index(fields=['total_time_minutes', 'recipe_id'], name='recipes_time_keyset_idx'),
+        ]
\ No newline at end of file
@@ -0,0 +1,194 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import BooleanField, F, Func, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RowCompare(Func):
+    # renders as ("col_a", "col_b") < (%s, %s) so postgres can seek straight into a composite index
+    output_field = BooleanField()
+
+    def __init__(self, fields, values, operator):
+        self.operator = operator
+        self.row_width = len(fields)
+        super().__init__(*fields, *values)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sqls, params = [], []
+        for expression in self.get_source_expressions():
+            sql, expression_params = compiler.compile(expression)
+            sqls.append(sql)
+            params.extend(expression_params)
+        lhs = ', '.join(sqls[:self.row_width])
+        rhs = ', '.join(sqls[self.row_width:])
+        return f'({lhs}) {self.operator} ({rhs})', params
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the values of the last row instead of using OFFSET,
+    so every page costs the same no matter how deep the client scrolls.
+
+    `ordering` must be unique (end with the primary key) and use a single direction.
+    """
+    ordering = None
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None): # same, for the async views
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([row async for row in queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        # builds the page query without running it: the seek filter plus one extra row to know if there is more
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        # walking backwards means flipping the ordering and the comparison, then restoring the order in python
+        descending = self.ordering[0].startswith('-')
+        order_by = self.ordering if not self.reverse else [self._invert(field) for field in self.ordering]
+        queryset = queryset.order_by(*order_by)
+
+        if self.position is not None:
+            queryset = queryset.filter(self.seek_filter(queryset, self.position, descending != self.reverse))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        if self.reverse:
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                requested = int(request.query_params[self.page_size_query_param])
+                if requested > 0:
+                    return min(requested, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        return list(getattr(view, 'keyset_ordering', None) or self.ordering)
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_cursor(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        return self.build_link(cursor) if cursor else None
+
+    def get_previous_link(self):
+        cursor = self.get_previous_cursor()
+        return self.build_link(cursor) if cursor else None
+
+    def get_cursor_response(self, request, data, next_cursor, previous_cursor):
+        # same envelope as get_paginated_response, for pages whose cursors were stored earlier (cached pages)
+        self.base_url = request.build_absolute_uri()
+        return Response({
+            'next': self.build_link(next_cursor) if next_cursor else None,
+            'previous': self.build_link(previous_cursor) if previous_cursor else None,
+            'results': data,
+        })
+
+    def get_position(self, obj):
+        fields = [field.lstrip('-') for field in self.ordering]
+        if isinstance(obj, dict): # values() rows
+            return [str(obj[field]) for field in fields]
+        return [str(getattr(obj, field)) for field in fields]
+
+    def seek_filter(self, queryset, position, descending):
+        fields, values = [], []
+        for name, raw in zip(self.ordering, position):
+            model_field = queryset.model._meta.get_field(name.lstrip('-'))
+            try:
+                value = model_field.to_python(raw)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            fields.append(F(model_field.attname))
+            values.append(Value(value, output_field=model_field))
+        return RowCompare(fields, values, '<' if descending else '>')
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def build_link(self, cursor):
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            position = payload['p']
+            reverse = bool(payload.get('r', 0))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _invert(self, field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+
+class RecipeCursorPagination(KeysetPagination): # newest first, recipe_id breaks ties between recipes uploaded on the same day
+    ordering = ('-upload_date', '-recipe_id')
+
+
+class RecipeSearchPagination(LimitOffsetPagination): # search results are ordered by rank, so they can't be keyset paginated
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 50
@@ -0,0 +1,18 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q, Value
+
+SEARCH_CONFIG = 'english'  # must match the text search config used by the trigger in migration 0009
+
+
+def search_recipes(queryset, terms):
+    # ranked full text search on postgres, plain substring matching on backends without tsvector (local sqlite)
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(terms, search_type='websearch', config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-upload_date', '-recipe_id')
+
+    return queryset.filter(
+        Q(title__icontains=terms) | Q(description__icontains=terms)
+    ).annotate(rank=Value(0.0)).order_by('-upload_date', '-recipe_id')
@@ -1,54 +1,97 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Recipes
+from .images import image_fields, link_variants_on_commit, sniff_extension, store_image, variant_urls
+from .models import ImageAsset, Recipes
 from django.utils import timezone
+from django.db.models import BooleanField, Case, F, Value, When
+from django.urls import reverse
+from rest_framework.utils.urls import replace_query_param
 from reviews.models import Reviews
 from users.models import Bookmarks
+from users.cache import get_bookmarked_ids
+from reviews.pagination import ReviewCursorPagination
+from reviews.aggregates import get_histogram, HISTOGRAM_FIELDS
+from spice_bazaar.instrumentation import timed, TimedListSerializer, TimedSerializerMixin
 
-class RecipeCatalogSerializer(serializers.ModelSerializer):
+
+def get_sparse_fields(query_params):
+    # ?fields=title,tags keeps only those fields, ?omit=description drops fields; returns (requested or None, omitted)
+    def parse(name):
+        return {field.strip() for field in query_params.get(name, '').split(',') if field.strip()}
+
+    requested = parse('fields')
+    return (requested or None), parse('omit')
+
+
+class SparseFieldsMixin:
+    # fields the client didn't ask for are removed before serialization, so their SerializerMethodFields never run.
+    # Meta.field_columns says which model columns each field reads, so views can only() load those.
+    # The primary key is always returned, clients need it to match rows up
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        requested, omitted = get_sparse_fields(request.query_params)
+        pk_name = self.Meta.model._meta.pk.name
+        for name in list(self.fields):
+            if name == pk_name:
+                continue
+            if (requested is not None and name not in requested) or name in omitted:
+                self.fields.pop(name)
+
+    @classmethod
+    def get_columns(cls, request=None):
+        requested, omitted = get_sparse_fields(request.query_params) if request else (None, set())
+        columns = set()
+        for name in cls.Meta.fields:
+            if (requested is None or name in requested) and name not in omitted:
+                columns.update(cls.Meta.field_columns.get(name, (name,)))
+        return columns
+
+
+class RecipeCatalogSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     
     tags = serializers.SerializerMethodField()
     time = serializers.SerializerMethodField()
     author = serializers.SerializerMethodField()
     is_bookmarked = serializers.SerializerMethodField()
     average_rating = serializers.FloatField(read_only=True, default=0)  # Default to 0.0 if no reviews exist
+    image_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Recipes
         # coming from the models
-        fields = ['recipe_id', 'title', 'description', 'tags', 'time', 'upload_date', 'author', 'image', 'is_bookmarked', 'average_rating']
+        fields = ['recipe_id', 'title', 'description', 'tags', 'time', 'upload_date', 'author', 'image', 'image_variants', 'is_bookmarked', 'average_rating']
+        list_serializer_class = TimedListSerializer
+        field_columns = {
+            'time': ('total_time_minutes',),
+            'author': ('user__username',),
+            'is_bookmarked': (),
+        }
     
-    def get_tags(self, obj):
+    def get_tags(self, obj): # cuisine, course and diet, stored on the recipe (see Recipes.set_derived_fields)
+        return obj.tags
     
-        tags = [] # making it as tags to be displayed easily on the catalog
-        if obj.cuisine:
-            tags.append(obj.cuisine)
-        if obj.course:
-            tags.append(obj.course)
-        if obj.diet:
-            tags.append(obj.diet)
-        return tags
-    
-    def get_time(self, obj):
-        total_minutes = 0
-        # making it as tags to be displayed easily on the catalog
-        if obj.prep_time:
-            hours, minutes, seconds = obj.prep_time.hour, obj.prep_time.minute, obj.prep_time.second
-            total_minutes += (hours * 60) + minutes
-        
-        # Add cook_time minutes if it exists
-        if obj.cook_time:
-            hours, minutes, seconds = obj.cook_time.hour, obj.cook_time.minute, obj.cook_time.second
-            total_minutes += (hours * 60) + minutes
-            
-        return total_minutes
+    def get_time(self, obj): # prep + cook minutes, stored on the recipe
+        return obj.total_time_minutes
     
     def get_author(self, obj):
         return obj.user.username if obj.user else None
+
+    def get_image_variants(self, obj): # resized copies of `image` by format and width, {} until they're made
+        return variant_urls(obj.image_variants)
     
     def get_is_bookmarked(self, obj):
         # If the object has the annotation, use it
         if hasattr(obj, 'is_bookmarked'):
             return obj.is_bookmarked
+
+        # Otherwise use the user's cached bookmark set passed in by the view
+        bookmarked_ids = self.context.get('bookmarked_ids')
+        if bookmarked_ids is not None:
+            return obj.recipe_id in bookmarked_ids
         
         # Fall back to the original method if annotation isn't present
         request = self.context.get('request')
@@ -57,57 +100,164 @@ class RecipeCatalogSerializer(serializers.ModelSerializer):
         return False
 
 
+class RecipeCatalogRowSerializer(SparseFieldsMixin):
+    """
+    Read-only fast path for RecipeCatalogSerializer. Views hand it values() rows instead of model instances
+    and every field is a plain function of the row, so no instances, method fields or per-row queries.
+    The rendered JSON is identical to RecipeCatalogSerializer's (same keys, order and formats),
+    `manage.py benchmark_catalog` checks that and compares the two.
+    """
+    values_rows = True # SparseColumnsMixin selects values() rows instead of only() instances
+
+    class Meta(RecipeCatalogSerializer.Meta):
+        pass
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+        request = self.context.get('request')
+        requested, omitted = get_sparse_fields(request.query_params) if request else (None, set())
+        bookmarked_ids = self.context.get('bookmarked_ids')
+        if bookmarked_ids is None and request and request.user.is_authenticated:
+            bookmarked_ids = get_bookmarked_ids(request.user)
+        self.bookmarked_ids = bookmarked_ids or frozenset()
+
+        transforms = {
+            'recipe_id': lambda row: str(row['recipe_id']),
+            'title': lambda row: str(row['title']),
+            'description': lambda row: str(row['description']),
+            'tags': lambda row: row['tags'],
+            'time': lambda row: row['total_time_minutes'],
+            'upload_date': lambda row: row['upload_date'].isoformat(),
+            'author': lambda row: row['user__username'],
+            'image': lambda row: None if row['image'] is None else str(row['image']),
+            'image_variants': lambda row: variant_urls(row['image_variants']),
+            'is_bookmarked': self.get_is_bookmarked,
+            'average_rating': lambda row: float(row['average_rating']),
+        }
+        self.transforms = [
+            (name, transforms[name]) for name in self.Meta.fields
+            if name == 'recipe_id' or ((requested is None or name in requested) and name not in omitted)
+        ]
+
+    def get_is_bookmarked(self, row):
+        if 'is_bookmarked' in row: # annotated by the view (the bookmarks listing)
+            return row['is_bookmarked']
+        return row['recipe_id'] in self.bookmarked_ids
+
+    def to_representation(self, row):
+        return {name: transform(row) for name, transform in self.transforms}
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            if self.many:
+                return [self.to_representation(row) for row in self.instance]
+            return self.to_representation(self.instance)
+
+
 class ReviewBriefSerializer(serializers.ModelSerializer):
     username = serializers.SerializerMethodField()
     
     class Meta:
         model = Reviews
         fields = ['review_id', 'username', 'rating', 'comment', 'review_date']
+        list_serializer_class = TimedListSerializer
     
     def get_username(self, obj):
         return obj.user.username
 
 
-class RecipeViewSerializer(serializers.ModelSerializer):
+class RecipeViewSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     reviews = serializers.SerializerMethodField()
+    reviews_next = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
     is_bookmarked = serializers.SerializerMethodField()
     your_review = serializers.SerializerMethodField()
     is_owner = serializers.SerializerMethodField()
     tags = serializers.SerializerMethodField()
     author = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Recipes
-        fields = ['recipe_id', 'title', 'description', 'ingredients', 'instructions', 'tags', 'prep_time', 'cook_time', 'upload_date',  'author', 'image', 'video_link', 'your_review', 'reviews', 'is_owner', 'is_bookmarked'] 
+        fields = ['recipe_id', 'title', 'description', 'ingredients', 'instructions', 'tags', 'prep_time', 'cook_time', 'upload_date',  'author', 'image', 'image_variants', 'video_link', 'your_review', 'reviews', 'reviews_next', 'rating_histogram', 'is_owner', 'is_bookmarked'] 
+        field_columns = {
+            'author': ('user__username',),
+            'your_review': (),
+            'reviews': (),
+            'reviews_next': (),
+            'rating_histogram': tuple(HISTOGRAM_FIELDS.values()),
+            'is_owner': ('user',),
+            'is_bookmarked': (),
+        }
     
     def get_tags(self, obj):
-        tags = []
-        if obj.cuisine:
-            tags.append(obj.cuisine)
-        if obj.course:
-            tags.append(obj.course)
-        if obj.diet:
-            tags.append(obj.diet)
-        return tags
+        return obj.tags
     
     def get_author(self, obj):
         return obj.user.username if obj.user else None
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj.image_variants)
     
+    @staticmethod
+    def review_page_queryset(recipe_id, user_id):
+        # one query for both the viewer's own review and the first page of everyone else's: the own review (if any)
+        # sorts first, then newest first, and one extra row tells if there is more
+        return Reviews.objects.filter(recipe_id=recipe_id).select_related('user').annotate(
+            is_own=Case(When(user_id=user_id, then=Value(True)), default=Value(False), output_field=BooleanField())
+        ).order_by('-is_own', '-review_date', '-review_id')[:ReviewCursorPagination.page_size + 2]
+
+    @staticmethod
+    def split_review_page(reviews):
+        # (own review or None, first page of the others, whether there are more)
+        page_size = ReviewCursorPagination.page_size
+        own_review = reviews[0] if reviews and reviews[0].is_own else None
+        others = [review for review in reviews if not review.is_own]
+        return own_review, others[:page_size], len(others) > page_size
+
+    def get_review_page(self, obj):
+        # the async detail view runs review_page_queryset itself and passes the split page in as context['review_page']
+        if not hasattr(self, '_review_page') and 'review_page' in self.context:
+            self._review_page = self.context['review_page']
+        if not hasattr(self, '_review_page'):
+            request = self.context.get('request')
+            user_id = request.user.pk if request and request.user.is_authenticated else None
+            self._review_page = self.split_review_page(list(self.review_page_queryset(obj.recipe_id, user_id)))
+        return self._review_page
+
     def get_your_review(self, obj): # Return the current user's review if it exists
-        request = self.context.get('request')
-        if request and hasattr(request, 'user') and request.user.is_authenticated:
-            review = obj.reviews.filter(user=request.user).first()
-            if review:
-                return ReviewBriefSerializer(review).data
+        own_review, _, _ = self.get_review_page(obj)
+        if own_review:
+            return ReviewBriefSerializer(own_review).data
         return None
     
-    def get_reviews(self, obj):
-        request = self.context.get('request')
-        # Using the related_name 'reviews' defined in the Reviews model
-        reviews = obj.reviews.exclude(user=request.user).select_related('user').order_by('-review_date')
+    def get_reviews(self, obj): # only the first page, the rest comes from /api/reviews/recipe/<id>/
+        _, reviews, _ = self.get_review_page(obj)
         return ReviewBriefSerializer(reviews, many=True).data
 
+    def get_reviews_next(self, obj):
+        _, reviews, has_more = self.get_review_page(obj)
+        request = self.context.get('request')
+        if not has_more or not request:
+            return None
+
+        last = reviews[-1]
+        cursor = ReviewCursorPagination().encode_cursor([str(last.review_date), str(last.review_id)], reverse=False)
+        url = request.build_absolute_uri(reverse('recipe-reviews', kwargs={'recipe_id': obj.recipe_id}))
+        return replace_query_param(url, ReviewCursorPagination.cursor_query_param, cursor)
+
+    def get_rating_histogram(self, obj): # {"1": count, ..., "5": count}, stored on the recipe
+        return get_histogram(obj)
+
     def get_is_bookmarked(self, obj):
+        bookmarked_ids = self.context.get('bookmarked_ids')
+        if bookmarked_ids is not None:
+            return obj.recipe_id in bookmarked_ids
+
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
             return Bookmarks.objects.filter(user=request.user, recipe=obj).exists()
@@ -116,7 +266,7 @@ class RecipeViewSerializer(serializers.ModelSerializer):
     def get_is_owner(self, obj):
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
-            return obj.user == request.user
+            return obj.user_id == request.user.pk
         return False
 
 
@@ -160,7 +310,8 @@ class RecipeUploadSerializer(serializers.ModelSerializer):
         # Get the user from the context
         user = self.context['request'].user
         # Create recipe with the user
-        recipe = Recipes.objects.create(user=user, **validated_data)
+        recipe = Recipes.objects.create(user=user, **validated_data, **image_fields(validated_data.get('image')))
+        link_variants_on_commit(recipe)
         return recipe
     
     
@@ -201,13 +352,44 @@ class RecipeEditSerializer(serializers.ModelSerializer):
         return data
     
     def update(self, instance, validated_data):
+        if 'image' in validated_data:
+            validated_data.update(image_fields(validated_data['image']))
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
+        instance.version = F('version') + 1 # invalidates the detail ETag
         instance.save()
+        instance.refresh_from_db(fields=['version'])
+        if 'image' in validated_data:
+            link_variants_on_commit(instance)
         return instance
     
 class RecipeDeleteSerializer(serializers.ModelSerializer):    
     class Meta:
         model = Recipes
-        read_only_fields = ['user']
\ No newline at end of file
+        read_only_fields = ['user']
+
+
+class ImageUploadSerializer(serializers.ModelSerializer): # multipart `file`; the returned `image` URL goes into a recipe's image
+    file = serializers.FileField(write_only=True)
+    image = serializers.CharField(source='url', read_only=True)
+    image_variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImageAsset
+        fields = ['file', 'image', 'image_variants', 'status', 'width', 'height']
+        read_only_fields = ['status', 'width', 'height']
+
+    def validate_file(self, value):
+        if value.size > settings.IMAGE_MAX_UPLOAD_BYTES:
+            raise serializers.ValidationError(f"Images can be at most {settings.IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+        if sniff_extension(value.read(12)) is None:
+            raise serializers.ValidationError("Upload a JPEG, PNG, GIF or WebP image.")
+        value.seek(0)
+        return value
+
+    def create(self, validated_data):
+        return store_image(validated_data['file'].read())
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj.variants)
@@ -0,0 +1,25 @@
+"""
+Rows deleted together with their parent (reviews and bookmarks going with a recipe or a user, whether through
+Model.delete(), QuerySet.delete() or the admin) only reach the receivers that keep stored aggregates in step one by
+one. These receivers note which parents one delete() call takes down, on the object it was called on (the
+`origin` Django passes with the delete signals), so the per-row receivers can skip aggregates on rows about to go.
+"""
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import Recipes
+
+
+def note_deleted(origin, instance):
+    # pre_delete fires for every collected row before anything is deleted, so the note is there for every post_delete
+    if origin is not None:
+        origin.__dict__.setdefault('_deleting', set()).add((instance._meta.label, instance.pk))
+
+
+def deleted_with(origin, model, pk):
+    return (model._meta.label, pk) in getattr(origin, '_deleting', ())
+
+
+@receiver(pre_delete, sender=Recipes)
+def recipe_deleting(sender, instance, origin=None, **kwargs):
+    note_deleted(origin, instance)
@@ -1,3 +1,997 @@
-from django.test import TestCase
+import csv
+import datetime
+import http.server
+import io
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, router
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from spice_bazaar.db_router import ReplicaSet, replicas
+from spice_bazaar.instrumentation import record_query
+from users.cache import get_bookmarked_ids
+from users.counters import adjust_counters
+from reviews.models import Reviews
+from users.models import Bookmarks, Users
+from . import csv_import
+from .benchmark import ENDPOINTS
+from .cache import get_catalog_page, get_generation
+from .images import Image, image_fields, link_variants, make_variants, store_image
+from .management.commands import benchmark_api
+from .management.commands.process_images import PinnedHTTPConnection, fetch_remote
+from .models import ImageAsset, Recipes, get_tags
+from .serializers import RecipeCatalogSerializer
+
+FAKE_REPLICA = 'fake_replica'
+
+# A second local database standing in for a read replica. Test discovery imports this module before the runner
+# creates the test databases, so registering the alias here is enough. Unlike a real replica (TEST MIRROR, see
+# settings.py) it gets its own test database, so the tests can tell which database a view read from.
+_default = settings.DATABASES['default']
+settings.DATABASES.setdefault(FAKE_REPLICA, {
+    **_default,
+    'OPTIONS': {**_default.get('OPTIONS', {})},
+    'TEST': {
+        **_default.get('TEST', {}),
+        # sqlite test databases are in memory, one per alias
+        'NAME': f"test_{_default['NAME']}_replica" if _default['ENGINE'] == 'django.db.backends.postgresql' else None,
+    },
+})
+
+
+def make_recipe(user, title, using=DEFAULT_DB_ALIAS, **fields):
+    if using == DEFAULT_DB_ALIAS:
+        adjust_counters(user.pk, recipe_count=1) # as the upload view does, deleting the recipe lowers it again
+    return Recipes.objects.using(using).create(**{
+        'title': title,
+        'description': 'Test recipe',
+        'ingredients': [{'item': 'rice', 'quantity': '1 cup'}],
+        'instructions': ['Cook'],
+        'prep_time': datetime.time(0, 10),
+        'cook_time': datetime.time(0, 20),
+        'user': user,
+        **fields,
+    })
+
+
+@override_settings(REPLICA_DATABASES=[FAKE_REPLICA], REPLICA_MAX_LAG=5, REPLICA_CHECK_INTERVAL=0, REPLICA_STICKY_SECONDS=60)
+class ReplicaRoutingTests(TestCase):
+    databases = {DEFAULT_DB_ALIAS, FAKE_REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        replicas.reset()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        self.primary_recipe = make_recipe(self.user, 'On the primary')
+
+        # the replica only holds what is copied to it, so a response shows which database it was read from
+        self.user.save(using=FAKE_REPLICA, force_insert=True)
+        self.replica_recipe = make_recipe(self.user, 'Only on the replica', using=FAKE_REPLICA)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def titles(self, path=None):
+        # the batch endpoint isn't cached, so it shows where the view's reads went
+        path = path or f'/api/recipes/batch/?ids={self.primary_recipe.pk},{self.replica_recipe.pk}'
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.json()['results']]
+
+    def test_list_reads_from_replica(self):
+        self.assertEqual(self.titles(), ['Only on the replica'])
+
+    def test_detail_reads_from_replica(self):
+        self.assertEqual(self.client.get(f'/api/recipes/view/{self.replica_recipe.pk}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/recipes/view/{self.primary_recipe.pk}/').status_code, 404)
+
+    def test_write_pins_user_to_primary(self):
+        response = self.client.post('/api/acc/bookmark/', {'recipe_id': str(self.primary_recipe.pk)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Users.objects.using(DEFAULT_DB_ALIAS).get(pk=self.user.pk).bookmarks.exists())
+        self.assertEqual(self.titles(), ['On the primary'])
+
+    def test_pin_is_per_user(self):
+        self.client.post('/api/acc/bookmark/', {'recipe_id': str(self.primary_recipe.pk)}, format='json')
+
+        other = Users.objects.create_user(email='other@example.com', username='other', password='pw-12345!x')
+        other.save(using=FAKE_REPLICA, force_insert=True)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.titles(), ['Only on the replica'])
+
+    def test_lagging_replica_is_skipped(self):
+        with mock.patch.object(ReplicaSet, 'measure_lag', return_value=60.0):
+            self.assertEqual(self.titles(), ['On the primary'])
+
+    def test_unreachable_replica_is_skipped(self):
+        with mock.patch.object(ReplicaSet, 'measure_lag', side_effect=OperationalError('connection refused')):
+            self.assertEqual(self.titles(), ['On the primary'])
+
+    def test_reads_outside_read_views_use_primary(self):
+        self.assertEqual(router.db_for_read(Recipes), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(Recipes), DEFAULT_DB_ALIAS)
+        self.client.get('/api/recipes/catalog/')
+        self.assertEqual(router.db_for_read(Recipes), DEFAULT_DB_ALIAS)
+
+    async def test_async_list_reads_from_replica(self):
+        client = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        response = await client.get('/api/recipes/async/uploaded/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['title'] for row in response.json()['results']], ['Only on the replica'])
+
+    def test_catalog_cache_is_filled_on_the_primary(self):
+        self.assertEqual(self.titles('/api/recipes/catalog/'), ['On the primary'])
+
+    def test_write_then_replica_read_does_not_cache_pre_write_rows(self):
+        self.titles('/api/recipes/catalog/')
+        writer = APIClient()
+        writer.force_authenticate(Users.objects.create_user(email='writer@example.com', username='writer', password='pw-12345!x'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(writer.post('/api/recipes/upload/', {**RECIPE_UPLOAD, 'cuisine': 'Thai'}, format='json').status_code, 201)
+
+        # this reader isn't pinned and the replica never sees the write
+        self.assertEqual(sorted(self.titles('/api/recipes/catalog/')), ['On the primary', 'Uploaded'])
+        facets = self.client.get('/api/recipes/facets/').json()
+        self.assertEqual(facets['cuisine'], [{'value': 'Thai', 'count': 1}])
+
+    def test_bookmark_set_is_filled_on_the_primary(self):
+        Bookmarks.objects.create(user=self.user, recipe=self.primary_recipe)
+        response = self.client.get(f'/api/recipes/view/{self.replica_recipe.pk}/')
+        self.assertFalse(response.json()['is_bookmarked'])
+        self.assertEqual(get_bookmarked_ids(self.user), {self.primary_recipe.pk})
+
+    def test_list_read_on_replica_gets_no_etag(self):
+        self.assertNotIn('ETag', self.client.get('/api/recipes/uploaded/'))
+        self.assertIn('ETag', self.client.get('/api/recipes/catalog/'))
+        self.assertIn('ETag', self.client.get(f'/api/recipes/view/{self.replica_recipe.pk}/'))
+
+    def test_etag_from_primary_is_honoured_on_replica(self):
+        with mock.patch.object(ReplicaSet, 'measure_lag', return_value=60.0):
+            etag = self.client.get('/api/recipes/uploaded/')['ETag']
+        replicas.reset()
+        self.assertEqual(self.client.get('/api/recipes/uploaded/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    async def test_async_list_read_on_replica_gets_no_etag(self):
+        client = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertNotIn('ETag', await client.get('/api/recipes/async/uploaded/'))
+        self.assertIn('ETag', await client.get('/api/recipes/async/catalog/'))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        # all uploaded today, so recipe_id alone decides the order within the day
+        self.recipes = [make_recipe(self.user, f'Recipe {number}') for number in range(7)]
+        self.expected = [str(recipe.pk) for recipe in sorted(self.recipes, key=lambda recipe: recipe.pk.hex, reverse=True)]
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            page = self.get_page(url)
+            ids += [row['recipe_id'] for row in page['results']]
+            url, pages = page['next'], pages + 1
+        return ids, pages
+
+    def test_pages_cover_every_recipe_once_in_order(self):
+        ids, pages = self.walk('/api/recipes/catalog/?page_size=3')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pages, 3)
+
+    def test_first_page_has_no_previous_link(self):
+        page = self.get_page('/api/recipes/catalog/?page_size=3')
+        self.assertIsNone(page['previous'])
+        self.assertIsNotNone(page['next'])
+
+    def test_previous_link_returns_the_page_before(self):
+        first = self.get_page('/api/recipes/catalog/?page_size=3')
+        second = self.get_page(first['next'])
+        back = self.get_page(second['previous'])
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_recipe_added_between_pages_is_not_repeated(self):
+        first = self.get_page('/api/recipes/catalog/?page_size=3')
+        newer = make_recipe(self.user, 'Added later')
+        Recipes.objects.filter(pk=newer.pk).update(upload_date=newer.upload_date + datetime.timedelta(days=1)) # sorts first
+        cache.clear()
+        second = self.get_page(first['next'])
+        self.assertEqual([row['recipe_id'] for row in second['results']], self.expected[3:6])
+
+    def test_page_size_is_capped(self):
+        with mock.patch('recipes.pagination.RecipeCursorPagination.max_page_size', 2):
+            page = self.get_page('/api/recipes/catalog/?page_size=500')
+        self.assertEqual(len(page['results']), 2)
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/recipes/catalog/?cursor=not-a-cursor').status_code, 404)
+        self.assertEqual(self.client.get('/api/recipes/catalog/?cursor=eyJwIjpbIngiXSwiciI6MH0=').status_code, 404)
+
+    def test_uploaded_recipes_are_paginated(self):
+        other = Users.objects.create_user(email='other@example.com', username='other', password='pw-12345!x')
+        make_recipe(other, 'Not mine')
+        ids, pages = self.walk('/api/recipes/uploaded/?page_size=4')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(pages, 2)
+
+    def test_default_pagination_is_not_recipe_specific(self):
+        self.assertEqual(api_settings.DEFAULT_PAGINATION_CLASS, LimitOffsetPagination)
+
+
+class RecipeSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        self.curry = make_recipe(self.user, 'Chickpea curry', cuisine='Indian')
+        self.thai = make_recipe(self.user, 'Green curry', cuisine='Thai')
+        self.soup = make_recipe(self.user, 'Tomato soup', description='A quick curry-free lunch', cuisine='Indian')
+        self.salad = make_recipe(self.user, 'Potato salad')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get(f'/api/recipes/search/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def found(self, query):
+        return {row['recipe_id'] for row in self.search(query)['results']}
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/api/recipes/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/recipes/search/?q=%20').status_code, 400)
+
+    def test_matches_titles(self):
+        self.assertEqual(self.found('q=chickpea'), {str(self.curry.pk)})
+
+    def test_matches_descriptions(self):
+        self.assertIn(str(self.soup.pk), self.found('q=lunch'))
+
+    def test_no_match_is_empty(self):
+        self.assertEqual(self.search('q=lasagne')['results'], [])
+
+    def test_combines_with_facet_filters(self):
+        self.assertEqual(self.found('q=green&cuisine=Thai'), {str(self.thai.pk)})
+        self.assertEqual(self.found('q=green&cuisine=Indian'), set())
+
+    def test_results_are_paginated(self):
+        page = self.search('q=curry&limit=1')
+        self.assertEqual(len(page['results']), 1)
+        self.assertIsNotNone(page['next'])
+        rest = self.client.get(page['next']).json()
+        self.assertNotEqual(rest['results'][0]['recipe_id'], page['results'][0]['recipe_id'])
+
+
+RECIPE_UPLOAD = {
+    'title': 'Uploaded',
+    'description': 'Test recipe',
+    'ingredients': [{'item': 'rice', 'quantity': '1 cup'}],
+    'instructions': ['Cook'],
+    'prep_time': '00:10:00',
+    'cook_time': '00:20:00',
+    'image': 'http://example.com/rice.jpg',
+}
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        make_recipe(self.user, 'Dal', cuisine='Indian', course='Main', diet='Vegetarian')
+        make_recipe(self.user, 'Butter chicken', cuisine='Indian', course='Main', diet='Non Vegetarian')
+        make_recipe(self.user, 'Risotto', cuisine='Italian', course='Main', diet='Vegetarian')
+        make_recipe(self.user, 'Tiramisu', cuisine='Italian', course='Dessert', diet='Vegetarian')
+        make_recipe(self.user, 'Toast')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def facets(self, query=''):
+        response = self.client.get(f'/api/recipes/facets/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {field: {row['value']: row['count'] for row in rows} for field, rows in response.json().items()}
+
+    def catalog_titles(self, query):
+        response = self.client.get(f'/api/recipes/catalog/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['title'] for row in response.json()['results'])
+
+    def test_counts_every_value(self):
+        self.assertEqual(self.facets(), {
+            'cuisine': {'Indian': 2, 'Italian': 2},
+            'course': {'Main': 3, 'Dessert': 1},
+            'diet': {'Vegetarian': 3, 'Non Vegetarian': 1},
+        })
+
+    def test_facet_is_counted_under_the_other_filters(self):
+        counts = self.facets('cuisine=Italian')
+        self.assertEqual(counts['cuisine'], {'Indian': 2, 'Italian': 2}) # its own filter doesn't apply
+        self.assertEqual(counts['course'], {'Main': 1, 'Dessert': 1})
+        self.assertEqual(counts['diet'], {'Vegetarian': 2})
+
+    def test_values_of_one_facet_are_ored(self):
+        self.assertEqual(self.catalog_titles('cuisine=Indian,Italian&course=Dessert'), ['Tiramisu'])
+        self.assertEqual(self.catalog_titles('diet=Vegetarian&cuisine=Indian'), ['Dal'])
+
+    def test_counts_are_cached(self):
+        self.facets()
+        with self.assertNumQueries(0):
+            self.facets()
+
+    def test_upload_refreshes_counts(self):
+        self.facets()
+        uploader = Users.objects.create_user(email='other@example.com', username='other', password='pw-12345!x')
+        client = APIClient()
+        client.force_authenticate(uploader)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/recipes/upload/', {**RECIPE_UPLOAD, 'cuisine': 'Thai'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.facets()['cuisine'], {'Indian': 2, 'Italian': 2, 'Thai': 1})
+
+
+CSV_HEADER = ['name', 'description', 'cuisine', 'course', 'diet', 'prep_time (in mins)', 'cook_time (in mins)', 'image_url', 'parsed_ingredients', 'parsed_instructions']
+
+
+def csv_row(name, ingredients="[{'item': 'rice', 'quantity': '1 cup'}]", prep='10'):
+    return [name, 'From the CSV', 'Indian', 'Main', 'Vegetarian', prep, '20', 'http://example.com/x.jpg', ingredients, '["Cook"]']
+
+
+class ImportRecipesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'recipes.csv')
+
+    def write_csv(self, rows):
+        with open(self.path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(rows)
+
+    def run_import(self, *args, **options):
+        call_command('import_recipes', self.path, *args, stdout=io.StringIO(), **{'batch_size': 2, 'workers': 1, **options})
+
+    def imported(self):
+        return dict(Recipes.objects.values_list('title', 'total_time_minutes'))
+
+    def test_imports_valid_rows(self):
+        self.write_csv([csv_row('Dal'), csv_row('Broken', ingredients='not a list'), csv_row('Rice', prep='1500')])
+        self.run_import()
+        self.assertEqual(self.imported(), {'Dal': 30, 'Rice': 23 * 60 + 59 + 20}) # a day or more is capped at 23:59
+        self.assertEqual(Users.objects.get(username='Anonymous').recipe_count, 2)
+
+    def test_parser_pool_gives_the_same_result(self):
+        self.write_csv([csv_row(f'Recipe {number}') for number in range(7)])
+        self.run_import(workers=2)
+        self.assertEqual(sorted(self.imported()), [f'Recipe {number}' for number in range(7)])
+
+    def test_existing_titles_are_skipped(self):
+        self.write_csv([csv_row('Dal'), csv_row('Dal'), csv_row('Rice')])
+        self.run_import()
+        self.run_import()
+        self.assertEqual(Recipes.objects.count(), 2)
+
+    def test_failed_chunk_is_a_command_error(self):
+        self.write_csv([csv_row('Dal'), csv_row('Rice'), csv_row('Soup')])
+        parse_chunk = csv_import.parse_chunk
+        with mock.patch('recipes.management.commands.import_recipes.parse_chunk', side_effect=[parse_chunk([]), ValueError('bad chunk')]):
+            with self.assertRaises(CommandError):
+                self.run_import()
+
+    def test_missing_file_is_a_command_error(self):
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', self.path + '.missing', stdout=io.StringIO())
+
+    def test_parser_module_does_not_load_django(self):
+        # spawned parser processes import it without django.setup()
+        code = 'import sys, recipes.csv_import; sys.exit("django" in sys.modules)'
+        self.assertEqual(subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR).returncode, 0)
+
+    def failing_parser(self, good_chunks):
+        # the real parser for the first `good_chunks` chunks, then an error
+        parse_chunk = csv_import.parse_chunk
+        calls = iter(range(good_chunks + 1))
+        def parse(rows):
+            if next(calls) == good_chunks:
+                raise ValueError('bad chunk')
+            return parse_chunk(rows)
+        return mock.patch('recipes.management.commands.import_recipes.parse_chunk', side_effect=parse)
+
+    def test_resume_continues_after_the_last_committed_batch(self):
+        self.write_csv([csv_row(f'Recipe {number}') for number in range(5)])
+        with self.failing_parser(1), self.assertRaises(CommandError):
+            self.run_import()
+        self.assertEqual(sorted(self.imported()), ['Recipe 0', 'Recipe 1'])
+
+        self.run_import('--resume')
+        self.assertEqual(sorted(self.imported()), [f'Recipe {number}' for number in range(5)])
+        with open(f'{self.path}.checkpoint.json', encoding='utf-8') as file:
+            checkpoint = json.load(file)
+        self.assertEqual((checkpoint['row'], checkpoint['imported'], checkpoint['complete']), (5, 5, True))
+
+    def test_resume_needs_a_checkpoint(self):
+        self.write_csv([csv_row('Dal')])
+        with self.assertRaises(CommandError):
+            self.run_import('--resume')
+
+    def test_checkpoint_of_a_changed_file_is_refused(self):
+        self.write_csv([csv_row('Dal'), csv_row('Rice'), csv_row('Soup')])
+        with self.failing_parser(1), self.assertRaises(CommandError):
+            self.run_import()
+        self.write_csv([csv_row('Dal'), csv_row('Rice'), csv_row('Soup'), csv_row('Stew')])
+        with self.assertRaises(CommandError):
+            self.run_import('--resume')
+
+    def test_json_progress(self):
+        self.write_csv([csv_row(f'Recipe {number}') for number in range(3)])
+        out = io.StringIO()
+        call_command('import_recipes', self.path, batch_size=2, workers=1, progress='json', stdout=out)
+        events = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([event['event'] for event in events], ['progress', 'progress', 'done'])
+        self.assertEqual((events[-1]['row'], events[-1]['imported']), (3, 3))
+
+
+class ETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        self.recipe = make_recipe(self.user, 'Dal')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_catalog_is_not_modified(self):
+        etag = self.etag('/api/recipes/catalog/')
+        response = self.revalidate('/api/recipes/catalog/', etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_upload_changes_catalog_etag(self):
+        etag = self.etag('/api/recipes/catalog/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/recipes/upload/', RECIPE_UPLOAD, format='json').status_code, 201)
+        self.assertEqual(self.revalidate('/api/recipes/catalog/', etag).status_code, 200)
+
+    def test_bookmark_changes_catalog_etag(self):
+        etag = self.etag('/api/recipes/catalog/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/acc/bookmark/', {'recipe_id': str(self.recipe.pk)}, format='json')
+        self.assertEqual(self.revalidate('/api/recipes/catalog/', etag).status_code, 200)
+
+    def test_unchanged_detail_is_not_modified(self):
+        url = f'/api/recipes/view/{self.recipe.pk}/'
+        self.assertEqual(self.revalidate(url, self.etag(url)).status_code, 304)
+
+    def test_review_changes_detail_etag(self):
+        url = f'/api/recipes/view/{self.recipe.pk}/'
+        etag = self.etag(url)
+        reviewer = Users.objects.create_user(email='other@example.com', username='other', password='pw-12345!x')
+        client = APIClient()
+        client.force_authenticate(reviewer)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/reviews/upload/', {'recipe': str(self.recipe.pk), 'rating': 4, 'comment': 'Good'}, format='json')
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_etags_depend_on_viewer_and_fields(self):
+        url = f'/api/recipes/view/{self.recipe.pk}/'
+        etag = self.etag(url)
+        self.assertNotEqual(self.etag(f'{url}?fields=title'), etag)
+        other = Users.objects.create_user(email='other@example.com', username='other', password='pw-12345!x')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_missing_recipe_is_not_found(self):
+        response = self.revalidate(f'/api/recipes/view/{uuid.uuid4()}/', '*')
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        self.other = Users.objects.create_user(email='other@example.com', username='other', password='pw-12345!x')
+        self.recipes = [make_recipe(self.user, f'Recipe {number}') for number in range(3)]
+        Bookmarks.objects.create(user=self.other, recipe=self.recipes[0])
+
+    def catalog(self, user, query=''):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/api/recipes/catalog/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def bookmarked(self, rows):
+        return {row['recipe_id'] for row in rows if row['is_bookmarked']}
+
+    def test_page_is_shared_and_flags_are_per_user(self):
+        self.assertEqual(self.bookmarked(self.catalog(self.user)), set())
+        with self.assertNumQueries(1): # the other user's bookmark set, the page itself comes from the cache
+            self.assertEqual(self.bookmarked(self.catalog(self.other)), {str(self.recipes[0].pk)})
+
+    def test_bookmark_set_is_loaded_once_per_request(self):
+        with mock.patch('recipes.views.get_bookmarked_ids', wraps=get_bookmarked_ids) as loaded:
+            self.catalog(self.other)
+        self.assertEqual(loaded.call_count, 1)
+
+    def test_cached_rows_carry_no_bookmark_flags(self):
+        pages = []
+        def capture(params, compute):
+            pages.append(get_catalog_page(params, compute))
+            return pages[-1]
+        with mock.patch('recipes.views.get_catalog_page', side_effect=capture):
+            self.assertTrue(self.bookmarked(self.catalog(self.other)))
+        self.assertFalse(self.bookmarked(pages[0]['rows']))
+
+    def test_review_refreshes_cached_page(self):
+        self.catalog(self.user)
+        client = APIClient()
+        client.force_authenticate(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/reviews/upload/', {'recipe': str(self.recipes[1].pk), 'rating': 4, 'comment': 'Good'}, format='json')
+        ratings = {row['recipe_id']: row['average_rating'] for row in self.catalog(self.user)}
+        self.assertEqual(ratings[str(self.recipes[1].pk)], 4.0)
+
+    def test_sparse_fields_are_cached_separately(self):
+        self.catalog(self.user)
+        rows = self.catalog(self.user, '?fields=title')
+        self.assertEqual(set(rows[0]), {'recipe_id', 'title'}) # the id always comes along
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        self.recipe = make_recipe(self.user, 'Dal', description='Lentils, slowly', cuisine='Indian')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_fields_keeps_only_those(self):
+        row = self.get('/api/recipes/catalog/?fields=title,time')['results'][0]
+        self.assertEqual(row, {'recipe_id': str(self.recipe.pk), 'title': 'Dal', 'time': 30})
+
+    def test_omit_drops_fields(self):
+        full = self.get('/api/recipes/catalog/')['results'][0]
+        row = self.get('/api/recipes/catalog/?omit=description,image_variants')['results'][0]
+        self.assertEqual(set(full) - set(row), {'description', 'image_variants'})
+
+    def test_unknown_fields_are_ignored(self):
+        row = self.get('/api/recipes/catalog/?fields=title,nonsense')['results'][0]
+        self.assertEqual(set(row), {'recipe_id', 'title'})
+
+    def test_unrequested_columns_are_not_selected(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get('/api/recipes/uploaded/?fields=title')
+        recipe_queries = [query['sql'] for query in queries if 'FROM "Recipes"' in query['sql']]
+        self.assertTrue(recipe_queries)
+        self.assertNotIn('"description"', recipe_queries[0])
+        self.assertNotIn('"ingredients"', recipe_queries[0])
+
+    def test_detail_without_reviews_skips_their_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            detail = self.get(f'/api/recipes/view/{self.recipe.pk}/?fields=title,ingredients')
+        self.assertEqual(set(detail), {'recipe_id', 'title', 'ingredients'})
+        self.assertFalse([query for query in queries if 'FROM "Reviews"' in query['sql']])
+
+    def test_bookmarks_listing_supports_fields(self):
+        Bookmarks.objects.create(user=self.user, recipe=self.recipe)
+        row = self.get('/api/recipes/bookmarks/?fields=title,is_bookmarked')['results'][0]
+        self.assertEqual(row, {'recipe_id': str(self.recipe.pk), 'title': 'Dal', 'is_bookmarked': True})
+
+
+class CatalogRowSerializerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        self.recipes = [
+            make_recipe(self.user, 'Dal', cuisine='Indian', course='Main', diet='Vegetarian', image='http://example.com/dal.jpg'),
+            make_recipe(self.user, 'Toast', image=None),
+            make_recipe(self.user, 'Soup', cuisine='Thai', image_variants={'webp': {'320': 'images/ab/abc/320w-q80.webp'}}),
+        ]
+        Recipes.objects.filter(pk=self.recipes[0].pk).update(average_rating=4.5, review_count=2, rating_sum=9)
+        Bookmarks.objects.create(user=self.user, recipe=self.recipes[2])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def model_serializer_rows(self, query=''):
+        # what RecipeCatalogSerializer renders for the same recipes, through the same JSON renderer
+        request = Request(APIRequestFactory().get(f'/api/recipes/catalog/{query}'))
+        request.user = self.user
+        recipes = Recipes.objects.select_related('user').order_by('-upload_date', '-recipe_id')
+        context = {'request': request, 'bookmarked_ids': get_bookmarked_ids(self.user)}
+        return json.loads(JSONRenderer().render(RecipeCatalogSerializer(recipes, many=True, context=context).data))
+
+    def endpoint_rows(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_catalog_matches_model_serializer(self):
+        self.assertEqual(self.endpoint_rows('/api/recipes/catalog/'), self.model_serializer_rows())
+
+    def test_key_order_matches(self):
+        self.assertEqual(list(self.endpoint_rows('/api/recipes/catalog/')[0]), RecipeCatalogSerializer.Meta.fields)
+
+    def test_sparse_fields_match(self):
+        self.assertEqual(self.endpoint_rows('/api/recipes/catalog/?fields=title,tags,author'), self.model_serializer_rows('?fields=title,tags,author'))
+        self.assertEqual(self.endpoint_rows('/api/recipes/catalog/?omit=image,time'), self.model_serializer_rows('?omit=image,time'))
+
+    def test_uploaded_matches_model_serializer(self):
+        self.assertEqual(self.endpoint_rows('/api/recipes/uploaded/'), self.model_serializer_rows())
+
+    def test_no_queries_per_row(self):
+        for number in range(5):
+            make_recipe(self.user, f'More {number}')
+        with self.assertNumQueries(2): # the recipe rows, and the viewer's bookmark set
+            self.endpoint_rows('/api/recipes/uploaded/')
+
+
+class TimeFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        self.quick = make_recipe(self.user, 'Quick', prep_time=datetime.time(0, 5), cook_time=datetime.time(0, 5))
+        self.medium = make_recipe(self.user, 'Medium', cuisine='Indian', diet='Vegetarian')
+        self.slow = make_recipe(self.user, 'Slow', prep_time=datetime.time(1, 0), cook_time=datetime.time(2, 30))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def titles(self, query):
+        response = self.client.get(f'/api/recipes/catalog/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.json()['results']]
+
+    def test_total_time_and_tags_are_stored(self):
+        self.assertEqual(
+            list(Recipes.objects.order_by('total_time_minutes').values_list('total_time_minutes', 'tags')),
+            [(10, []), (30, ['Indian', 'Vegetarian']), (210, [])],
+        )
+
+    def test_tags_are_trimmed_and_case_folded(self):
+        recipe = make_recipe(self.user, 'Messy', cuisine='  indian ', course='MAIN   COURSE', diet='\t')
+        self.assertEqual(recipe.tags, ['Indian', 'Main Course'])
+        self.assertEqual(get_tags('non-vegetarian', None, 'Gluten-Free'), ['Non-Vegetarian', 'Gluten-Free'])
+
+    def test_min_and_max_time(self):
+        self.assertEqual(sorted(self.titles('max_time=30')), ['Medium', 'Quick'])
+        self.assertEqual(sorted(self.titles('min_time=30')), ['Medium', 'Slow'])
+        self.assertEqual(self.titles('min_time=11&max_time=60'), ['Medium'])
+
+    def test_sort_by_time(self):
+        self.assertEqual(self.titles('sort=time'), ['Quick', 'Medium', 'Slow'])
+
+    def test_sort_by_time_pages(self):
+        first = self.client.get('/api/recipes/catalog/?sort=time&page_size=2').json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['title'] for row in first['results'] + second['results']], ['Quick', 'Medium', 'Slow'])
+
+    def test_invalid_values_are_rejected(self):
+        for query in ('min_time=soon', 'max_time=-5', 'sort=rating'):
+            self.assertEqual(self.client.get(f'/api/recipes/catalog/?{query}').status_code, 400)
+
+    def test_edit_updates_stored_columns(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/recipes/edit/{self.quick.pk}/', {'cook_time': '01:00:00', 'course': 'Snack'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.quick.refresh_from_db()
+        self.assertEqual((self.quick.total_time_minutes, self.quick.tags), (65, ['Snack']))
+        self.assertEqual(self.titles('max_time=30'), ['Medium'])
+
+
+class BenchmarkSuiteTests(TestCase):
+    def command(self):
+        return benchmark_api.Command(stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_every_named_url_has_a_budget(self):
+        self.command().check_coverage()
+
+    def test_missing_budget_is_an_error(self):
+        endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.name != 'recipe-facets']
+        with mock.patch.object(benchmark_api, 'ENDPOINTS', endpoints):
+            with self.assertRaisesMessage(CommandError, 'recipe-facets'):
+                self.command().check_coverage()
+
+    def test_percentile(self):
+        self.assertEqual(benchmark_api.percentile([5, 1, 4, 2, 3], 0.5), 3)
+        self.assertEqual(benchmark_api.percentile([5, 1, 4, 2, 3], 0.95), 5)
+        self.assertEqual(benchmark_api.percentile([7], 0.95), 7)
+
+    def test_endpoints_stay_within_their_budgets(self):
+        cache.clear()
+        with tempfile.TemporaryDirectory() as media_root:
+            images = {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media_root}}
+            with override_settings(STORAGES={**settings.STORAGES, 'images': images}):
+                report = self.command().run_suite(ENDPOINTS, {
+                    'recipes': 30, 'users': 4, 'reviews_per_recipe': 2, 'bookmarks_per_user': 3, 'iterations': 1,
+                })
+        self.assertEqual(report['failures'], [])
+        self.assertEqual({result['name'] for result in report['endpoints']}, {endpoint.name for endpoint in ENDPOINTS})
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        make_recipe(self.user, 'Dal')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def timing(self, response):
+        parts = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        return int(re.search(r'desc="(\d+) queries"', parts['db']).group(1))
+
+    def test_server_timing_counts_queries(self):
+        response = self.client.get('/api/recipes/catalog/')
+        self.assertEqual(self.timing(response), 2)
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def remove_recorder(self): # as for connections opened before spice_bazaar.instrumentation was imported
+        for open_connection in connections.all():
+            if record_query in open_connection.execute_wrappers:
+                open_connection.execute_wrappers.remove(record_query)
+
+    async def test_async_requests_count_queries(self):
+        await sync_to_async(self.remove_recorder)() # on the thread the async ORM runs its queries in
+        client = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        response = await client.get('/api/recipes/async/catalog/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.timing(response), 0)
+
+    def test_request_line_is_logged_at_debug(self):
+        with self.assertLogs('spice_bazaar.performance', 'DEBUG') as logs:
+            self.client.get('/api/recipes/catalog/')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((logs.records[0].levelname, line['view'], line['queries']), ('DEBUG', 'catalog', 2))
+
+    def test_nothing_is_logged_at_the_default_level(self):
+        with self.assertNoLogs('spice_bazaar.performance', 'INFO'):
+            self.client.get('/api/recipes/catalog/')
+
+    def test_metrics_are_exported(self):
+        self.client.get('/api/recipes/catalog/')
+        response = self.client.get('/metrics', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('spice_bazaar_sql_queries_total{view="catalog",method="GET",status="2xx"}', response.content.decode())
+
+    def test_metrics_are_limited_to_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        other = Users.objects.create_user(email='other@example.com', username='other', password='pw-12345!x')
+        self.recipes = [make_recipe(self.user, f'Mine {number}', cuisine='Indian') for number in range(3)]
+        self.recipes += [make_recipe(other, f'Theirs {number}', cuisine='Thai') for number in range(3)]
+        Bookmarks.objects.create(user=self.user, recipe=self.recipes[1])
+        Bookmarks.objects.create(user=self.user, recipe=self.recipes[4])
+        self.detailed = self.recipes[4]
+        Reviews.objects.create(user=self.user, recipe=self.detailed, rating=5, comment='Mine')
+        Reviews.objects.create(user=other, recipe=self.detailed, rating=3, comment='Theirs')
+        self.client = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    async def assertSameResponse(self, path):
+        sync_response = await self.client.get(f'/api/recipes/{path}')
+        async_response = await self.client.get(f'/api/recipes/async/{path}')
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # pagination links point back at the endpoint they came from
+        self.assertEqual(async_response.content.decode().replace('/async/', '/'), sync_response.content.decode())
+        return async_response
+
+    async def test_catalog(self):
+        response = await self.assertSameResponse('catalog/?page_size=4')
+        self.assertIsNotNone(response.json()['next'])
+
+    async def test_catalog_next_page_with_filters_and_fields(self):
+        first = (await self.client.get('/api/recipes/catalog/?page_size=1&cuisine=Thai&fields=title,is_bookmarked')).json()
+        await self.assertSameResponse(first['next'].split('/api/recipes/', 1)[1])
+
+    async def test_uploaded(self):
+        await self.assertSameResponse('uploaded/')
+
+    async def test_bookmarks(self):
+        await self.assertSameResponse('bookmarks/?omit=description')
+
+    async def test_detail(self):
+        response = await self.assertSameResponse(f'view/{self.detailed.pk}/')
+        detail = response.json()
+        self.assertEqual((detail['your_review']['comment'], len(detail['reviews']), detail['is_bookmarked']), ('Mine', 1, True))
+
+    async def test_detail_sparse_fields(self):
+        await self.assertSameResponse(f'view/{self.detailed.pk}/?fields=title,reviews')
+        await self.assertSameResponse(f'view/{self.detailed.pk}/?omit=reviews,your_review,reviews_next')
+
+    async def test_detail_not_found(self):
+        await self.assertSameResponse(f'view/{uuid.uuid4()}/')
+
+    async def test_detail_not_modified(self):
+        response = await self.client.get(f'/api/recipes/async/view/{self.detailed.pk}/')
+        revalidated = await self.client.get(f'/api/recipes/async/view/{self.detailed.pk}/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+    async def test_unauthenticated(self):
+        self.client = AsyncClient()
+        response = await self.assertSameResponse('catalog/')
+        self.assertEqual(response.status_code, 401)
+
+
+class ConnectionSettingsTests(TestCase):
+    def conn_max_age(self, entry_module, **env):
+        environ = {name: value for name, value in os.environ.items() if name not in ('DB_CONN_MAX_AGE', 'DB_POOL')}
+        code = f'import {entry_module}, spice_bazaar.settings as s; print(s.DATABASES["default"]["CONN_MAX_AGE"])'
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env={**environ, **env}, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return int(result.stdout)
+
+    def test_wsgi_keeps_persistent_connections(self):
+        self.assertEqual(self.conn_max_age('spice_bazaar.wsgi'), 60)
+
+    def test_asgi_closes_connections_after_each_request(self):
+        self.assertEqual(self.conn_max_age('spice_bazaar.asgi'), 0)
+
+    def test_asgi_honours_an_explicit_max_age(self):
+        self.assertEqual(self.conn_max_age('spice_bazaar.asgi', DB_CONN_MAX_AGE='30'), 30)
+
+
+def png_bytes(size=(32, 24)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@skipIf(Image is None, 'Pillow is not installed')
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        images = {'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': media.name, 'base_url': '/media/'}}
+        overrides = override_settings(STORAGES={**settings.STORAGES, 'images': images}, IMAGE_VARIANT_WIDTHS=[8, 16], IMAGE_VARIANT_FORMATS=['webp'])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = Users.objects.create_user(email='cook@example.com', username='cook', password='pw-12345!x')
+        self.asset = store_image(png_bytes())
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self):
+        response = self.client.post('/api/recipes/upload/', {**RECIPE_UPLOAD, 'image': self.asset.url}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipes.objects.get(pk=response.json()['recipe_id'])
+
+    def variants_made_meanwhile(self):
+        # the background thread publishes the variants after the serializer read the asset as pending, before the
+        # recipe row exists (in production: before it is committed), so its UPDATE misses the recipe
+        def fields(url):
+            result = image_fields(url)
+            make_variants(ImageAsset.objects.get(pk=self.asset.pk))
+            return result
+        return mock.patch('recipes.serializers.image_fields', side_effect=fields)
+
+    def variants(self, recipe):
+        return Recipes.objects.get(pk=recipe.pk).image_variants
+
+    def test_upload_links_variants_made_before_its_commit(self):
+        with self.variants_made_meanwhile(), self.captureOnCommitCallbacks() as callbacks:
+            recipe = self.upload()
+        self.assertEqual(self.variants(recipe), {})
+        for callback in callbacks:
+            callback()
+        self.assertEqual(set(self.variants(recipe)['webp']), {'8', '16'})
+
+    def test_edit_links_variants_made_before_its_commit(self):
+        recipe = make_recipe(self.user, 'No image yet')
+        with self.variants_made_meanwhile(), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/recipes/edit/{recipe.pk}/', {'image': self.asset.url}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.variants(recipe)['webp']), {'8', '16'})
+
+    def test_variants_made_later_reach_saved_recipes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.upload()
+        self.assertEqual(self.variants(recipe), {})
+        self.assertEqual(make_variants(self.asset), ImageAsset.READY)
+        self.assertEqual(Recipes.objects.get(pk=recipe.pk).version, recipe.version + 1)
+        detail = self.client.get(f'/api/recipes/view/{recipe.pk}/').json()
+        self.assertEqual(set(detail['image_variants']['webp']), {'8', '16'})
+
+    def test_listings_are_invalidated_after_the_commit(self):
+        generation = get_generation('recipes')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_variants(self.asset)
+            self.assertEqual(get_generation('recipes'), generation)
+        self.assertNotEqual(get_generation('recipes'), generation)
+
+    def test_process_images_repairs_recipes_that_missed_their_variants(self):
+        make_variants(self.asset)
+        recipe = make_recipe(self.user, 'Missed', image=self.asset.url, image_asset=self.asset)
+        out = io.StringIO()
+        call_command('process_images', stdout=out)
+        self.assertIn('updated 1 recipes', out.getvalue())
+        self.assertEqual(set(self.variants(recipe)['webp']), {'8', '16'})
+
+    def test_process_images_pages_past_assets_created_together(self):
+        created_at = self.asset.created_at
+        for _ in range(2):
+            ImageAsset.objects.create(url=f'https://example.com/{uuid.uuid4()}.png', digest='0' * 64, original='none')
+        ImageAsset.objects.update(created_at=created_at)
+        with mock.patch('recipes.management.commands.process_images.make_variants', return_value=ImageAsset.FAILED) as make:
+            call_command('process_images', '--batch-size=1', stdout=io.StringIO())
+        self.assertEqual(sorted(call.args[0].pk for call in make.call_args_list), sorted(ImageAsset.objects.values_list('pk', flat=True)))
+
+    def test_remote_fetch_connects_to_the_checked_address(self):
+        # a second lookup could answer with an internal address, so the connection must not resolve the name again
+        public = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('93.184.216.34', 80))]
+        with mock.patch('socket.getaddrinfo', return_value=public) as getaddrinfo, \
+                mock.patch('socket.create_connection', side_effect=ConnectionRefusedError) as create_connection:
+            with self.assertRaises(OSError):
+                fetch_remote('http://images.example.com/dal.png')
+        self.assertEqual(getaddrinfo.call_count, 1)
+        self.assertEqual(create_connection.call_args.args[0], ('93.184.216.34', 80))
+
+    def test_pinned_connection_keeps_the_host_header(self):
+        hosts = []
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                hosts.append(self.headers['Host'])
+                self.send_response(204)
+                self.end_headers()
+            def log_message(self, *args):
+                pass
+        server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.handle_request, daemon=True).start()
+        self.addCleanup(server.server_close)
+        connection = PinnedHTTPConnection('images.example.com', server.server_port, address='127.0.0.1', timeout=5)
+        connection.request('GET', '/dal.png')
+        self.assertEqual(connection.getresponse().status, 204)
+        self.assertEqual(hosts, [f'images.example.com:{server.server_port}'])
+
+    def test_pending_and_failed_assets_are_not_linked(self):
+        make_recipe(self.user, 'Waiting', image=self.asset.url, image_asset=self.asset)
+        self.assertEqual(link_variants(self.asset.pk), 0)
+        ImageAsset.objects.filter(pk=self.asset.pk).update(status=ImageAsset.FAILED)
+        self.assertEqual(link_variants(self.asset.pk), 0)
@@ -1,12 +1,23 @@
 from django.urls import path
-from .views import RecipeCatalogView, UserRecipesView, BookmarkedRecipesView, RecipeViewView, RecipeUploadView, RecipeEditView, RecipeDeleteView
+from .async_views import AsyncRecipeCatalogView, AsyncUserRecipesView, AsyncBookmarkedRecipesView, AsyncRecipeViewView
+from .views import RecipeCatalogView, UserRecipesView, BookmarkedRecipesView, RecipeSearchView, RecipeFacetsView, RecipeBatchView, RecipeViewView, RecipeUploadView, RecipeEditView, RecipeDeleteView, ImageUploadView
 
 urlpatterns = [
     path('catalog/', RecipeCatalogView.as_view(), name='catalog'),
     path('uploaded/', UserRecipesView.as_view(), name='uploaded-recipes'),
     path('bookmarks/', BookmarkedRecipesView.as_view(), name='bookmarked-recipes'),
+    path('search/', RecipeSearchView.as_view(), name='search-recipes'),
+    path('facets/', RecipeFacetsView.as_view(), name='recipe-facets'),
+    path('batch/', RecipeBatchView.as_view(), name='recipe-batch'),
     path('view/<uuid:recipe_id>/', RecipeViewView.as_view(), name='view-recipe'),
     path('upload/', RecipeUploadView.as_view(), name='upload-recipe'),
     path('edit/<uuid:recipe_id>/', RecipeEditView.as_view(), name='edit-recipe'),
     path('delete/<uuid:recipe_id>/', RecipeDeleteView.as_view(), name='delete-recipe'),
+    path('images/upload/', ImageUploadView.as_view(), name='upload-image'),
+
+    # async read path, same responses as the views above (see recipes/async_views.py)
+    path('async/catalog/', AsyncRecipeCatalogView.as_view(), name='async-catalog'),
+    path('async/uploaded/', AsyncUserRecipesView.as_view(), name='async-uploaded-recipes'),
+    path('async/bookmarks/', AsyncBookmarkedRecipesView.as_view(), name='async-bookmarked-recipes'),
+    path('async/view/<uuid:recipe_id>/', AsyncRecipeViewView.as_view(), name='async-view-recipe'),
 ]
\ No newline at end of file
@@ -1,71 +1,122 @@
 from rest_framework import generics
+from rest_framework.views import APIView
+from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Exists, OuterRef, Value, Avg, Case, When, F, FloatField, Q
+from rest_framework.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Value
 
 from .models import Recipes
+from .pagination import RecipeCursorPagination, RecipeSearchPagination
+from .search import search_recipes
+from .filters import get_facet_filters, apply_facet_filters, count_facets, get_time_filters, apply_time_filters, get_recipe_ids
+from .cache import get_facet_counts, get_catalog_page, invalidate_recipe_listings
+from .etags import RecipeListETagMixin, RecipeDetailETagMixin
+from .images import schedule_variants
 from users.models import Bookmarks
-from .serializers import RecipeCatalogSerializer, RecipeViewSerializer, RecipeUploadSerializer, RecipeEditSerializer, RecipeDeleteSerializer
+from spice_bazaar.db_router import ReplicaReadMixin
+from users.cache import get_bookmarked_ids
+from users.counters import adjust_counters
+from .serializers import RecipeCatalogRowSerializer, RecipeViewSerializer, RecipeUploadSerializer, RecipeEditSerializer, RecipeDeleteSerializer, ImageUploadSerializer
 
-class RecipeCatalogView(generics.ListAPIView):
+class BookmarkedIdsMixin: # is_bookmarked is looked up in the user's cached bookmark set instead of a per-row subquery
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['bookmarked_ids'] = get_bookmarked_ids(self.request.user)
+        return context
+
+class SparseColumnsMixin: # with ?fields= / ?omit= only the columns the kept serializer fields read are selected
+    always_columns = ('recipe_id', 'upload_date') # primary key and the default keyset ordering columns
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        columns = serializer_class.get_columns(self.request)
+        columns.update(self.always_columns)
+        columns.update(field.lstrip('-') for field in getattr(self, 'keyset_ordering', None) or ())
+
+        if getattr(serializer_class, 'values_rows', False):
+            # plain rows for RecipeCatalogRowSerializer, annotations the serializer reads come along
+            columns.update(name for name in queryset.query.annotations if name in serializer_class.Meta.fields)
+            return queryset.values(*columns)
+
+        if 'user__username' in columns:
+            columns.add('user') # select_related needs the foreign key itself loaded
+            return queryset.select_related('user').only(*columns)
+        return queryset.select_related(None).only(*columns)
+
+class RecipeCatalogView(ReplicaReadMixin, SparseColumnsMixin, RecipeListETagMixin, BookmarkedIdsMixin, generics.ListAPIView):
 
     # queryset = Recipes.objects.all().order_by('-upload_date').select_related('user') 
-    serializer_class = RecipeCatalogSerializer
+    serializer_class = RecipeCatalogRowSerializer # values() fast path, same output as RecipeCatalogSerializer
+    pagination_class = RecipeCursorPagination
     permission_classes = [IsAuthenticated]
+    etag_needs_primary = False # pages come from get_catalog_page, which fills the cache on the primary
+
+    sort_orderings = {
+        'newest': RecipeCursorPagination.ordering,
+        'time': ('total_time_minutes', 'recipe_id'), # quickest first, on the stored prep + cook minutes
+    }
+
+    @property
+    def keyset_ordering(self): # ?sort=time, read by the paginator
+        sort = self.request.query_params.get('sort', 'newest')
+        if sort not in self.sort_orderings:
+            raise ValidationError({"sort": f"Must be one of: {', '.join(self.sort_orderings)}."})
+        return self.sort_orderings[sort]
 
     def get_queryset(self):
-        user = self.request.user
-        
-        # Create bookmark subquery
-        bookmark_exists = Exists(
-            Bookmarks.objects.filter(
-                user=user,
-                recipe=OuterRef('pk')
-            )
-        )
-        
-        # Return annotated queryset with both bookmark status AND average rating
-        return Recipes.objects.annotate(
-            is_bookmarked=bookmark_exists,
-            average_rating=Avg(
-                'reviews__rating',  # Calculate average from related reviews
-                filter=Q(reviews__rating__isnull=False)  # Only include non-null ratings
-            )
-        ).annotate(
-            # Handle null values (recipes with no reviews)
-            average_rating=Case(
-                When(average_rating__isnull=True, then=Value(0)),
-                default=F('average_rating'),
-                output_field=FloatField()
-            )
-        ).order_by('-upload_date').select_related('user')
-
-class UserRecipesView(generics.ListAPIView): # for getting a particular user's recipes, used to check your own uploaded recipes
-    serializer_class = RecipeCatalogSerializer
+        # optional ?cuisine= / ?course= / ?diet= and ?min_time= / ?max_time= filters, see recipes/filters.py
+        recipes = apply_facet_filters(Recipes.objects.all(), get_facet_filters(self.request.query_params))
+        recipes = apply_time_filters(recipes, get_time_filters(self.request.query_params))
+
+        # average_rating is stored on the recipe (see reviews/aggregates.py) and is_bookmarked comes from BookmarkedIdsMixin
+        return recipes.order_by(*self.keyset_ordering).select_related('user')
+
+    def list(self, request, *args, **kwargs):
+        # pages are cached without the viewer's bookmark flags, which are merged in per request
+        paginator = self.paginator
+        params = {
+            'cursor': request.query_params.get(paginator.cursor_query_param),
+            'page_size': paginator.get_page_size(request),
+            'filters': get_facet_filters(request.query_params),
+            'time': get_time_filters(request.query_params),
+            'ordering': self.keyset_ordering,
+            'fields': request.query_params.get('fields'),
+            'omit': request.query_params.get('omit'),
+        }
+
+        def build_page():
+            page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+            # the shared rows get no bookmark set, so they skip BookmarkedIdsMixin's context (get_serializer() builds it even when given one)
+            context = {**super(BookmarkedIdsMixin, self).get_serializer_context(), 'bookmarked_ids': frozenset()}
+            serializer = self.get_serializer_class()(page, many=True, context=context)
+            return {
+                'rows': list(serializer.data),
+                'next': paginator.get_next_cursor(),
+                'previous': paginator.get_previous_cursor(),
+            }
+
+        page = get_catalog_page(params, build_page)
+        bookmarked_ids = {str(recipe_id) for recipe_id in get_bookmarked_ids(request.user)}
+        results = [
+            {**row, 'is_bookmarked': row['recipe_id'] in bookmarked_ids} if 'is_bookmarked' in row else row
+            for row in page['rows']
+        ]
+        return paginator.get_cursor_response(request, results, page['next'], page['previous'])
+
+class UserRecipesView(ReplicaReadMixin, SparseColumnsMixin, RecipeListETagMixin, BookmarkedIdsMixin, generics.ListAPIView): # for getting a particular user's recipes, used to check your own uploaded recipes
+    serializer_class = RecipeCatalogRowSerializer
+    pagination_class = RecipeCursorPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        
-        bookmark_exists = Exists(
-            Bookmarks.objects.filter(
-                user=user,
-                recipe=OuterRef('pk')
-            )
-        )
-        
-        return Recipes.objects.filter(user=user).annotate(
-            is_bookmarked=bookmark_exists,
-            average_rating=Avg('reviews__rating', filter=Q(reviews__rating__isnull=False))
-        ).annotate(
-            average_rating=Case(
-                When(average_rating__isnull=True, then=Value(0)),
-                default=F('average_rating'),
-                output_field=FloatField()
-            )
-        ).order_by('-upload_date').select_related('user')
+        return Recipes.objects.filter(user=user).order_by('-upload_date', '-recipe_id').select_related('user')
     
-class BookmarkedRecipesView(generics.ListAPIView): # for getting a particular user's bookmarked recipes
-    serializer_class = RecipeCatalogSerializer
+class BookmarkedRecipesView(ReplicaReadMixin, SparseColumnsMixin, RecipeListETagMixin, generics.ListAPIView): # for getting a particular user's bookmarked recipes
+    serializer_class = RecipeCatalogRowSerializer
+    pagination_class = RecipeCursorPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -73,33 +124,85 @@ class BookmarkedRecipesView(generics.ListAPIView): # for getting a particular us
         bookmarked_recipes = Bookmarks.objects.filter(user=user).values_list('recipe_id', flat=True)
         
         return Recipes.objects.filter(recipe_id__in=bookmarked_recipes).annotate(
-            is_bookmarked=Value(True),
-            average_rating=Avg('reviews__rating', filter=Q(reviews__rating__isnull=False))
-        ).annotate(
-            average_rating=Case(
-                When(average_rating__isnull=True, then=Value(0)),
-                default=F('average_rating'),
-                output_field=FloatField()
-            )
-        ).order_by('-upload_date').select_related('user')
-
-class RecipeViewView(generics.RetrieveAPIView): # for viewing a recipie (any)
+            is_bookmarked=Value(True)
+        ).order_by('-upload_date', '-recipe_id').select_related('user')
+
+class RecipeSearchView(ReplicaReadMixin, SparseColumnsMixin, RecipeListETagMixin, BookmarkedIdsMixin, generics.ListAPIView): # ranked full text search over title, description and ingredients
+    serializer_class = RecipeCatalogRowSerializer
+    pagination_class = RecipeSearchPagination
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        terms = self.request.query_params.get('q', '').strip()
+        if not terms:
+            raise ValidationError({"q": "A search query is required."})
+
+        queryset = apply_facet_filters(Recipes.objects.all(), get_facet_filters(self.request.query_params))
+        queryset = queryset.select_related('user')
+        return search_recipes(queryset, terms)
+
+class RecipeBatchView(ReplicaReadMixin, SparseColumnsMixin, RecipeListETagMixin, BookmarkedIdsMixin, generics.ListAPIView): # catalog rows for ?ids=<uuid>,<uuid>,... in one query
+    serializer_class = RecipeCatalogRowSerializer
+    pagination_class = None
+    permission_classes = [IsAuthenticated]
+    max_ids = 100
+
+    def get_queryset(self):
+        self.recipe_ids = get_recipe_ids(self.request.query_params, self.max_ids)
+        return Recipes.objects.filter(recipe_id__in=self.recipe_ids)
+
+    def list(self, request, *args, **kwargs):
+        rows = self.filter_queryset(self.get_queryset())
+        by_id = {row['recipe_id']: row for row in self.get_serializer(rows, many=True).data}
+        # same order as the ids were asked for, ids without a recipe (deleted, or never existed) are listed separately
+        return Response({
+            'results': [by_id[str(recipe_id)] for recipe_id in self.recipe_ids if str(recipe_id) in by_id],
+            'not_found': [str(recipe_id) for recipe_id in self.recipe_ids if str(recipe_id) not in by_id],
+        })
+
+class RecipeFacetsView(ReplicaReadMixin, APIView): # per-value counts for the cuisine / course / diet filter chips
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        filters = get_facet_filters(request.query_params)
+        return Response(get_facet_counts(filters, count_facets))
+
+class RecipeViewView(ReplicaReadMixin, SparseColumnsMixin, RecipeDetailETagMixin, BookmarkedIdsMixin, generics.RetrieveAPIView): # for viewing a recipie (any)
     serializer_class = RecipeViewSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'recipe_id'
     
-    def get_queryset(self): # Optimizes database queries by prefetching related objects that will be used in the serializer.
-        return Recipes.objects.all().select_related('user').prefetch_related('reviews__user')
+    def get_queryset(self): # reviews are loaded by the serializer as one bounded page, see RecipeViewSerializer.get_review_page
+        return Recipes.objects.all().select_related('user')
 
 class RecipeUploadView(generics.CreateAPIView):
     serializer_class = RecipeUploadSerializer
     permission_classes = [IsAuthenticated]
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            recipe = serializer.save()
+            adjust_counters(recipe.user_id, recipe_count=1)
+        invalidate_recipe_listings()
+    
+class ImageUploadView(generics.CreateAPIView): # stores an image for a recipe, its resized variants are made in the background (recipes/images.py)
+    serializer_class = ImageUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            asset = serializer.save()
+            schedule_variants(asset)
     
 class RecipeEditView(generics.UpdateAPIView): # gives PUT request
     serializer_class = RecipeEditSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'recipe_id'
     queryset = Recipes.objects.all().select_related('user')
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_recipe_listings()
     
 class RecipeDeleteView(generics.DestroyAPIView): # gives DELETE request
     serializer_class = RecipeDeleteSerializer
@@ -107,4 +210,8 @@ class RecipeDeleteView(generics.DestroyAPIView): # gives DELETE request
     lookup_field = 'recipe_id'
     def get_queryset(self):
         # Only return recipes owned by the current user. This ensures users can only delete their own recipes
-        return Recipes.objects.filter(user=self.request.user)
\ No newline at end of file
+        return Recipes.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        instance.delete() # the counters of the owner and of everyone whose bookmarks and reviews go with it follow in users/signals.py
+        invalidate_recipe_listings()
\ No newline at end of file
@@ -0,0 +1,81 @@
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.lookups import GreaterThan
+
+from recipes.models import Recipes
+from recipes.cache import invalidate_review_listings
+from .models import Reviews
+
+RATINGS = (1, 2, 3, 4, 5)
+HISTOGRAM_FIELDS = {rating: f'rating_{rating}_count' for rating in RATINGS}
+
+
+def apply_rating_change(recipe_id, added=None, removed=None):
+    # one UPDATE with F() expressions, so concurrent reviews on the same recipe can't lose increments.
+    # `added` / `removed` are the ratings entering and leaving the recipe (an edit has both)
+    count_delta = (added is not None) - (removed is not None)
+    sum_delta = (added or 0) - (removed or 0)
+    new_count = F('review_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+
+    histogram = {}
+    if added != removed:
+        if added is not None:
+            histogram[HISTOGRAM_FIELDS[added]] = F(HISTOGRAM_FIELDS[added]) + 1
+        if removed is not None:
+            histogram[HISTOGRAM_FIELDS[removed]] = F(HISTOGRAM_FIELDS[removed]) - 1
+
+    Recipes.objects.filter(pk=recipe_id).update(
+        version=F('version') + 1,
+        review_count=new_count,
+        rating_sum=new_sum,
+        average_rating=Case(
+            When(GreaterThan(new_count, 0), then=Cast(new_sum, FloatField()) / new_count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        **histogram,
+    )
+    invalidate_review_listings()
+
+
+def record_review_added(review):
+    apply_rating_change(review.recipe_id, added=review.rating)
+
+
+def record_review_edited(review, old_rating):
+    # still runs when only the comment changed, the recipe version has to move either way
+    apply_rating_change(review.recipe_id, added=review.rating, removed=old_rating)
+
+
+def record_review_removed(review):
+    apply_rating_change(review.recipe_id, removed=review.rating)
+
+
+def get_histogram(recipe):
+    # works for model instances and values() rows alike
+    get = recipe.get if isinstance(recipe, dict) else lambda field: getattr(recipe, field)
+    return {str(rating): get(field) for rating, field in HISTOGRAM_FIELDS.items()}
+
+
+def rebuild_rating_aggregates(queryset=None):
+    # recomputes the stored stats from the Reviews table, used by the reconcile_counters command
+    queryset = Recipes.objects.all() if queryset is None else queryset
+    reviews = Reviews.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+
+    def aggregate(expression):
+        return Coalesce(Subquery(reviews.annotate(value=expression).values('value')), 0)
+
+    updated = queryset.update(
+        review_count=aggregate(Count('pk')),
+        rating_sum=aggregate(Sum('rating')),
+        **{field: aggregate(Count('pk', filter=Q(rating=rating))) for rating, field in HISTOGRAM_FIELDS.items()},
+    )
+    queryset.update(
+        average_rating=Case(
+            When(review_count__gt=0, then=Cast(F('rating_sum'), FloatField()) / F('review_count')),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+    return updated
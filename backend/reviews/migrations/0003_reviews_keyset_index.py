@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipes_version'),
+        ('reviews', '0002_alter_reviews_rating'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reviews',
+            index=models.Index(fields=['recipe', 'review_date', 'review_id'], name='reviews_recipe_keyset_idx'),
+        ),
+    ]
@@ -15,4 +15,8 @@ class Reviews(models.Model):
     
     class Meta:
         db_table = 'Reviews'
-        verbose_name_plural = "Reviews"
\ No newline at end of file
+        verbose_name_plural = "Reviews"
+        indexes = [
+            # keyset pagination of a recipe's reviews, see reviews/pagination.py
+            models.Index(fields=['recipe', 'review_date', 'review_id'], name='reviews_recipe_keyset_idx'),
+        ]
\ No newline at end of file
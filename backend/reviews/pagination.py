@@ -0,0 +1,7 @@
+from recipes.pagination import KeysetPagination
+
+
+class ReviewCursorPagination(KeysetPagination): # newest first, review_id breaks ties between reviews from the same day
+    ordering = ('-review_date', '-review_id')
+    page_size = 10
+    max_page_size = 50
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from recipes.models import Recipes
+from recipes.signals import deleted_with
+from .aggregates import record_review_removed
+from .models import Reviews
+
+
+@receiver(post_delete, sender=Reviews)
+def review_deleted(sender, instance, origin=None, **kwargs):
+    # the delete view, QuerySet.delete(), the admin, or cascading from the reviewer's account
+    if not deleted_with(origin, Recipes, instance.recipe_id): # the recipe goes too, nothing to keep in step
+        record_review_removed(instance)
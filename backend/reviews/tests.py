@@ -1,3 +1,222 @@
-from django.test import TestCase
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipes
+from recipes.tests import make_recipe
+from users.counters import adjust_counters
+from users.models import Users
+from .aggregates import rebuild_rating_aggregates, record_review_added
+from .models import Reviews
+from .pagination import ReviewCursorPagination
+
+
+def make_user(name):
+    return Users.objects.create_user(email=f'{name}@example.com', username=name, password='pw-12345!x')
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('owner')
+        self.reviewers = [make_user(f'reviewer{number}') for number in range(3)]
+        self.recipe = make_recipe(self.owner, 'Dal')
+        self.other_recipe = make_recipe(self.owner, 'Rice')
+
+    def review(self, user, rating, recipe=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/reviews/upload/', {
+            'recipe': str((recipe or self.recipe).pk), 'rating': rating, 'comment': 'Tasty',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Reviews.objects.get(pk=response.json()['review_id'])
+
+    def stats(self, recipe=None):
+        recipe = Recipes.objects.get(pk=(recipe or self.recipe).pk)
+        histogram = [getattr(recipe, f'rating_{rating}_count') for rating in range(1, 6)]
+        return recipe.review_count, recipe.rating_sum, recipe.average_rating, histogram
+
+    def assertStoredMatchRebuilt(self):
+        stored = [self.stats(recipe) for recipe in (self.recipe, self.other_recipe)]
+        rebuild_rating_aggregates()
+        self.assertEqual([self.stats(recipe) for recipe in (self.recipe, self.other_recipe)], stored)
+
+    def test_reviews_update_stats(self):
+        self.review(self.reviewers[0], 5)
+        self.review(self.reviewers[1], 2)
+        self.assertEqual(self.stats(), (2, 7, 3.5, [0, 1, 0, 0, 1]))
+
+    def test_edit_moves_rating(self):
+        review = self.review(self.reviewers[0], 5)
+        client = APIClient()
+        client.force_authenticate(self.reviewers[0])
+        response = client.put(f'/api/reviews/edit/{review.pk}/', {'rating': 3, 'comment': 'Fine'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stats(), (1, 3, 3.0, [0, 0, 1, 0, 0]))
+
+    def test_delete_view_removes_rating(self):
+        review = self.review(self.reviewers[0], 4)
+        self.review(self.reviewers[1], 2)
+        client = APIClient()
+        client.force_authenticate(self.reviewers[0])
+        self.assertEqual(client.delete(f'/api/reviews/delete/{review.pk}/').status_code, 204)
+        self.assertEqual(self.stats(), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+
+    def test_last_review_removed_resets_average(self):
+        self.review(self.reviewers[0], 4).delete()
+        self.assertEqual(self.stats(), (0, 0, 0.0, [0, 0, 0, 0, 0]))
+
+    def test_deleting_reviewer_removes_their_ratings(self):
+        self.review(self.reviewers[0], 1)
+        self.review(self.reviewers[0], 5, recipe=self.other_recipe)
+        self.review(self.reviewers[1], 3)
+        self.reviewers[0].delete()
+        self.assertEqual(self.stats(), (1, 3, 3.0, [0, 0, 1, 0, 0]))
+        self.assertEqual(self.stats(self.other_recipe)[0], 0)
+        self.assertStoredMatchRebuilt()
+
+    def test_queryset_delete_removes_ratings(self):
+        for reviewer, rating in zip(self.reviewers, (1, 2, 5)):
+            self.review(reviewer, rating)
+        Reviews.objects.filter(rating__lt=3).delete()
+        self.assertEqual(self.stats(), (1, 5, 5.0, [0, 0, 0, 0, 1]))
+
+    def test_bulk_user_delete_removes_ratings(self):
+        for reviewer, rating in zip(self.reviewers, (1, 2, 5)):
+            self.review(reviewer, rating)
+        Users.objects.filter(pk__in=[self.reviewers[0].pk, self.reviewers[2].pk]).delete()
+        self.assertEqual(self.stats(), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+        self.assertStoredMatchRebuilt()
+
+    def test_deleting_recipe_leaves_other_recipes_alone(self):
+        self.review(self.reviewers[0], 4)
+        self.review(self.reviewers[0], 2, recipe=self.other_recipe)
+        with CaptureQueriesContext(connection) as queries:
+            Recipes.objects.filter(pk=self.recipe.pk).delete()
+        # the deleted recipe's own stats aren't updated on the way out
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "Recipes"')])
+        self.assertEqual(self.stats(self.other_recipe), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']) # many reviewers, none of them logs in
+class ReviewPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = make_user('viewer')
+        self.recipe = make_recipe(self.viewer, 'Dal')
+        self.others = [
+            self.add_review(make_user(f'reviewer{number}'), f'Review {number}')
+            for number in range(13)
+        ]
+        self.own = self.add_review(self.viewer, 'Mine')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def add_review(self, user, comment):
+        review = Reviews.objects.create(user=user, recipe=self.recipe, rating=4, comment=comment)
+        record_review_added(review)
+        adjust_counters(user.pk, review_count=1)
+        return review
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def detail(self):
+        return self.get(f'/api/recipes/view/{self.recipe.pk}/')
+
+    def test_detail_holds_one_page_of_reviews(self):
+        detail = self.detail()
+        self.assertEqual(len(detail['reviews']), ReviewCursorPagination.page_size)
+        self.assertEqual(detail['your_review']['review_id'], str(self.own.pk))
+        self.assertIsNotNone(detail['reviews_next'])
+
+    def test_next_link_continues_after_the_detail_page(self):
+        detail = self.detail()
+        rest = self.get(detail['reviews_next'])
+        ids = [review['review_id'] for review in detail['reviews'] + rest['results']]
+        self.assertEqual(sorted(ids), sorted(str(review.pk) for review in self.others))
+        self.assertIsNone(rest['next'])
+
+    def test_endpoint_leaves_out_the_viewers_review(self):
+        ids, url = [], f'/api/reviews/recipe/{self.recipe.pk}/?page_size=5'
+        while url:
+            page = self.get(url)
+            ids += [review['review_id'] for review in page['results']]
+            url = page['next']
+        self.assertEqual(len(ids), 13)
+        self.assertNotIn(str(self.own.pk), ids)
+
+    def test_unknown_recipe_is_not_found(self):
+        response = self.client.get(f'/api/reviews/recipe/{uuid.uuid4()}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), self.client.get(f'/api/recipes/view/{uuid.uuid4()}/').json())
+
+    def test_recipe_without_other_reviews_is_an_empty_page(self):
+        recipe = make_recipe(self.viewer, 'Rice')
+        self.assertEqual(self.get(f'/api/reviews/recipe/{recipe.pk}/')['results'], [])
+
+    def test_page_size_is_capped(self):
+        page = self.get(f'/api/reviews/recipe/{self.recipe.pk}/?page_size=1000')
+        self.assertEqual(len(page['results']), 13)
+        with mock.patch.object(ReviewCursorPagination, 'max_page_size', 4):
+            self.assertEqual(len(self.get(f'/api/reviews/recipe/{self.recipe.pk}/?page_size=1000')['results']), 4)
+
+    def test_few_reviews_have_no_next_link(self):
+        Reviews.objects.filter(pk__in=[review.pk for review in self.others[3:]]).delete()
+        detail = self.detail()
+        self.assertEqual(len(detail['reviews']), 3)
+        self.assertIsNone(detail['reviews_next'])
+
+    def test_detail_review_queries_are_bounded(self):
+        self.detail()
+        for number in range(5):
+            self.add_review(make_user(f'late{number}'), 'Late')
+        cache.clear()
+        with CaptureQueriesContext(connection) as more:
+            self.detail()
+        Reviews.objects.filter(comment='Late').delete()
+        cache.clear()
+        with CaptureQueriesContext(connection) as fewer:
+            self.detail()
+        self.assertEqual(len(more), len(fewer))
+
+
+class RatingHistogramTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('viewer')
+        self.recipes = [make_recipe(self.user, f'Recipe {number}') for number in range(2)]
+        for user, recipe, rating in ((make_user('one'), 0, 5), (make_user('two'), 0, 5), (make_user('three'), 1, 2)):
+            record_review_added(Reviews.objects.create(user=user, recipe=self.recipes[recipe], rating=rating, comment='Ok'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def histograms(self, ids):
+        return self.client.get('/api/reviews/histograms/', {'ids': ids})
+
+    def test_histograms_of_many_recipes(self):
+        response = self.histograms(','.join(str(recipe.pk) for recipe in self.recipes))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            str(self.recipes[0].pk): {'1': 0, '2': 0, '3': 0, '4': 0, '5': 2},
+            str(self.recipes[1].pk): {'1': 0, '2': 1, '3': 0, '4': 0, '5': 0},
+        })
+
+    def test_unknown_ids_are_left_out(self):
+        response = self.histograms(f'{self.recipes[1].pk},{uuid.uuid4()}')
+        self.assertEqual(list(response.json()), [str(self.recipes[1].pk)])
+
+    def test_ids_are_validated_like_the_batch_endpoint(self):
+        for ids in ('', 'not-a-uuid', ','.join(str(uuid.uuid4()) for _ in range(101))):
+            response = self.histograms(ids)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('ids', response.json())
+            self.assertEqual(self.client.get('/api/recipes/batch/', {'ids': ids}).json(), response.json())
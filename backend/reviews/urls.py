@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import ReviewUploadView, ReviewEditView, ReviewDeleteView
+from .views import ReviewUploadView, ReviewEditView, ReviewDeleteView, RecipeReviewsView, RatingHistogramsView
 
 urlpatterns = [
     path('upload/', ReviewUploadView.as_view(), name='review-upload'),
     path('edit/<uuid:review_id>/', ReviewEditView.as_view(), name='review-edit'),
     path('delete/<uuid:review_id>/', ReviewDeleteView.as_view(), name='review-delete'),
+    path('recipe/<uuid:recipe_id>/', RecipeReviewsView.as_view(), name='recipe-reviews'),
+    path('histograms/', RatingHistogramsView.as_view(), name='rating-histograms'),
 ]
\ No newline at end of file
@@ -1,9 +1,17 @@
+from django.db import transaction
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from .models import Reviews
+from .pagination import ReviewCursorPagination
+from recipes.serializers import ReviewBriefSerializer
 from .serializers import ReviewUploadSerializer, ReviewEditSerializer
+from .aggregates import record_review_added, record_review_edited, get_histogram, HISTOGRAM_FIELDS
+from recipes.filters import get_recipe_ids
+from recipes.models import Recipes
+from spice_bazaar.db_router import ReplicaReadMixin
+from users.counters import adjust_counters
 
 class ReviewUploadView(generics.CreateAPIView):
 
@@ -11,14 +19,19 @@ class ReviewUploadView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic(): # the review and the recipe's rating stats are written together
+            review = serializer.save(user=self.request.user)
+            record_review_added(review)
+            adjust_counters(review.user_id, review_count=1)
 
 class ReviewEditView(APIView):
     permission_classes = [IsAuthenticated]
     
+    @transaction.atomic
     def put(self, request, review_id):
         try:
-            review = Reviews.objects.get(review_id=review_id)
+            # row lock so the old rating we subtract is the one actually being replaced
+            review = Reviews.objects.select_for_update().get(review_id=review_id)
 
             if review.user != request.user:
                 return Response({"error": "You do not have permission to edit this review"}, status=status.HTTP_403_FORBIDDEN)
@@ -26,10 +39,12 @@ class ReviewEditView(APIView):
         except Reviews.DoesNotExist:
             return Response({"error": "Review not found"}, status=status.HTTP_404_NOT_FOUND)
             
+        old_rating = review.rating
         serializer = ReviewEditSerializer(review, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            review = serializer.save()
+            record_review_edited(review, old_rating)
             return Response(serializer.data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -37,15 +52,37 @@ class ReviewEditView(APIView):
 class ReviewDeleteView(APIView):
     permission_classes = [IsAuthenticated]
     
+    @transaction.atomic
     def delete(self, request, review_id):
         try:
-            review = Reviews.objects.get(review_id=review_id)
+            review = Reviews.objects.select_for_update().get(review_id=review_id)
             if review.user != request.user:
                 return Response({"error": "You do not have permission to delete this review"}, status=status.HTTP_403_FORBIDDEN)
             
         except Reviews.DoesNotExist:
             return Response({"error": "Review not found"}, status=status.HTTP_404_NOT_FOUND)
             
-        review.delete()
+        review.delete() # the recipe's rating stats and the reviewer's review_count follow in the delete receivers
 
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class RecipeReviewsView(ReplicaReadMixin, generics.ListAPIView): # everyone else's reviews of a recipe, the viewer's own is in the recipe detail
+    serializer_class = ReviewBriefSerializer
+    pagination_class = ReviewCursorPagination
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        # a 404 like the recipe detail, so a missing recipe can't pass for one without reviews
+        recipe = generics.get_object_or_404(Recipes.objects.only('pk'), pk=self.kwargs['recipe_id'])
+        return Reviews.objects.filter(
+            recipe_id=recipe.pk
+        ).exclude(user=self.request.user).select_related('user')
+
+class RatingHistogramsView(ReplicaReadMixin, APIView): # star distributions for many recipes at once: ?ids=<uuid>,<uuid>,...
+    permission_classes = [IsAuthenticated]
+    max_ids = 100
+
+    def get(self, request):
+        recipe_ids = get_recipe_ids(request.query_params, self.max_ids) # same ?ids= parsing and errors as /api/recipes/batch/
+        rows = Recipes.objects.filter(recipe_id__in=recipe_ids).values('recipe_id', *HISTOGRAM_FIELDS.values())
+        return Response({str(row['recipe_id']): get_histogram(row) for row in rows})
\ No newline at end of file
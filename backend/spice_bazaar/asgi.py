@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spice_bazaar.settings')
+# persistent connections pile up per executor thread under ASGI, reuse them through DB_POOL=1 instead (see settings.py)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
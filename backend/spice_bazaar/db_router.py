@@ -0,0 +1,197 @@
+"""
+Read replica routing.
+
+Views with ReplicaReadMixin (the catalog, recipe detail and the other read-only views) run the queries of
+their GET requests on a replica from settings.REPLICA_DATABASES; everything else, and every write, uses the
+primary. The replica is picked per request: unreachable replicas and ones lagging more than
+REPLICA_MAX_LAG seconds are skipped, and of the rest the freshest is used. Health and lag are checked at
+most every REPLICA_CHECK_INTERVAL seconds per process.
+
+After a successful write a user is pinned to the primary for REPLICA_STICKY_SECONDS (PrimaryStickyMiddleware),
+so they read their own writes while the replicas catch up.
+
+Results stored in the shared caches (catalog pages, facet counts, bookmark sets) are always computed on the
+primary, see primary_reads(). A replica may not have replayed the write whose generation bump caused the cache
+miss yet, and its rows would otherwise be cached, and ETagged, under the new generation until the next write.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger('spice_bazaar.db')
+
+# the alias reads go to during the current request, None outside read-only views
+_read_alias = ContextVar('read_alias', default=None)
+
+# seconds since the last replayed transaction, 0 when the replica has replayed everything it received
+# (otherwise an idle primary would look like lag)
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# replicas within this many seconds of the freshest one share the load
+LAG_TOLERANCE = 1.0
+
+
+class ReplicaSet:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = {} # alias -> (checked at, lag in seconds or None when unreachable)
+
+    def lag(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked = self.status.get(alias)
+        if checked is not None and now - checked[0] < settings.REPLICA_CHECK_INTERVAL:
+            return checked[1]
+
+        try:
+            lag = self.measure_lag(alias)
+        except DatabaseError as exc:
+            logger.warning('Replica %s is unreachable: %s', alias, exc)
+            connections[alias].close()
+            lag = None
+        with self.lock:
+            self.status[alias] = (now, lag)
+        return lag
+
+    def measure_lag(self, alias):
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                cursor.execute('SELECT 1') # no replication to ask about, reachable is all we can tell
+                return 0.0
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+
+    def choose(self):
+        lags = {alias: self.lag(alias) for alias in settings.REPLICA_DATABASES}
+        fresh = {alias: lag for alias, lag in lags.items() if lag is not None and lag <= settings.REPLICA_MAX_LAG}
+        if not fresh:
+            return DEFAULT_DB_ALIAS
+
+        best = min(fresh.values())
+        return random.choice([alias for alias, lag in fresh.items() if lag - best <= LAG_TOLERANCE])
+
+    def reset(self):
+        with self.lock:
+            self.status.clear()
+
+
+replicas = ReplicaSet()
+
+
+def sticky_key(user_id):
+    return f'db:primary:{user_id}'
+
+
+def pin_to_primary(user):
+    cache.set(sticky_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def read_alias_for(user):
+    if user.is_authenticated and cache.get(sticky_key(user.pk), False):
+        return DEFAULT_DB_ALIAS
+    return replicas.choose()
+
+
+async def aread_alias_for(user):
+    if user.is_authenticated and await cache.aget(sticky_key(user.pk), False):
+        return DEFAULT_DB_ALIAS
+    return await sync_to_async(replicas.choose)() # the health check queries the replicas
+
+
+def use_read_alias(alias):
+    return _read_alias.set(alias)
+
+
+def reset_read_alias(token):
+    _read_alias.reset(token)
+
+
+def reading_from_replica():
+    return _read_alias.get() not in (None, DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def primary_reads(): # reads inside the block go to the primary, across awaits too (the context var belongs to the task)
+    token = use_read_alias(None)
+    try:
+        yield
+    finally:
+        reset_read_alias(token)
+
+
+class ReplicaReadMixin: # for read-only DRF views: GET / HEAD queries go to a replica unless the user just wrote
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs) # authentication reads the user from the primary
+        if settings.REPLICA_DATABASES and request.method in SAFE_METHODS:
+            self._read_alias_token = use_read_alias(read_alias_for(request.user))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_read_alias_token', None)
+        if token is not None:
+            reset_read_alias(token)
+            self._read_alias_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() # None falls through to the default database
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary, so objects read from either can be related
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class PrimaryStickyMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        if self.wrote(request, response):
+            pin_to_primary(request.user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if await sync_to_async(self.wrote)(request, response): # request.user may still be a lazy session lookup
+            await cache.aset(sticky_key(request.user.pk), True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    def wrote(self, request, response):
+        # DRF sets request.user on the underlying request once it has authenticated the token
+        return (
+            bool(settings.REPLICA_DATABASES)
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        )
@@ -0,0 +1,242 @@
+"""
+Per-request performance instrumentation.
+
+PerformanceMiddleware times every request and splits it into SQL (count and time, via a database execute
+wrapper, so it works with DEBUG off), serialization and authentication. The numbers go out three ways:
+a Server-Timing response header, one structured DEBUG log line on the `spice_bazaar.performance` logger
+(printed with PERFORMANCE_LOG_LEVEL=DEBUG) and per-view histograms served in Prometheus text format by
+metrics_view (/metrics).
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+logger = logging.getLogger('spice_bazaar.performance')
+
+# seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.timings = {'db': 0.0, 'serialize': 0.0, 'auth': 0.0}
+        self.depth = {}
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+def record_query(execute, sql, params, many, context):
+    # installed on every connection; async views run their queries in worker threads, the context var follows them there
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.add('db', time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install_on_open_connections():
+    # connections are per thread, so this covers the calling thread's
+    for connection in connections.all():
+        install_query_recorder(None, connection)
+
+
+# new connections (including the ones async views open in their worker threads) get the recorder straight away,
+# the middleware also checks the connections that were opened before this module loaded
+connection_created.connect(install_query_recorder)
+
+
+@contextmanager
+def timed(name):
+    # adds the block's wall time to the current request; nested blocks of the same name count once
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    depth = metrics.depth.get(name, 0)
+    metrics.depth[name] = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth[name] = depth
+        if depth == 0:
+            metrics.add(name, time.perf_counter() - started)
+
+
+class TimedListSerializer(serializers.ListSerializer): # set as Meta.list_serializer_class to time many=True output
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class Registry:
+    # in-process, so each worker exposes its own numbers and is scraped as its own target
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.db_seconds = {}
+
+    def observe(self, labels, metrics, duration):
+        with self.lock:
+            self.latency.setdefault(labels, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self.queries[labels] = self.queries.get(labels, 0) + metrics.queries
+            self.db_seconds[labels] = self.db_seconds.get(labels, 0.0) + metrics.timings['db']
+
+    def render(self):
+        lines = [
+            '# HELP spice_bazaar_request_duration_seconds Request latency by view.',
+            '# TYPE spice_bazaar_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            for labels, histogram in sorted(self.latency.items()):
+                base = format_labels(labels)
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                    cumulative += count
+                    lines.append(f'spice_bazaar_request_duration_seconds_bucket{{{base},le="{bound}"}} {cumulative}')
+                lines.append(f'spice_bazaar_request_duration_seconds_sum{{{base}}} {histogram.total}')
+                lines.append(f'spice_bazaar_request_duration_seconds_count{{{base}}} {cumulative}')
+
+            lines += [
+                '# HELP spice_bazaar_sql_queries_total SQL queries run by view.',
+                '# TYPE spice_bazaar_sql_queries_total counter',
+            ]
+            lines += [f'spice_bazaar_sql_queries_total{{{format_labels(labels)}}} {count}' for labels, count in sorted(self.queries.items())]
+            lines += [
+                '# HELP spice_bazaar_sql_seconds_total Time spent in SQL by view.',
+                '# TYPE spice_bazaar_sql_seconds_total counter',
+            ]
+            lines += [f'spice_bazaar_sql_seconds_total{{{format_labels(labels)}}} {seconds}' for labels, seconds in sorted(self.db_seconds.items())]
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    view, method, status = labels
+    return f'view="{view}",method="{method}",status="{status}"'
+
+
+registry = Registry()
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.checked_async_connections = False
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        install_on_open_connections()
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.checked_async_connections:
+            # the async ORM queries from the sync_to_async thread, whose connections can predate this module;
+            # that thread is the same for every request, and connections it opens later get the recorder anyway
+            await sync_to_async(install_on_open_connections)()
+            self.checked_async_connections = True
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        duration = time.perf_counter() - metrics.started
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        status_class = f'{response.status_code // 100}xx'
+
+        timings = {name: round(seconds * 1000, 3) for name, seconds in metrics.timings.items()}
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings["db"]};desc="{metrics.queries} queries"',
+            f'serialize;dur={timings["serialize"]}',
+            f'auth;dur={timings["auth"]}',
+            f'total;dur={round(duration * 1000, 3)}',
+        ])
+
+        logger.debug(json.dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': timings['db'],
+            'serialize_ms': timings['serialize'],
+            'auth_ms': timings['auth'],
+            'total_ms': round(duration * 1000, 3),
+        }))
+
+        if view != 'metrics':
+            registry.observe((view, request.method, status_class), metrics, duration)
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework', 
     'rest_framework_simplejwt',
@@ -49,11 +51,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'spice_bazaar.instrumentation.PerformanceMiddleware', # first, so its timings cover the rest of the stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'spice_bazaar.db_router.PrimaryStickyMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,15 +85,87 @@ WSGI_APPLICATION = 'spice_bazaar.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+#
+# Connections are reused in one of three ways, picked from the environment:
+#   default            under WSGI, persistent connections: each worker keeps its connection for DB_CONN_MAX_AGE
+#                      seconds and checks it is still alive before reusing it (DB_CONN_HEALTH_CHECKS). Under ASGI
+#                      (asgi.py) DB_CONN_MAX_AGE defaults to 0, a connection per request, because every thread the
+#                      async views' queries run on would keep its own; set DB_POOL=1 there to reuse connections
+#   DB_POOL=1          a psycopg connection pool per worker process (DB_POOL_MIN_SIZE .. DB_POOL_MAX_SIZE connections,
+#                      requests wait up to DB_POOL_TIMEOUT seconds for one), so database backends stay bounded
+#                      at workers * DB_POOL_MAX_SIZE even under spikes
+#   DB_PGBOUNCER=1     for PgBouncer in transaction pooling mode: no server-side cursors and no prepared statements,
+#                      since consecutive transactions can land on different server connections
+
+def env_bool(name, default=False):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name): # None when unset, for settings that fall back to a library default
+    return int(os.environ[name]) if os.environ.get(name) else None
+
+
+DB_POOL = env_bool('DB_POOL')
+DB_PGBOUNCER = env_bool('DB_PGBOUNCER')
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'spice_bazaar',  # Your database name
-        'USER': 'postgres',      # Your database username
-        'PASSWORD': 'password',  # Your database password
-        'HOST': 'localhost',     # Set to your database host
-        'PORT': '5432',          # Set to your database port
+        'NAME': os.environ.get('DB_NAME', 'spice_bazaar'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'password'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        # the pool hands connections back after every request, Django refuses persistent connections on top of it
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': env_bool('DB_CONN_HEALTH_CHECKS', True),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+        'OPTIONS': {},
+    }
+}
+
+if DB_POOL:
+    # Django sets up the pool to check each connection is alive before handing it out
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)), # idle connections above min_size are closed after this
+    }
+
+if DB_PGBOUNCER:
+    DATABASES['default']['OPTIONS']['prepare_threshold'] = None
+
+# Read replicas: DB_REPLICAS=host[:port],host[:port] adds a replica_1, replica_2, ... alias per replica, with the
+# primary's credentials. GET requests to the read-only views query the freshest healthy one and users who just
+# wrote stay on the primary for a while, see spice_bazaar/db_router.py
+
+for index, address in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'OPTIONS': {**DATABASES['default']['OPTIONS']},
+        'TEST': {'MIRROR': 'default'}, # tests read the primary's test database, see recipes/tests.py for a real second one
+    }
+
+DATABASE_ROUTERS = ['spice_bazaar.db_router.ReplicaRouter']
+REPLICA_DATABASES = [alias for alias in DATABASES if alias.startswith('replica_')]
+REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5)) # seconds; laggier replicas are skipped
+REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5)) # seconds between health / lag checks per replica
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 15)) # how long a user reads from the primary after a write
+
+
+# Cache
+# Holds derived data such as facet counts. The local-memory default is per process; point
+# CACHE_BACKEND / CACHE_LOCATION at a shared backend (e.g. django.core.cache.backends.redis.RedisCache)
+# when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'spice-bazaar'),
     }
 }
 
@@ -113,6 +189,28 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing: PASSWORD_HASHER picks the hasher for new passwords, work factors left unset use Django's defaults.
+# The other hashers stay listed so existing hashes keep verifying; users/hashers.py re-hashes them on the next login.
+# The async login / update views hash in a pool of PASSWORD_HASHING_WORKERS threads (users/passwords.py)
+
+PASSWORD_HASHER_CLASSES = {
+    'pbkdf2': 'users.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+    'argon2': 'users.hashers.Argon2PasswordHasher', # needs argon2-cffi
+}
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHERS = [PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+]
+
+
+PASSWORD_PBKDF2_ITERATIONS = env_int('PASSWORD_PBKDF2_ITERATIONS')
+PASSWORD_SCRYPT_WORK_FACTOR = env_int('PASSWORD_SCRYPT_WORK_FACTOR')
+PASSWORD_ARGON2_TIME_COST = env_int('PASSWORD_ARGON2_TIME_COST')
+PASSWORD_ARGON2_MEMORY_COST = env_int('PASSWORD_ARGON2_MEMORY_COST') # KiB
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -130,17 +228,43 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Recipe images (recipes/images.py). Uploads go to the 'images' storage (local files by default, any Django storage
+# backend such as django-storages' S3Storage via IMAGE_STORAGE_BACKEND) along with resized copies in every
+# IMAGE_VARIANT_FORMATS x IMAGE_VARIANT_WIDTHS, made by IMAGE_PROCESSING_WORKERS background threads when Pillow is
+# installed. File names include the content digest and never change, so serve MEDIA_URL with
+# `Cache-Control: public, max-age=31536000, immutable`
+
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'images': {'BACKEND': os.environ.get('IMAGE_STORAGE_BACKEND', 'django.core.files.storage.FileSystemStorage')},
+}
+
+IMAGE_VARIANT_WIDTHS = [int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '160,320,640,1080').split(',')]
+IMAGE_VARIANT_FORMATS = os.environ.get('IMAGE_VARIANT_FORMATS', 'webp,jpeg').split(',')
+IMAGE_QUALITY = {'webp': int(os.environ.get('IMAGE_WEBP_QUALITY', 80)), 'jpeg': int(os.environ.get('IMAGE_JPEG_QUALITY', 82))}
+IMAGE_MAX_UPLOAD_BYTES = int(os.environ.get('IMAGE_MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000))
+IMAGE_PROCESSING_WORKERS = int(os.environ.get('IMAGE_PROCESSING_WORKERS', 1))
+IMAGE_IMPORT_TIMEOUT = float(os.environ.get('IMAGE_IMPORT_TIMEOUT', 10))
+
 # Custom user model
 AUTH_USER_MODEL = 'users.Users'
 
 # Django REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # recipe and review lists set their own keyset pagination_class (recipes/pagination.py), this is the fallback
+    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'PAGE_SIZE': 20,  # clients can ask for up to KeysetPagination.max_page_size with ?page_size=
 }
 
 # Simple JWT configuration
@@ -151,6 +275,54 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'UPDATE_LAST_LOGIN': True,
     'BLACKLIST_ON_REFRESH': True,
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TokenRefreshSerializer',
+}
+
+# With REVOCATION_FILTER on, refresh tokens are checked against an in-process Bloom filter of revoked JTIs
+# (users/revocation.py) and only hit the blacklist table on a match. Workers learn about revocations through a
+# generation in CACHES['default'], so the filter is only on by default when that cache is shared (e.g. Redis); with
+# the per-process LocMemCache another worker would never hear of a revocation. REVOCATION_FILTER_GAP_SECONDS is how
+# long a worker keeps looking for a blacklist row whose primary key was skipped (its transaction may commit after a
+# later one's). Expired tokens are removed by `manage.py prune_tokens`, run it from cron.
+
+REVOCATION_FILTER = env_bool('REVOCATION_FILTER', CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+))
+REVOCATION_FILTER_CAPACITY = int(os.environ.get('REVOCATION_FILTER_CAPACITY', 1_000_000))
+REVOCATION_FILTER_ERROR_RATE = float(os.environ.get('REVOCATION_FILTER_ERROR_RATE', 0.001))
+REVOCATION_FILTER_REBUILD_SECONDS = int(os.environ.get('REVOCATION_FILTER_REBUILD_SECONDS', 3600))
+REVOCATION_FILTER_GAP_SECONDS = float(os.environ.get('REVOCATION_FILTER_GAP_SECONDS', 60))
+
+# Token authentication serves users from an in-process LRU (users/auth_cache.py) instead of querying them on
+# every request. Other workers see a deactivated user within AUTH_USER_CACHE_TTL seconds; 0 turns the cache off.
+# AUTH_USER_SHARED_CACHE_TTL > 0 also keeps users in CACHES['default'], worth it when that is shared (e.g. Redis)
+
+AUTH_USER_CACHE_TTL = float(os.environ.get('AUTH_USER_CACHE_TTL', 10))
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', 10000))
+AUTH_USER_SHARED_CACHE_TTL = int(os.environ.get('AUTH_USER_SHARED_CACHE_TTL', 0))
+
+# Performance instrumentation (spice_bazaar/instrumentation.py)
+# /metrics serves per-view latency histograms in Prometheus text format, only to these addresses
+
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(message)s'}, # the performance logger already writes one JSON object per line
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'spice_bazaar.performance': { # one DEBUG line per request, PERFORMANCE_LOG_LEVEL=DEBUG prints them
+            'handlers': ['console'],
+            'level': os.environ.get('PERFORMANCE_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
 }
 
 # Default primary key field type
@@ -14,12 +14,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
+from .instrumentation import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/acc/', include('users.urls')),
     path('api/recipes/', include('recipes.urls')),
     path('api/reviews/', include('reviews.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
+
+# uploaded images and their variants, in development only; in production the web server or CDN serves MEDIA_URL
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
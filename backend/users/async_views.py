@@ -0,0 +1,82 @@
+"""
+Async versions of login and account update, served under /api/acc/async/.
+
+Same requests and responses as LoginView and UserUpdateView, but password checks and hashing run in the bounded
+hashing pool (users/passwords.py), so a burst of logins doesn't tie up the workers serving everything else.
+"""
+from asgiref.sync import sync_to_async
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from recipes.async_views import aauthenticate, render, render_exception
+from .passwords import acheck_password, amake_password
+from .serializers import LoginSerializer, UserUpdateSerializer
+from .views import LoginView, UserUpdateView, load_account
+
+
+class AsyncAPIView(View):
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs)) # token authentication, no session cookies, same as DRF's views
+
+    def get_request(self, request):
+        return Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+
+
+class AsyncLoginView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            drf_request = self.get_request(request)
+            serializer = LoginSerializer(data=drf_request.data, context={'request': drf_request, 'defer_password_check': True})
+            await sync_to_async(serializer.is_valid)(raise_exception=True) # the email lookup
+            user = serializer.validated_data['user']
+
+            if not await acheck_password(user, serializer.validated_data['password']):
+                raise exceptions.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [ErrorDetail('Incorrect password', code='invalid')]})
+
+            return render(await sync_to_async(LoginView.get_login_data)(user))
+        except exceptions.APIException as exc:
+            return render_exception(exc)
+
+
+class AsyncUserUpdateView(AsyncAPIView):
+    async def put(self, request):
+        return await self.update(request, partial=False)
+
+    async def patch(self, request):
+        return await self.update(request, partial=True)
+
+    async def update(self, request, partial):
+        try:
+            # the stored row rather than the authentication cache's copy, its hash is the one the old password must match
+            user = await sync_to_async(load_account)((await aauthenticate(request)).pk)
+
+            drf_request = self.get_request(request)
+            drf_request.user = user
+            serializer = UserUpdateSerializer(
+                user, data=drf_request.data, partial=partial,
+                context={'request': drf_request, 'defer_password_check': True},
+            )
+            errors = {} if await sync_to_async(serializer.is_valid)() else dict(serializer.errors)
+
+            # the old password is checked after the other fields, its error goes where UserUpdateView would put it
+            checked_password = None
+            if 'old_password' in serializer.initial_data and 'old_password' not in errors:
+                old_password = serializer.fields['old_password'].run_validation(serializer.initial_data['old_password'])
+                if not await acheck_password(user, old_password):
+                    errors['old_password'] = [ErrorDetail('Old password is incorrect.', code='invalid')]
+                checked_password = user.password # after a re-hash in acheck_password, the one now stored
+            if errors:
+                raise exceptions.ValidationError({name: errors[name] for name in [*serializer.fields, api_settings.NON_FIELD_ERRORS_KEY] if name in errors})
+
+            new_password = serializer.validated_data.get('new_password')
+            if new_password:
+                serializer.validated_data['encoded_password'] = await amake_password(new_password)
+            await sync_to_async(UserUpdateView().save_checked)(serializer, checked_password)
+            return render(serializer.data)
+        except exceptions.APIException as exc:
+            return render_exception(exc)
@@ -0,0 +1,95 @@
+"""
+Users seen by token authentication, kept so that authenticated requests skip the Users query.
+
+Each process keeps up to AUTH_USER_CACHE_SIZE users for AUTH_USER_CACHE_TTL seconds in an LRU. With
+AUTH_USER_SHARED_CACHE_TTL set, users are also stored in the shared Django cache, so a worker that hasn't seen
+a user yet doesn't need the query either.
+
+Saving or deleting a user (which covers profile updates and deactivation) and logging out drop the user from
+this process's LRU and from the shared cache; other processes notice within AUTH_USER_CACHE_TTL seconds, so
+keep that short. Queryset .update() calls bypass this and have to call forget_user themselves.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class UserLRU:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # user id -> (expires at, user)
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+        # a copy, views may change request.user (UserUpdateView saves it) and requests run in parallel threads
+        return copy.copy(entry[1])
+
+    def set(self, user_id, user):
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + settings.AUTH_USER_CACHE_TTL, copy.copy(user))
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.AUTH_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_users = UserLRU()
+
+
+def shared_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def get_cached_user(user_id):
+    if not settings.AUTH_USER_CACHE_TTL:
+        return None
+
+    user_id = str(user_id)
+    user = local_users.get(user_id)
+    if user is None and settings.AUTH_USER_SHARED_CACHE_TTL:
+        user = cache.get(shared_key(user_id))
+        if user is not None:
+            local_users.set(user_id, user)
+    return user
+
+
+def cache_user(user):
+    if not settings.AUTH_USER_CACHE_TTL:
+        return
+
+    user_id = str(user.pk)
+    local_users.set(user_id, user)
+    if settings.AUTH_USER_SHARED_CACHE_TTL:
+        cache.set(shared_key(user_id), user, settings.AUTH_USER_SHARED_CACHE_TTL)
+
+
+def forget_user(user_id):
+    user_id = str(user_id)
+
+    def forget():
+        local_users.discard(user_id)
+        if settings.AUTH_USER_SHARED_CACHE_TTL:
+            cache.delete(shared_key(user_id))
+
+    # now, and again after the commit in case a concurrent request cached the old row in between
+    forget()
+    transaction.on_commit(forget)
@@ -0,0 +1,24 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from spice_bazaar.instrumentation import timed
+from .auth_cache import cache_user, get_cached_user
+
+
+class TimedJWTAuthentication(JWTAuthentication): # reports token checking and the user lookup as "auth" in Server-Timing
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+
+class CachedJWTAuthentication(TimedJWTAuthentication): # the token's user comes from users/auth_cache.py, no query on a hit
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = get_cached_user(user_id) if user_id is not None else None
+        if user is not None:
+            # only users that passed the checks below get cached, and saving a user (e.g. deactivating it) drops its entry
+            return user
+
+        user = super().get_user(validated_token) # the lookup plus the missing / inactive user checks
+        cache_user(user)
+        return user
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.cache import aget_generation, bump_generation, get_generation
+from spice_bazaar.db_router import primary_reads
+from .models import Bookmarks
+
+BOOKMARKS_TIMEOUT = 60 * 60
+
+
+def bookmarks_key(user_id, version):
+    # a bookmark write moves the version instead of editing the cached set, so a set loaded before the write can
+    # only ever be stored under the old key
+    return f'bookmarks:{user_id}:{version}'
+
+
+def get_bookmarked_ids(user):
+    # the set of recipe ids a user has bookmarked, loaded with one query and then served from the cache
+    key = bookmarks_key(user.pk, get_bookmarks_version(user.pk)) # the version is read before the query
+    recipe_ids = cache.get(key)
+    if recipe_ids is None:
+        with primary_reads(): # a replica may not have the write that moved the version yet
+            recipe_ids = frozenset(Bookmarks.objects.filter(user=user).values_list('recipe_id', flat=True))
+        cache.set(key, recipe_ids, BOOKMARKS_TIMEOUT)
+    return recipe_ids
+
+
+async def aget_bookmarked_ids(user):
+    key = bookmarks_key(user.pk, await aget_bookmarks_version(user.pk))
+    recipe_ids = await cache.aget(key)
+    if recipe_ids is None:
+        with primary_reads():
+            recipe_ids = frozenset([recipe_id async for recipe_id in Bookmarks.objects.filter(user=user).values_list('recipe_id', flat=True)])
+        await cache.aset(key, recipe_ids, BOOKMARKS_TIMEOUT)
+    return recipe_ids
+
+
+def invalidate_bookmarked_ids(user_id):
+    # after the bookmark write commits, the next read loads the set fresh under the new version
+    transaction.on_commit(lambda: bump_generation(f'bookmarks:{user_id}'))
+
+
+def get_bookmarks_version(user_id):
+    # per-user overlay version, part of every ETag that depends on is_bookmarked
+    return get_generation(f'bookmarks:{user_id}')
+
+
+async def aget_bookmarks_version(user_id):
+    return await aget_generation(f'bookmarks:{user_id}')
@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from recipes.models import Recipes
+from reviews.models import Reviews
+from .models import Bookmarks, Users
+
+# the rows each stored counter on Users counts, all of them have a user and a recipe_id column
+COUNTED = (
+    (Recipes, 'recipe_count'),
+    (Bookmarks, 'bookmark_count'),
+    (Reviews, 'review_count'),
+)
+
+
+def adjust_counters(user_id, **deltas):
+    # one UPDATE with F() expressions, so concurrent requests can't lose increments (same as reviews/aggregates.py)
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        Users.objects.filter(pk=user_id).update(**changes)
+
+
+def lower_counters(counts):
+    # {(user_id, field): n} in one UPDATE, however many users and rows; users lowered by the same n share a WHEN
+    amounts = defaultdict(lambda: defaultdict(list)) # field -> n -> user ids
+    for (user_id, field), count in counts.items():
+        amounts[field][count].append(user_id)
+    if amounts:
+        Users.objects.filter(pk__in={user_id for user_id, _ in counts}).update(**{
+            field: F(field) - Case(*[When(pk__in=user_ids, then=Value(count)) for count, user_ids in by_count.items()], default=Value(0))
+            for field, by_count in amounts.items()
+        })
+
+
+def recounted(queryset):
+    # marks a queryset whose delete() the caller follows with a recount (refresh_bookmark_count), so the delete
+    # receivers in users/signals.py leave its counters alone
+    queryset.__dict__['_recounted'] = True
+    return queryset
+
+
+def count_per_user(rows):
+    # the number of `rows` belonging to the outer user, as a correlated subquery
+    rows = rows.filter(user=OuterRef('pk')).order_by().values('user').annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(rows), 0)
+
+
+def refresh_bookmark_count(user_id):
+    # recounted in the same UPDATE, for batch writes where the number of rows actually inserted isn't known
+    Users.objects.filter(pk=user_id).update(bookmark_count=count_per_user(Bookmarks.objects.all()))
+
+
+def rebuild_user_counters(queryset=None):
+    # recomputes the stored counters from the tables, used by the reconcile_counters command
+    queryset = Users.objects.all() if queryset is None else queryset
+    return queryset.update(**{field: count_per_user(model.objects.all()) for model, field in COUNTED})
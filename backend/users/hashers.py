@@ -0,0 +1,31 @@
+"""
+Password hashers whose work factors come from settings (PASSWORD_PBKDF2_ITERATIONS, PASSWORD_SCRYPT_WORK_FACTOR,
+PASSWORD_ARGON2_TIME_COST, PASSWORD_ARGON2_MEMORY_COST), falling back to Django's defaults.
+
+They keep Django's algorithm names, so existing hashes still verify. When the preferred hasher or its work factor
+changes, must_update() flags the old hashes and check_password() re-hashes them on the next successful login.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS or super().iterations
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR or super().work_factor
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher): # needs argon2-cffi (pip install django[argon2])
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST or super().time_cost
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST or super().memory_cost
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import time
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from rest_framework.test import APIClient
+from recipes.benchmark import BENCH_EMAIL, BENCH_PASSWORD, benchmark_database
+from users.models import Users
+
+# hasher name -> {option in --setting: setting it overrides}
+HASHER_PARAMS = {
+    'pbkdf2': {'iterations': 'PASSWORD_PBKDF2_ITERATIONS'},
+    'scrypt': {'work_factor': 'PASSWORD_SCRYPT_WORK_FACTOR'},
+    'argon2': {'time_cost': 'PASSWORD_ARGON2_TIME_COST', 'memory_cost': 'PASSWORD_ARGON2_MEMORY_COST'},
+}
+DEFAULT_SETTINGS = ['pbkdf2', 'pbkdf2:iterations=600000', 'pbkdf2:iterations=260000', 'scrypt', 'argon2']
+
+
+def parse_setting(value):
+    # "pbkdf2:iterations=600000" -> ('pbkdf2', {'PASSWORD_PBKDF2_ITERATIONS': 600000})
+    name, _, params = value.partition(':')
+    if name not in HASHER_PARAMS:
+        raise CommandError(f"Unknown hasher {name!r}, expected one of: {', '.join(HASHER_PARAMS)}")
+    overrides = {}
+    for param in filter(None, params.split(',')):
+        key, _, number = param.partition('=')
+        if key not in HASHER_PARAMS[name] or not number.isdigit():
+            raise CommandError(f"Bad parameter {param!r} for {name}, expected one of: {', '.join(f'{key}=<int>' for key in HASHER_PARAMS[name])}")
+        overrides[HASHER_PARAMS[name][key]] = int(number)
+    return name, overrides
+
+
+class Command(BaseCommand):
+    help = 'Measure login throughput per core for each password hasher setting, through the sync and async login views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--setting', action='append', help=f"Hasher setting as name[:param=value,...], repeatable (default: {' '.join(DEFAULT_SETTINGS)})")
+        parser.add_argument('--logins', type=int, default=50, help='Logins per view and setting')
+        parser.add_argument('--concurrency', type=int, default=16, help='Async logins in flight at once')
+        parser.add_argument('--output', type=str, help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        hasher_settings = [(value, *parse_setting(value)) for value in options['setting'] or DEFAULT_SETTINGS]
+        workers = settings.PASSWORD_HASHING_WORKERS
+        cores = os.cpu_count() or 1
+
+        results = []
+        with benchmark_database():
+            Users.objects.create_user(email=BENCH_EMAIL, username='bench', password=BENCH_PASSWORD)
+            for label, name, overrides in hasher_settings:
+                hashers = [settings.PASSWORD_HASHER_CLASSES[name]] + [path for key, path in settings.PASSWORD_HASHER_CLASSES.items() if key != name]
+                with override_settings(PASSWORD_HASHERS=hashers, **overrides):
+                    result = self.measure(label, options, workers, cores)
+                results.append(result)
+                if result.get('skipped'):
+                    self.stdout.write(f"{label:28} skipped: {result['skipped']}")
+                    continue
+                self.stdout.write(
+                    f"{label:28} verify {result['verify_ms']:7.1f} ms   sync {result['sync_per_core']:6.1f} logins/s/core   "
+                    f"async {result['async_per_second']:6.1f} logins/s ({result['async_per_core']:.1f}/core over {result['hashing_threads']} threads)"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({'cores': cores, 'hashing_workers': workers, 'concurrency': options['concurrency'], 'results': results}, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def measure(self, label, options, workers, cores):
+        try:
+            encoded = make_password(BENCH_PASSWORD)
+        except ValueError as exc: # the hasher's library isn't installed, e.g. argon2-cffi
+            return {'setting': label, 'skipped': str(exc)}
+        Users.objects.filter(email=BENCH_EMAIL).update(password=encoded)
+
+        started = time.perf_counter()
+        verify_password(BENCH_PASSWORD, encoded)
+        verify_ms = (time.perf_counter() - started) * 1000
+
+        # one request at a time in this thread, so logins/sec here is what one core does
+        client = APIClient()
+        started = time.perf_counter()
+        for _ in range(options['logins']):
+            self.expect_ok(client.post('/api/acc/login/', {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}, format='json'))
+        sync_per_core = options['logins'] / (time.perf_counter() - started)
+
+        async_per_second = asyncio.run(self.load(options))
+        threads = min(workers, cores)
+        return {
+            'setting': label,
+            'hasher': settings.PASSWORD_HASHERS[0],
+            'verify_ms': round(verify_ms, 2),
+            'sync_per_core': round(sync_per_core, 1),
+            'async_per_second': round(async_per_second, 1),
+            'async_per_core': round(async_per_second / threads, 1),
+            'hashing_threads': threads,
+        }
+
+    async def load(self, options):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(max(options['concurrency'], 1))
+
+        async def one():
+            async with semaphore:
+                self.expect_ok(await client.post(
+                    '/api/acc/async/login/', {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}, content_type='application/json',
+                ))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(options['logins'])))
+        return options['logins'] / (time.perf_counter() - started)
+
+    def expect_ok(self, response):
+        if response.status_code != 200:
+            raise CommandError(f'Login failed with {response.status_code}: {response.content[:200]!r}')
@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+class Command(BaseCommand):
+    help = 'Delete expired refresh tokens from the outstanding and blacklisted token tables, in batches (run it from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of outstanding tokens deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        now = timezone.now() # tokens expiring while this runs are left for the next run
+        pruned = {'outstanding': 0, 'blacklisted': 0}
+        last_pk = 0
+
+        # expired tokens can't be refreshed or blacklisted anymore, so their rows only cost space and index lookups;
+        # each batch is its own transaction so refreshes and logouts never wait on one long delete
+        while True:
+            pks = list(
+                OutstandingToken.objects.filter(expires_at__lte=now, pk__gt=last_pk)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+
+            with transaction.atomic():
+                _, deleted = OutstandingToken.objects.filter(pk__in=pks).delete() # cascades to their blacklist rows
+            pruned['outstanding'] += deleted.get('token_blacklist.OutstandingToken', 0)
+            pruned['blacklisted'] += deleted.get('token_blacklist.BlacklistedToken', 0)
+
+            last_pk = pks[-1]
+            self.stdout.write(f"Pruned {pruned['outstanding']} outstanding tokens...")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully pruned {pruned['outstanding']} expired outstanding tokens and {pruned['blacklisted']} blacklisted tokens"
+        ))
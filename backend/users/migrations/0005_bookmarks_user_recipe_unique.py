@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:12
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_bookmarks(apps, schema_editor):
+    # the old create path only checked for duplicates in python, keep the oldest row of each (user, recipe) pair
+    Bookmarks = apps.get_model('users', 'Bookmarks')
+    duplicates = (
+        Bookmarks.objects.order_by().values('user_id', 'recipe_id')
+        .annotate(count=Count('pk')).filter(count__gt=1)
+    )
+    for pair in list(duplicates):
+        rows = Bookmarks.objects.filter(user_id=pair['user_id'], recipe_id=pair['recipe_id']).order_by('bookmark_date', 'pk')
+        keep = rows.values_list('pk', flat=True).first()
+        rows.exclude(pk=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipes_total_time_tags'),
+        ('users', '0004_alter_users_image_link'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bookmarks, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bookmarks',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='bookmarks_user_recipe_unique'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:24
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    # same as users.counters.rebuild_user_counters, on the historical models
+    Users = apps.get_model('users', 'Users')
+    counted = {
+        'recipe_count': apps.get_model('recipes', 'Recipes'),
+        'bookmark_count': apps.get_model('users', 'Bookmarks'),
+        'review_count': apps.get_model('reviews', 'Reviews'),
+    }
+
+    def count_per_user(model):
+        rows = model.objects.filter(user=OuterRef('pk')).order_by().values('user').annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(rows), 0)
+
+    Users.objects.update(**{field: count_per_user(model) for field, model in counted.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipes_total_time_tags'),
+        ('reviews', '0003_reviews_keyset_index'),
+        ('users', '0005_bookmarks_user_recipe_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='users',
+            name='bookmark_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='users',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='users',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
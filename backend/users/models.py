@@ -2,6 +2,10 @@ import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
+from .auth_cache import forget_user
+
+COUNTER_FIELDS = ('recipe_count', 'bookmark_count', 'review_count')
+
 class CustomUserManager(BaseUserManager):
 
     def create_user(self, email=None, username=None, password=None, **extra_fields):
@@ -43,6 +47,12 @@ class Users(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
 
+    # raised by users/counters.py where rows are created, lowered on delete by users/signals.py, rebuilt by the
+    # reconcile_counters command
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+    bookmark_count = models.PositiveIntegerField(default=0, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
@@ -51,6 +61,17 @@ class Users(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            # the counters only move through F() updates, a full save of an older copy (request.user can come
+            # from the authentication cache) must not write its stale numbers back
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        forget_user(self.pk) # token authentication caches users, changes like deactivation must not wait for the entry to expire
+
     class Meta:
         db_table = 'Users'
         verbose_name_plural = "Users"
@@ -68,3 +89,7 @@ class Bookmarks(models.Model):
     class Meta:
         db_table = 'Bookmarks'
         verbose_name_plural = "Bookmarks"
+        constraints = [
+            # lets batch bookmarking insert with ON CONFLICT DO NOTHING instead of checking each recipe first
+            models.UniqueConstraint(fields=['user', 'recipe'], name='bookmarks_user_recipe_unique'),
+        ]
@@ -0,0 +1,42 @@
+"""
+Password checks and hashing for the async views, run in a bounded thread pool.
+
+PBKDF2, scrypt and argon2 release the GIL while they hash, so PASSWORD_HASHING_WORKERS threads hash in
+parallel while the event loop keeps serving other requests. Logins beyond that many wait for a free worker
+instead of piling more CPU work onto the process.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix='password-hashing')
+    return _executor
+
+
+async def run_in_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), functools.partial(func, *args))
+
+
+async def acheck_password(user, raw_password):
+    # user.check_password() off the event loop, including its re-hash when the hasher settings changed
+    is_correct, must_update = await run_in_pool(verify_password, raw_password, user.password)
+    if is_correct and must_update:
+        user.password = await run_in_pool(make_password, raw_password)
+        await user.asave(update_fields=['password'])
+    return is_correct
+
+
+async def amake_password(raw_password):
+    return await run_in_pool(make_password, raw_password)
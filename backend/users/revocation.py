@@ -0,0 +1,141 @@
+"""
+In-process filter of revoked (blacklisted) refresh token JTIs, so most refreshes skip the blacklist query.
+
+Used when settings.REVOCATION_FILTER is on. Each process builds a Bloom filter of every unexpired blacklisted JTI
+on first use and rebuilds it every REVOCATION_FILTER_REBUILD_SECONDS (which also drops tokens that expired or were
+pruned meanwhile). A JTI the filter contains (or a false positive, about REVOCATION_FILTER_ERROR_RATE of the rest)
+is checked against the database as before.
+
+Blacklisting adds the JTI locally right away and bumps the `revocations` cache generation on commit. A miss is only
+trusted while the filter has read every revocation up to the current generation: once another process moves the
+generation, the next lookup here first pulls the blacklist rows added since, through the primary key index (every
+refresh rotates and revokes a token, so this is usually a row or two). Primary keys can commit out of order, so
+numbers skipped below the highest row read are looked up again on each sync for REVOCATION_FILTER_GAP_SECONDS,
+until they show up or their transaction must have rolled back. That leaves no replay window beyond the moment
+between a blacklist commit and its generation bump, provided the cache holding the generation is shared by all
+processes.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from recipes.cache import bump_generation, get_generation
+
+GAP_WINDOW = 1000 # skipped primary keys tracked below a new row, more than there are blacklist inserts in flight at once
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8) # bits
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class RevocationFilter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.built_at = 0.0 # monotonic
+        self.last_pk = 0 # highest blacklist row read so far
+        self.gaps = {} # primary keys below last_pk not read yet -> when they were first skipped (monotonic)
+        self.generation = None
+
+    def might_be_revoked(self, jti):
+        generation = get_generation('revocations') # read before the database, a bump during a sync triggers another
+        with self.lock:
+            if self.needs_rebuild():
+                self.rebuild(generation)
+            elif generation != self.generation:
+                self.sync(generation) # something was revoked since the last sync
+            return jti in self.bloom
+
+    def needs_rebuild(self):
+        return (
+            self.bloom is None
+            or time.monotonic() - self.built_at > settings.REVOCATION_FILTER_REBUILD_SECONDS
+            or self.bloom.count > settings.REVOCATION_FILTER_CAPACITY # past capacity the false positive rate climbs
+        )
+
+    def rebuild(self, generation):
+        revoked = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).order_by('pk').values_list('pk', 'token__jti')
+        self.bloom = BloomFilter(settings.REVOCATION_FILTER_CAPACITY, settings.REVOCATION_FILTER_ERROR_RATE)
+        self.last_pk = 0
+        top = deque(maxlen=GAP_WINDOW)
+        for pk, jti in revoked.iterator(chunk_size=10000):
+            self.bloom.add(jti)
+            top.append(pk)
+            self.last_pk = pk
+        # expired and pruned rows leave holes too, only the ones just below the top can still be committing (an expired
+        # one there is read by the next sync and dropped from the gaps)
+        now = time.monotonic()
+        self.gaps = dict.fromkeys(set(range(max(self.last_pk - GAP_WINDOW, 0) + 1, self.last_pk)).difference(top), now)
+        self.built_at = now
+        self.generation = generation
+
+    def sync(self, generation):
+        # rows added since the last read and the gaps that may still commit, both through the primary key index
+        now = time.monotonic()
+        self.gaps = {pk: skipped_at for pk, skipped_at in self.gaps.items() if now - skipped_at < settings.REVOCATION_FILTER_GAP_SECONDS}
+        recent = BlacklistedToken.objects.filter(Q(pk__gt=self.last_pk) | Q(pk__in=list(self.gaps))).order_by('pk')
+        for pk, jti in recent.values_list('pk', 'token__jti'):
+            self.bloom.add(jti)
+            self.gaps.pop(pk, None)
+            if pk > self.last_pk:
+                self.gaps.update(dict.fromkeys(range(max(self.last_pk, pk - GAP_WINDOW) + 1, pk), now))
+                self.last_pk = pk
+        self.generation = generation
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+    def reset(self):
+        with self.lock:
+            self.bloom = None
+
+
+revocations = RevocationFilter()
+
+
+class FilteredRefreshToken(RefreshToken): # used by token refresh (SIMPLE_JWT's TOKEN_REFRESH_SERIALIZER) and logout
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if settings.REVOCATION_FILTER and not revocations.might_be_revoked(jti):
+            return # never blacklisted
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        jti = self.payload[api_settings.JTI_CLAIM]
+        revocations.add(jti)
+        transaction.on_commit(lambda: bump_generation('revocations'))
+        return blacklisted
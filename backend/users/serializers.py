@@ -1,7 +1,9 @@
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
 from .models import Users
 from .models import Bookmarks
 from recipes.models import Recipes
+from .revocation import FilteredRefreshToken
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -31,13 +33,18 @@ class LoginSerializer(serializers.Serializer):
         except Users.DoesNotExist:
             raise serializers.ValidationError("Incorrect email")
 
-        if not user.check_password(password):  # uses AbstractBaseUser's built-in check
+        # the async login view checks the password itself, in the hashing pool (users/passwords.py)
+        if not self.context.get('defer_password_check') and not user.check_password(password):  # uses AbstractBaseUser's built-in check
             raise serializers.ValidationError("Incorrect password")
 
         data['user'] = user
         return data
 
 
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
+
 class UserUpdateSerializer(serializers.ModelSerializer):
     old_password = serializers.CharField(write_only=True, required=True)
     new_password = serializers.CharField(write_only=True, required=False)
@@ -50,6 +57,8 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
     def validate_old_password(self, value):
         user = self.instance
+        if self.context.get('defer_password_check'): # checked in the hashing pool by the async update view
+            return value
         if not user.check_password(value):
             raise serializers.ValidationError("Old password is incorrect.")
         return value
@@ -70,9 +79,13 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         instance.username = validated_data.get('username', instance.username)
         instance.email = validated_data.get('email', instance.email)
         new_password = validated_data.get('new_password')
-        if new_password:
+        encoded_password = validated_data.get('encoded_password') # already hashed by the async update view
+        if encoded_password:
+            instance.password = encoded_password
+        elif new_password:
             instance.set_password(new_password)
-        instance.save()
+        # only what this form edits, nothing else of the instance (is_active, last_login) is written back
+        instance.save(update_fields=['username', 'email', *(['password'] if encoded_password or new_password else [])])
         return instance
 
 
@@ -110,4 +123,18 @@ class BookmarkCreateSerializer(serializers.ModelSerializer):
     
 class BookmarkDeleteSerializer(serializers.ModelSerializer):
     class Meta:
-        model = Bookmarks
\ No newline at end of file
+        model = Bookmarks
+
+
+class BookmarkBatchSerializer(serializers.Serializer): # {"add": [recipe ids], "remove": [recipe ids]}
+    max_ids = 100
+
+    add = serializers.ListField(child=serializers.UUIDField(), required=False, default=list, max_length=max_ids)
+    remove = serializers.ListField(child=serializers.UUIDField(), required=False, default=list, max_length=max_ids)
+
+    def validate(self, data):
+        if not data['add'] and not data['remove']:
+            raise serializers.ValidationError("Provide recipe ids to add or remove.")
+        if set(data['add']) & set(data['remove']):
+            raise serializers.ValidationError("A recipe can't be both added and removed.")
+        return data
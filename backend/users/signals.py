@@ -0,0 +1,47 @@
+"""
+Keeps the counters on Users in step with deletes, whichever way the rows go: a delete view, QuerySet.delete(), the
+admin, or cascading from a recipe or an account. Creates are counted where the rows are inserted.
+"""
+from collections import Counter
+
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from recipes.signals import deleted_with, note_deleted
+from .auth_cache import forget_user
+from .counters import COUNTED, adjust_counters, lower_counters
+from .models import Users
+
+
+@receiver(pre_delete, sender=Users)
+def user_deleting(sender, instance, origin=None, **kwargs):
+    note_deleted(origin, instance)
+
+
+@receiver(post_delete, sender=Users)
+def user_deleted(sender, instance, **kwargs):
+    forget_user(instance.pk) # token authentication must not keep serving the account
+
+
+def counted_row_deleting(sender, instance, origin=None, **kwargs):
+    # tallied per user on the object delete() was called on; every pre_delete of the call comes before any post_delete
+    if origin is not None and not getattr(origin, '_recounted', False):
+        tally = origin.__dict__.setdefault('_counter_deltas', Counter())
+        tally[instance.user_id, counter_fields[sender]] += 1
+
+
+def counted_row_deleted(sender, instance, origin=None, **kwargs):
+    if origin is None: # a signal sent by hand, not from a delete() call
+        adjust_counters(instance.user_id, **{counter_fields[sender]: -1})
+        return
+    # the first post_delete of the call applies the whole tally in one UPDATE, the rest find it gone; nothing to keep
+    # in step for owners whose account goes in the same delete() call
+    tally = origin.__dict__.pop('_counter_deltas', None)
+    if tally:
+        lower_counters({key: count for key, count in tally.items() if not deleted_with(origin, Users, key[0])})
+
+
+counter_fields = dict(COUNTED)
+for model in counter_fields:
+    pre_delete.connect(counted_row_deleting, sender=model, dispatch_uid=f'users.counters.pre.{model._meta.label}')
+    post_delete.connect(counted_row_deleted, sender=model, dispatch_uid=f'users.counters.{model._meta.label}')
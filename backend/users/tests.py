@@ -1,3 +1,514 @@
-from django.test import TestCase
+import os
+import subprocess
+import sys
+import threading
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from recipes.cache import bump_generation
+from recipes.models import Recipes
+from recipes.tests import make_recipe
+from reviews.aggregates import record_review_added
+from reviews.models import Reviews
+from .auth_cache import cache_user, get_cached_user, local_users
+from .cache import bookmarks_key, get_bookmarked_ids, get_bookmarks_version
+from .counters import adjust_counters, rebuild_user_counters
+from .models import COUNTER_FIELDS, Bookmarks, Users
+from .passwords import run_in_pool
+from .revocation import FilteredRefreshToken, RevocationFilter, revocations
+from .serializers import BookmarkCreateSerializer, UserUpdateSerializer
+
+
+def make_user(name):
+    return Users.objects.create_user(email=f'{name}@example.com', username=name, password='pw-12345!x')
+
+
+def make_bookmark(user, recipe):
+    adjust_counters(user.pk, bookmark_count=1) # as the bookmark view does
+    return Bookmarks.objects.create(user=user, recipe=recipe)
+
+
+class BookmarkCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('cook')
+        self.recipes = [make_recipe(self.user, f'Recipe {number}') for number in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bookmark(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/acc/bookmark/', {'recipe_id': str(recipe.pk)}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def flags(self):
+        response = self.client.get('/api/recipes/catalog/')
+        self.assertEqual(response.status_code, 200)
+        return {row['recipe_id']: row['is_bookmarked'] for row in response.json()['results']}
+
+    def test_set_is_served_from_the_cache(self):
+        Bookmarks.objects.create(user=self.user, recipe=self.recipes[0])
+        self.assertEqual(get_bookmarked_ids(self.user), {self.recipes[0].pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_bookmarked_ids(self.user), {self.recipes[0].pk})
+
+    def test_bookmark_shows_in_listings(self):
+        self.flags()
+        self.bookmark(self.recipes[1])
+        self.assertEqual(self.flags(), {str(recipe.pk): recipe == self.recipes[1] for recipe in self.recipes})
+
+    def test_delete_shows_in_listings(self):
+        self.bookmark(self.recipes[1])
+        self.flags()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/acc/bookmark/{self.recipes[1].pk}/delete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(self.flags().values()))
+
+    def test_batch_shows_in_listings(self):
+        self.bookmark(self.recipes[0])
+        self.flags()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/acc/bookmarks/batch/', {
+                'add': [str(self.recipes[1].pk), str(self.recipes[2].pk)], 'remove': [str(self.recipes[0].pk)],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_bookmarked_ids(self.user), {self.recipes[1].pk, self.recipes[2].pk})
+
+    def test_set_loaded_before_a_write_is_not_served_after_it(self):
+        # a reader that loaded the set before the write commits stores it late, under the version it started with
+        version = get_bookmarks_version(self.user.pk)
+        self.bookmark(self.recipes[0])
+        cache.set(bookmarks_key(self.user.pk, version), frozenset())
+        self.assertEqual(get_bookmarked_ids(self.user), {self.recipes[0].pk})
+
+    def test_consecutive_writes_are_all_kept(self):
+        get_bookmarked_ids(self.user)
+        self.bookmark(self.recipes[0])
+        self.bookmark(self.recipes[1])
+        self.assertEqual(get_bookmarked_ids(self.user), {self.recipes[0].pk, self.recipes[1].pk})
+
+    def test_sets_are_per_user(self):
+        other = make_user('other')
+        Bookmarks.objects.create(user=other, recipe=self.recipes[2])
+        self.bookmark(self.recipes[0])
+        self.assertEqual(get_bookmarked_ids(self.user), {self.recipes[0].pk})
+        self.assertEqual(get_bookmarked_ids(other), {self.recipes[2].pk})
+
+
+class BookmarkEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('cook')
+        self.recipes = [make_recipe(self.user, f'Recipe {number}') for number in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bookmark_count(self):
+        return Users.objects.get(pk=self.user.pk).bookmark_count
+
+    def test_create(self):
+        response = self.client.post('/api/acc/bookmark/', {'recipe_id': str(self.recipes[0].pk)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.bookmark_count(), 1)
+
+    def test_repeated_create_is_rejected(self):
+        self.client.post('/api/acc/bookmark/', {'recipe_id': str(self.recipes[0].pk)}, format='json')
+        response = self.client.post('/api/acc/bookmark/', {'recipe_id': str(self.recipes[0].pk)}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_create_returns_the_existing_bookmark(self):
+        existing = make_bookmark(self.user, self.recipes[0])
+        # as if the other request inserted after this one's validation
+        with mock.patch.object(BookmarkCreateSerializer, 'validate', lambda serializer, data: data):
+            response = self.client.post('/api/acc/bookmark/', {'recipe_id': str(self.recipes[0].pk)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['bookmark_id'], str(existing.pk))
+        self.assertEqual(Bookmarks.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.bookmark_count(), 1) # the counter is only moved by the insert that won
+
+    def test_unknown_recipe_is_rejected(self):
+        response = self.client.post('/api/acc/bookmark/', {'recipe_id': str(uuid.uuid4())}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_adds_and_removes(self):
+        make_bookmark(self.user, self.recipes[0])
+        missing = uuid.uuid4()
+        response = self.client.post('/api/acc/bookmarks/batch/', {
+            'add': [str(self.recipes[1].pk), str(self.recipes[2].pk), str(missing)],
+            'remove': [str(self.recipes[0].pk)],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'added': [str(self.recipes[1].pk), str(self.recipes[2].pk)],
+            'removed': [str(self.recipes[0].pk)],
+            'not_found': [str(missing)],
+        })
+        self.assertEqual(set(Bookmarks.objects.filter(user=self.user).values_list('recipe_id', flat=True)), {self.recipes[1].pk, self.recipes[2].pk})
+        self.assertEqual(self.bookmark_count(), 2)
+
+    def test_batch_skips_existing_bookmarks(self):
+        make_bookmark(self.user, self.recipes[0])
+        response = self.client.post('/api/acc/bookmarks/batch/', {'add': [str(self.recipes[0].pk)] * 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Bookmarks.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.bookmark_count(), 1)
+
+    def test_recipe_batch_keeps_the_order_asked_for(self):
+        missing = uuid.uuid4()
+        ids = [self.recipes[2].pk, missing, self.recipes[0].pk]
+        response = self.client.get('/api/recipes/batch/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['recipe_id'] for row in response.json()['results']], [str(self.recipes[2].pk), str(self.recipes[0].pk)])
+        self.assertEqual(response.json()['not_found'], [str(missing)])
+
+
+class AuthUserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        self.user = make_user('cook')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def user_queries(self):
+        # the Users queries of one stats request, besides the stats lookup itself
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/acc/stats/').status_code, 200)
+        return len([query for query in queries if 'FROM "Users"' in query['sql']]) - 1
+
+    def test_warm_request_runs_no_user_query(self):
+        self.assertEqual(self.user_queries(), 1)
+        self.assertEqual(self.user_queries(), 0)
+
+    def test_deactivated_user_is_rejected_right_away(self):
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/acc/stats/').status_code, 401)
+
+    def test_profile_update_drops_the_cached_user(self):
+        self.user_queries()
+        response = self.client.patch('/api/acc/update/', {'username': 'chef'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(get_cached_user(self.user.pk))
+        self.user_queries()
+        self.assertEqual(get_cached_user(self.user.pk).username, 'chef')
+
+    def test_logout_drops_the_cached_user(self):
+        self.user_queries()
+        response = self.client.post('/api/acc/logout/', {'refresh': str(RefreshToken.for_user(self.user))}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(get_cached_user(self.user.pk))
+
+    def test_deleted_user_is_rejected(self):
+        self.user_queries()
+        Users.objects.get(pk=self.user.pk).delete()
+        self.assertEqual(self.client.get('/api/acc/stats/').status_code, 401)
+
+    def test_callers_get_a_copy(self):
+        self.user_queries()
+        get_cached_user(self.user.pk).username = 'changed'
+        self.assertEqual(get_cached_user(self.user.pk).username, 'cook')
+
+    @override_settings(AUTH_USER_CACHE_TTL=0)
+    def test_zero_ttl_turns_the_cache_off(self):
+        self.assertEqual(self.user_queries(), 1)
+        self.assertEqual(self.user_queries(), 1)
+
+    @override_settings(AUTH_USER_SHARED_CACHE_TTL=60)
+    def test_shared_cache_serves_other_processes(self):
+        self.user_queries()
+        local_users.clear() # as if this were another worker
+        self.assertEqual(self.user_queries(), 0)
+        self.user.save()
+        self.assertEqual(self.user_queries(), 1)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner, self.fan = make_user('owner'), make_user('fan')
+        self.recipes = [make_recipe(self.owner, f'Recipe {number}') for number in range(2)]
+        self.fan_recipe = make_recipe(self.fan, 'Fan recipe')
+        for recipe in self.recipes:
+            make_bookmark(self.fan, recipe)
+            self.review(self.fan, recipe)
+        make_bookmark(self.owner, self.fan_recipe)
+        self.review(self.owner, self.fan_recipe)
+
+    def review(self, user, recipe):
+        review = Reviews.objects.create(user=user, recipe=recipe, rating=4, comment='Tasty')
+        record_review_added(review)
+        adjust_counters(user.pk, review_count=1) # as the review upload view does
+
+    def counters(self, user):
+        return tuple(Users.objects.filter(pk=user.pk).values_list(*COUNTER_FIELDS).get())
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def assertCountersMatchRebuilt(self):
+        stored = list(Users.objects.order_by('pk').values_list(*COUNTER_FIELDS))
+        rebuild_user_counters()
+        self.assertEqual(list(Users.objects.order_by('pk').values_list(*COUNTER_FIELDS)), stored)
+
+    def test_recipe_delete_view_lowers_everyones_counters(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.owner).delete(f'/api/recipes/delete/{self.recipes[0].pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.counters(self.owner), (1, 1, 1))
+        self.assertEqual(self.counters(self.fan), (1, 1, 1))
+        self.assertCountersMatchRebuilt()
+
+    def test_bookmark_and_review_delete_views(self):
+        client = self.client_for(self.fan)
+        self.assertEqual(client.delete(f'/api/acc/bookmark/{self.recipes[0].pk}/delete/').status_code, 200)
+        review = Reviews.objects.get(user=self.fan, recipe=self.recipes[0])
+        self.assertEqual(client.delete(f'/api/reviews/delete/{review.pk}/').status_code, 204)
+        self.assertEqual(self.counters(self.fan), (1, 1, 1))
+
+    def test_queryset_deletes(self):
+        Recipes.objects.filter(pk__in=[recipe.pk for recipe in self.recipes]).delete()
+        Bookmarks.objects.filter(user=self.owner).delete()
+        self.assertEqual(self.counters(self.owner), (0, 0, 1))
+        self.assertEqual(self.counters(self.fan), (1, 0, 0))
+        self.assertCountersMatchRebuilt()
+
+    def counter_updates(self, queries):
+        return [query for query in queries if query['sql'].startswith('UPDATE "Users"')]
+
+    def test_cascade_lowers_counters_in_one_update(self):
+        for number in range(5):
+            fan = make_user(f'fan{number}')
+            make_bookmark(fan, self.recipes[0])
+            self.review(fan, self.recipes[0])
+        with CaptureQueriesContext(connection) as queries:
+            Recipes.objects.get(pk=self.recipes[0].pk).delete()
+        self.assertEqual(len(self.counter_updates(queries)), 1)
+        self.assertEqual(self.counters(self.fan), (1, 1, 1))
+        self.assertCountersMatchRebuilt()
+
+    def test_batch_removal_only_recounts(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(self.fan).post('/api/acc/bookmarks/batch/', {
+                'remove': [str(recipe.pk) for recipe in self.recipes],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.counter_updates(queries)), 1) # refresh_bookmark_count
+        self.assertEqual(self.counters(self.fan), (1, 0, 2))
+
+    def test_account_delete_lowers_other_users_counters(self):
+        Users.objects.get(pk=self.owner.pk).delete()
+        self.assertEqual(self.counters(self.fan), (1, 0, 0))
+        self.assertCountersMatchRebuilt()
+
+    def test_bulk_account_delete(self):
+        third = make_user('third')
+        make_bookmark(third, self.fan_recipe)
+        Users.objects.filter(pk__in=[self.owner.pk, third.pk]).delete()
+        self.assertEqual(self.counters(self.fan), (1, 0, 0))
+        self.assertCountersMatchRebuilt()
+
+    def test_account_delete_forgets_the_cached_user(self):
+        cache_user(self.owner)
+        Users.objects.filter(pk=self.owner.pk).delete()
+        self.assertIsNone(get_cached_user(self.owner.pk))
+
+    def test_stats_endpoint(self):
+        client = self.client_for(self.fan)
+        with self.assertNumQueries(1):
+            response = client.get('/api/acc/stats/')
+        self.assertEqual(response.json(), {'recipe_count': 1, 'bookmark_count': 2, 'review_count': 2})
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000) # cheap hashes, the tests only change the work factor
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        local_users.clear()
+        self.user = make_user('cook')
+        self.login = {'email': 'cook@example.com', 'password': 'pw-12345!x'}
+
+    def iterations(self):
+        encoded = Users.objects.get(pk=self.user.pk).password
+        return identify_hasher(encoded).decode(encoded)['iterations']
+
+    async def post_both(self, path, data, method='post', headers=None):
+        # the same request to the sync view and to its async twin
+        sync_response = await sync_to_async(getattr(APIClient(), method))(f'/api/acc/{path}', data, format='json', headers=headers)
+        async_response = await getattr(AsyncClient(), method)(f'/api/acc/async/{path}', data, content_type='application/json', headers=headers)
+        return sync_response, async_response
+
+    async def test_async_login_matches_sync_login(self):
+        sync_response, async_response = await self.post_both('login/', self.login)
+        self.assertEqual(async_response.status_code, 200)
+        without_tokens = lambda body: {key: value for key, value in body.items() if key not in ('access', 'refresh')}
+        self.assertEqual(without_tokens(async_response.json()), without_tokens(sync_response.json()))
+
+    async def test_async_login_errors_match_sync_login(self):
+        for login in ({**self.login, 'password': 'wrong'}, {**self.login, 'email': 'nobody@example.com'}, {}):
+            sync_response, async_response = await self.post_both('login/', login)
+            self.assertEqual((async_response.status_code, async_response.json()), (400, sync_response.json()))
+
+    async def test_async_update_checks_the_old_password(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        sync_response, async_response = await self.post_both('update/', {'old_password': 'wrong', 'username': 'chef'}, method='patch', headers=headers)
+        self.assertEqual((async_response.status_code, async_response.json()), (400, sync_response.json()))
+
+        async_response = await AsyncClient().patch('/api/acc/async/update/', {
+            'old_password': 'pw-12345!x', 'new_password': 'new-pw-6789!', 'username': 'chef',
+        }, content_type='application/json', headers=headers)
+        self.assertEqual(async_response.json(), {'username': 'chef', 'email': 'cook@example.com'})
+        user = await Users.objects.aget(pk=self.user.pk)
+        self.assertTrue(await sync_to_async(user.check_password)('new-pw-6789!'))
+
+    async def cache_then_change(self, **fields):
+        # the user is cached by one request, then changed by something that doesn't reach this process's cache
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = await sync_to_async(APIClient().get)('/api/acc/stats/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        await Users.objects.filter(pk=self.user.pk).aupdate(**fields)
+        return headers
+
+    async def test_update_checks_the_old_password_against_the_stored_hash(self):
+        other_hash = await sync_to_async(make_password)('changed-pw-1!')
+        headers = await self.cache_then_change(password=other_hash)
+        responses = await self.post_both('update/', {'old_password': 'pw-12345!x', 'username': 'chef'}, method='patch', headers=headers)
+        self.assertEqual([response.status_code for response in responses], [400, 400])
+        self.assertEqual((await Users.objects.aget(pk=self.user.pk)).username, 'cook')
+
+    async def test_update_does_not_reactivate_the_account(self):
+        headers = await self.cache_then_change(is_active=False)
+        responses = await self.post_both('update/', {'old_password': 'pw-12345!x', 'username': 'chef'}, method='patch', headers=headers)
+        self.assertEqual([response.status_code for response in responses], [401, 401])
+        user = await Users.objects.aget(pk=self.user.pk)
+        self.assertEqual((user.is_active, user.username), (False, 'cook'))
+
+    def test_update_writes_only_the_edited_fields(self):
+        stale = Users.objects.get(pk=self.user.pk)
+        Users.objects.filter(pk=self.user.pk).update(image_link='set-elsewhere.png')
+        serializer = UserUpdateSerializer(stale, data={'old_password': 'pw-12345!x', 'username': 'chef'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(Users.objects.values_list('username', 'image_link').get(pk=self.user.pk), ('chef', 'set-elsewhere.png'))
+
+    def test_work_factor_comes_from_settings(self):
+        self.assertEqual(self.iterations(), 1000)
+
+    def test_login_rehashes_after_the_work_factor_changes(self):
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1500):
+            self.assertEqual(APIClient().post('/api/acc/login/', self.login, format='json').status_code, 200)
+            self.assertEqual(self.iterations(), 1500)
+
+    async def test_async_login_rehashes_after_the_work_factor_changes(self):
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1500):
+            response = await AsyncClient().post('/api/acc/async/login/', self.login, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(await sync_to_async(self.iterations)(), 1500)
+
+    async def test_failed_login_keeps_the_old_hash(self):
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1500):
+            await AsyncClient().post('/api/acc/async/login/', {**self.login, 'password': 'wrong'}, content_type='application/json')
+            self.assertEqual(await sync_to_async(self.iterations)(), 1000)
+
+    async def test_hashing_runs_in_the_pool(self):
+        name = await run_in_pool(lambda: threading.current_thread().name)
+        self.assertTrue(name.startswith('password-hashing'))
+
+
+@override_settings(REVOCATION_FILTER=True)
+class RevocationFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        revocations.reset()
+        self.user = make_user('cook')
+        self.refresh = FilteredRefreshToken.for_user(self.user)
+        self.jti = self.refresh['jti']
+
+    def check(self, token=None):
+        FilteredRefreshToken(str(token or self.refresh)) # runs check_blacklist
+
+    def blacklist(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.refresh.blacklist()
+
+    def test_unrevoked_token_needs_no_blacklist_query(self):
+        self.check()
+        with self.assertNumQueries(0):
+            self.check()
+
+    def test_revoked_token_is_rejected_in_the_same_process(self):
+        self.check()
+        self.blacklist()
+        with self.assertRaises(TokenError):
+            self.check()
+
+    def test_replayed_refresh_is_rejected(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/acc/token/refresh/', {'refresh': str(self.refresh)}, format='json').status_code, 200)
+        self.assertEqual(client.post('/api/acc/token/refresh/', {'refresh': str(self.refresh)}, format='json').status_code, 401)
+
+    def test_revoked_token_is_rejected_by_another_process(self):
+        other = RevocationFilter() # another worker, sharing only the cache and the database
+        self.assertFalse(other.might_be_revoked(self.jti))
+        self.blacklist()
+        self.assertTrue(other.might_be_revoked(self.jti))
+        with mock.patch('users.revocation.revocations', other), self.assertRaises(TokenError):
+            self.check()
+
+    def test_lookups_skip_the_blacklist_while_other_tokens_are_revoked(self):
+        other = RevocationFilter()
+        other.might_be_revoked(self.jti)
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True): # a refresh in another worker
+                FilteredRefreshToken.for_user(self.user).blacklist()
+            with mock.patch('users.revocation.revocations', other), CaptureQueriesContext(connection) as queries:
+                self.check()
+            self.assertEqual(len(queries), 1) # the sync, reading the one new row
+            self.assertNotIn('"token_blacklist_outstandingtoken"."jti" =', queries[0]['sql'])
+
+    def test_row_committed_out_of_order_is_read_later(self):
+        other = RevocationFilter()
+        other.might_be_revoked(self.jti)
+        earlier = FilteredRefreshToken.for_user(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            earlier.blacklist()
+            FilteredRefreshToken.for_user(self.user).blacklist()
+        # the earlier row's transaction hasn't committed when the other worker syncs
+        row = BlacklistedToken.objects.get(token__jti=earlier['jti'])
+        row.delete()
+        self.assertFalse(other.might_be_revoked(earlier['jti']))
+        BlacklistedToken.objects.create(pk=row.pk, token=row.token)
+        bump_generation('revocations')
+        self.assertTrue(other.might_be_revoked(earlier['jti']))
+
+    @override_settings(REVOCATION_FILTER=False)
+    def test_disabled_filter_checks_the_table(self):
+        with mock.patch.object(RevocationFilter, 'might_be_revoked') as might_be_revoked, self.assertNumQueries(1):
+            self.check()
+        might_be_revoked.assert_not_called()
+
+    def test_filter_is_only_on_by_default_with_a_shared_cache(self):
+        def enabled(**env):
+            environ = {name: value for name, value in os.environ.items() if name not in ('CACHE_BACKEND', 'REVOCATION_FILTER')}
+            code = 'import spice_bazaar.settings as s; print(s.REVOCATION_FILTER)'
+            result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env={**environ, **env}, capture_output=True, text=True)
+            return result.stdout.strip()
+
+        self.assertEqual(enabled(), 'False')
+        self.assertEqual(enabled(CACHE_BACKEND='django.core.cache.backends.redis.RedisCache'), 'True')
+        self.assertEqual(enabled(REVOCATION_FILTER='1'), 'True')
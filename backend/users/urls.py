@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import RegisterView, LoginView, UserUpdateView, LogoutView, BookmarkCreateView, BookmarkDeleteView
+from .async_views import AsyncLoginView, AsyncUserUpdateView
+from .views import RegisterView, LoginView, UserUpdateView, LogoutView, UserStatsView, BookmarkCreateView, BookmarkDeleteView, BookmarkBatchView
 from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
@@ -7,7 +8,12 @@ urlpatterns = [
     path('login/', LoginView.as_view(), name='login'),
     path('update/', UserUpdateView.as_view(), name='update-user'),
     path('logout/', LogoutView.as_view(), name='logout'),
+    path('stats/', UserStatsView.as_view(), name='user-stats'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('bookmark/', BookmarkCreateView.as_view(), name='create-bookmark'),
     path('bookmark/<uuid:recipe_id>/delete/', BookmarkDeleteView.as_view(), name='delete-bookmark'),
+    path('bookmarks/batch/', BookmarkBatchView.as_view(), name='batch-bookmarks'),
+    # async login / update, password hashing runs in a thread pool (see users/async_views.py)
+    path('async/login/', AsyncLoginView.as_view(), name='async-login'),
+    path('async/update/', AsyncUserUpdateView.as_view(), name='async-update-user'),
 ]
\ No newline at end of file
@@ -1,12 +1,21 @@
-from rest_framework import generics, status
+from django.db.models import F, Q
+from django.db import IntegrityError, transaction
+from rest_framework import exceptions, generics, status
+from rest_framework.exceptions import ErrorDetail
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Users, Bookmarks
+from .models import Users, Bookmarks, COUNTER_FIELDS
 from recipes.models import Recipes
-from .serializers import RegisterSerializer, LoginSerializer, UserUpdateSerializer, BookmarkCreateSerializer, BookmarkDeleteSerializer
+from recipes.cache import invalidate_recipe_listings
+from .cache import invalidate_bookmarked_ids
+from spice_bazaar.db_router import ReplicaReadMixin
+from .auth_cache import forget_user
+from .counters import adjust_counters, recounted, refresh_bookmark_count
+from .revocation import FilteredRefreshToken
+from .serializers import RegisterSerializer, LoginSerializer, UserUpdateSerializer, BookmarkCreateSerializer, BookmarkDeleteSerializer, BookmarkBatchSerializer
 
 
 class RegisterView(generics.CreateAPIView):
@@ -23,39 +32,81 @@ class LoginView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
+        return Response(self.get_login_data(user))
 
+    @staticmethod
+    def get_login_data(user): # shared with AsyncLoginView
         refresh = RefreshToken.for_user(user)
 
-        recipe_count = Recipes.objects.filter(user=user).count()
-        bookmark_count = Bookmarks.objects.filter(user=user).count()
-
-        return Response({
+        return {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
             'username': user.username,
             'email': user.email,
             'reg_date': user.reg_date,
             'image_link': user.image_link,
-            'recipe_count': recipe_count,
-            'bookmark_count': bookmark_count
-        })
+            'recipe_count': user.recipe_count,
+            'bookmark_count': user.bookmark_count,
+            'review_count': user.review_count,
+        }
+
 
+def load_account(user_id, lock=False):
+    rows = Users.objects.select_for_update() if lock else Users.objects.all()
+    user = rows.filter(pk=user_id).first()
+    if user is None:
+        raise exceptions.AuthenticationFailed('User not found')
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed('User is inactive')
+    return user
 
 class UserUpdateView(generics.UpdateAPIView):
     serializer_class = UserUpdateSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # the stored row, locked until the update commits: request.user can be an older copy from the authentication
+        # cache, and the old password has to match the current hash
+        return load_account(self.request.user.pk, lock=True)
+
+    @transaction.atomic
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    @transaction.atomic
+    def save_checked(self, serializer, checked_password):
+        # the async view checks the old password in the hashing pool, without the row lock; it saves only if the
+        # hash it checked against is still the stored one
+        user = load_account(serializer.instance.pk, lock=True)
+        if checked_password is not None and user.password != checked_password:
+            raise exceptions.ValidationError({'old_password': [ErrorDetail('Old password is incorrect.', code='invalid')]})
+        serializer.instance = user
+        self.perform_update(serializer)
+
+    def perform_update(self, serializer):
+        old_username = serializer.instance.username
+        user = serializer.save()
+        if user.username != old_username:
+            # author and reviewer names are embedded in recipe payloads, so their cached copies and ETags must change
+            Recipes.objects.filter(Q(user=user) | Q(reviews__user=user)).update(version=F('version') + 1)
+            invalidate_recipe_listings()
     
+class UserStatsView(ReplicaReadMixin, APIView): # the stored counters, one primary key lookup
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # not request.user's own fields, that instance can come from the authentication cache
+        return Response(Users.objects.filter(pk=request.user.pk).values(*COUNTER_FIELDS).get())
+
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         try:
             refresh_token = request.data.get('refresh')
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
+            forget_user(request.user.pk)
             return Response({"message": "Logout successful."}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -65,7 +116,24 @@ class BookmarkCreateView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save()
+        with transaction.atomic():
+            bookmark = serializer.save()
+            adjust_counters(bookmark.user_id, bookmark_count=1)
+        invalidate_bookmarked_ids(bookmark.user_id)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_id = serializer.validated_data['recipe_id']
+        try:
+            self.perform_create(serializer)
+        except IntegrityError:
+            # a concurrent request for the same recipe inserted between the validation and our insert
+            bookmark = Bookmarks.objects.filter(user=request.user, recipe_id=recipe_id).first()
+            if bookmark is None: # not the unique constraint (the recipe was deleted meanwhile)
+                raise
+            return Response(self.get_serializer(bookmark).data, status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
         
         
 class BookmarkDeleteView(generics.DestroyAPIView):
@@ -75,6 +143,10 @@ class BookmarkDeleteView(generics.DestroyAPIView):
     
     def get_queryset(self): # allow only the user who created the bookmark to delete it
         return Bookmarks.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        instance.delete() # bookmark_count follows in users/signals.py
+        invalidate_bookmarked_ids(instance.user_id)
     
     def destroy(self, request, *args, **kwargs):
         try:
@@ -82,4 +154,36 @@ class BookmarkDeleteView(generics.DestroyAPIView):
             self.perform_destroy(instance)
             return Response({"message": "Bookmark deleted successfully."}, status=status.HTTP_200_OK)
         except:
-            return Response({"error": "Bookmark not found."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({"error": "Bookmark not found."}, status=status.HTTP_404_NOT_FOUND)
+
+
+class BookmarkBatchView(APIView): # adds and removes many bookmarks in one request, for offline sync and multi-select
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BookmarkBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add, remove = serializer.validated_data['add'], serializer.validated_data['remove']
+        user = request.user
+
+        with transaction.atomic():
+            added, not_found = [], []
+            if add:
+                existing = set(Recipes.objects.filter(recipe_id__in=add).values_list('recipe_id', flat=True))
+                added = [recipe_id for recipe_id in dict.fromkeys(add) if recipe_id in existing]
+                not_found = [recipe_id for recipe_id in dict.fromkeys(add) if recipe_id not in existing]
+                # one INSERT; recipes that are already bookmarked hit the unique constraint and are skipped
+                Bookmarks.objects.bulk_create(
+                    [Bookmarks(user=user, recipe_id=recipe_id) for recipe_id in added],
+                    ignore_conflicts=True,
+                )
+            if remove:
+                recounted(Bookmarks.objects.filter(user=user, recipe_id__in=remove)).delete()
+            refresh_bookmark_count(user.pk)
+            invalidate_bookmarked_ids(user.pk)
+
+        return Response({
+            "added": [str(recipe_id) for recipe_id in added],
+            "removed": [str(recipe_id) for recipe_id in dict.fromkeys(remove)],
+            "not_found": [str(recipe_id) for recipe_id in not_found],
+        }, status=status.HTTP_200_OK)
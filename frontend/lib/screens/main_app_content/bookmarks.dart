@@ -2,9 +2,9 @@ import 'package:flutter/material.dart';
 import 'package:spice_bazaar/constants.dart';
 import 'package:spice_bazaar/models/recipe.dart';
 import 'package:spice_bazaar/models/users.dart';
+import 'package:spice_bazaar/services/recipe_pages.dart';
+import 'package:spice_bazaar/widgets/load_more_indicator.dart';
 import 'package:spice_bazaar/widgets/recipe_card.dart';
-import 'package:http/http.dart' as http;
-import 'dart:convert';
 
 import 'package:uicons_updated/icons/uicons_regular.dart';
 
@@ -29,6 +29,8 @@ class FavouritesContentState extends State<FavouritesContent> {
   bool isLoading = true;
   String? errorMessage;
   List<dynamic>? recipeList;
+  String? nextPageUrl; // bookmarks are loaded a page at a time, null once the last page is in
+  bool isLoadingMore = false;
 
   @override
   void initState() {
@@ -38,28 +40,13 @@ class FavouritesContentState extends State<FavouritesContent> {
 
   void fetchRecipes() async {
     try {
-      final response = await http
-          .get(Uri.parse('$baseUrl/api/recipes/bookmarks/'), headers: {
-        'Authorization': 'Bearer ${widget.user.accessToken}',
+      final page = await fetchRecipePage(
+          '$baseUrl/api/recipes/bookmarks/', widget.user.accessToken);
+      setState(() {
+        recipes = page.recipes;
+        nextPageUrl = page.next;
+        isLoading = false;
       });
-
-      // Check if response is valid before proceeding
-      if (response.statusCode == 200) {
-        final dynamic decodedResponse = json.decode(response.body);
-
-        if (decodedResponse is List) {
-          setState(() {
-            recipes = decodedResponse
-                .map((recipeJson) => Recipe.fromJson(recipeJson))
-                .toList();
-            isLoading = false;
-          });
-        } else {
-          throw Exception('Invalid response format');
-        }
-      } else {
-        throw Exception('Failed to load recipes: ${response.statusCode}');
-      }
     } catch (e) {
       setState(() {
         errorMessage = 'Failed to fetch recipes: $e';
@@ -69,6 +56,23 @@ class FavouritesContentState extends State<FavouritesContent> {
     }
   }
 
+  // called by the LoadMoreIndicator at the end of the list
+  Future<void> loadMoreRecipes() async {
+    final url = nextPageUrl;
+    if (url == null || isLoadingMore) return;
+    isLoadingMore = true;
+    try {
+      final page = await fetchRecipePage(url, widget.user.accessToken);
+      if (!mounted || url != nextPageUrl) return; // reloaded meanwhile
+      setState(() {
+        recipes.addAll(page.recipes);
+        nextPageUrl = page.next;
+      });
+    } finally {
+      isLoadingMore = false;
+    }
+  }
+
   @override
   Widget build(BuildContext context) {
     return isLoading
@@ -89,8 +93,13 @@ class FavouritesContentState extends State<FavouritesContent> {
             : (recipes.isNotEmpty)
                 ? ListView.builder(
                     padding: const EdgeInsets.symmetric(horizontal: 16),
-                    itemCount: recipes.length + 1,
+                    itemCount: recipes.length + (nextPageUrl != null ? 2 : 1),
                     itemBuilder: (context, index) {
+                      if (index > recipes.length) {
+                        return LoadMoreIndicator(
+                            key: ValueKey(nextPageUrl), // a new one per page
+                            onLoadMore: loadMoreRecipes);
+                      }
                       return index == 0
                           ? Padding(
                               padding: const EdgeInsets.symmetric(
@@ -5,9 +5,9 @@ import 'package:spice_bazaar/constants.dart';
 import 'package:spice_bazaar/models/recipe.dart';
 import 'package:spice_bazaar/models/recipe_filters.dart';
 import 'package:spice_bazaar/models/users.dart';
+import 'package:spice_bazaar/services/recipe_pages.dart';
+import 'package:spice_bazaar/widgets/load_more_indicator.dart';
 import 'package:spice_bazaar/widgets/recipe_card.dart';
-import 'package:http/http.dart' as http;
-import 'dart:convert';
 
 import 'package:uicons_updated/uicons.dart';
 
@@ -38,6 +38,8 @@ class DiscoverContentState extends State<DiscoverContent> {
   bool isLoading = true;
   String? errorMessage;
   List<dynamic>? recipeList;
+  String? nextPageUrl; // the catalog is loaded a page at a time, null once the last page is in
+  bool isLoadingMore = false;
 
   // Get all unique tags from recipes
   List<String> getAllTags() {
@@ -56,28 +58,14 @@ class DiscoverContentState extends State<DiscoverContent> {
 
   void fetchRecipes() async {
     try {
-      final response =
-          await http.get(Uri.parse('$baseUrl/api/recipes/catalog/'), headers: {
-        'Authorization': 'Bearer ${widget.user.accessToken}',
+      final page = await fetchRecipePage(
+          '$baseUrl/api/recipes/catalog/', widget.user.accessToken);
+      setState(() {
+        recipes = page.recipes;
+        nextPageUrl = page.next;
+        isLoading = false;
       });
-
-      // Check if response is valid before proceeding
-      if (response.statusCode == 200) {
-        final dynamic decodedResponse = json.decode(response.body);
-
-        if (decodedResponse is List) {
-          setState(() {
-            recipes = decodedResponse
-                .map((recipeJson) => Recipe.fromJson(recipeJson))
-                .toList();
-            isLoading = false;
-          });
-        } else {
-          throw Exception('Invalid response format');
-        }
-      } else {
-        throw Exception('Failed to load recipes: ${response.statusCode}');
-      }
+      if (_filters.isActive) applyFilters();
     } catch (e) {
       setState(() {
         errorMessage = 'Failed to fetch recipes: $e';
@@ -87,6 +75,24 @@ class DiscoverContentState extends State<DiscoverContent> {
     }
   }
 
+  // called by the LoadMoreIndicator at the end of the list
+  Future<void> loadMoreRecipes() async {
+    final url = nextPageUrl;
+    if (url == null || isLoadingMore) return;
+    isLoadingMore = true;
+    try {
+      final page = await fetchRecipePage(url, widget.user.accessToken);
+      if (!mounted || url != nextPageUrl) return; // reloaded meanwhile
+      setState(() {
+        recipes.addAll(page.recipes);
+        nextPageUrl = page.next;
+      });
+      if (_filters.isActive) applyFilters();
+    } finally {
+      isLoadingMore = false;
+    }
+  }
+
   void updateFilters(RecipeFilters newFilters) {
     setState(() {
       _filters.searchQuery = newFilters.searchQuery;
@@ -361,8 +367,15 @@ class DiscoverContentState extends State<DiscoverContent> {
                     Expanded(
                       child: ListView.builder(
                         padding: const EdgeInsets.symmetric(horizontal: 16),
-                        itemCount: filteredRecipes.length + 1,
+                        itemCount: filteredRecipes.length +
+                            (nextPageUrl != null ? 2 : 1),
                         itemBuilder: (context, index) {
+                          if (index > filteredRecipes.length) {
+                            // filters only see the loaded recipes, keep loading while there are more
+                            return LoadMoreIndicator(
+                                key: ValueKey(nextPageUrl), // a new one per page
+                                onLoadMore: loadMoreRecipes);
+                          }
                           return index == 0
                               ? Padding(
                                   padding: const EdgeInsets.symmetric(
@@ -446,8 +459,14 @@ class DiscoverContentState extends State<DiscoverContent> {
                     Expanded(
                       child: ListView.builder(
                         padding: const EdgeInsets.symmetric(horizontal: 16),
-                        itemCount: recipes.length + 1,
+                        itemCount:
+                            recipes.length + (nextPageUrl != null ? 2 : 1),
                         itemBuilder: (context, index) {
+                          if (index > recipes.length) {
+                            return LoadMoreIndicator(
+                                key: ValueKey(nextPageUrl), // a new one per page
+                                onLoadMore: loadMoreRecipes);
+                          }
                           return index == 0
                               ? Padding(
                                   padding: const EdgeInsets.only(
@@ -3,11 +3,11 @@ import 'package:flutter/material.dart';
 import 'package:spice_bazaar/constants.dart';
 import 'package:spice_bazaar/models/recipe.dart';
 import 'package:spice_bazaar/models/users.dart';
+import 'package:spice_bazaar/services/recipe_pages.dart';
 import 'package:spice_bazaar/widgets/custom_button.dart';
+import 'package:spice_bazaar/widgets/load_more_indicator.dart';
 import 'package:spice_bazaar/widgets/recipe_card.dart';
 import 'package:uicons/uicons.dart';
-import 'package:http/http.dart' as http;
-import 'dart:convert';
 
 import 'package:uicons_updated/uicons.dart';
 
@@ -35,6 +35,8 @@ class MyRecipesContentState extends State<MyRecipesContent> {
   List<Recipe> userRecipes = [];
   bool isLoading = true;
   String? errorMessage;
+  String? nextPageUrl; // the user's recipes are loaded a page at a time, null once the last page is in
+  bool isLoadingMore = false;
 
   @override
   void initState() {
@@ -47,29 +49,13 @@ class MyRecipesContentState extends State<MyRecipesContent> {
   void fetchUserRecipes() async {
     try {
       print('Auth Token: ${widget.user.accessToken}'); // Debugging line
-      final response =
-          await http.get(Uri.parse('$baseUrl/api/recipes/uploaded/'), headers: {
-        'Authorization': 'Bearer ${widget.user.accessToken}',
+      final page = await fetchRecipePage(
+          '$baseUrl/api/recipes/uploaded/', widget.user.accessToken);
+      setState(() {
+        userRecipes = page.recipes;
+        nextPageUrl = page.next;
+        isLoading = false;
       });
-
-      // Check if response is valid before proceeding
-      if (response.statusCode == 200) {
-        final dynamic decodedResponse = json.decode(response.body);
-
-        if (decodedResponse is List) {
-          setState(() {
-            userRecipes = decodedResponse
-                .map((recipeJson) => Recipe.fromJson(recipeJson))
-                .toList();
-            isLoading = false;
-          });
-        } else {
-          throw Exception('Invalid response format');
-        }
-      } else {
-        print(response.body); // Log the response body for debugging
-        throw Exception('Failed to load recipes: ${response.statusCode}');
-      }
     } catch (e) {
       setState(() {
         errorMessage = 'Failed to fetch recipes: $e';
@@ -79,6 +65,23 @@ class MyRecipesContentState extends State<MyRecipesContent> {
     }
   }
 
+  // called by the LoadMoreIndicator at the end of the list
+  Future<void> loadMoreRecipes() async {
+    final url = nextPageUrl;
+    if (url == null || isLoadingMore) return;
+    isLoadingMore = true;
+    try {
+      final page = await fetchRecipePage(url, widget.user.accessToken);
+      if (!mounted || url != nextPageUrl) return; // reloaded meanwhile
+      setState(() {
+        userRecipes.addAll(page.recipes);
+        nextPageUrl = page.next;
+      });
+    } finally {
+      isLoadingMore = false;
+    }
+  }
+
   @override
   Widget build(BuildContext context) {
     return isLoading
@@ -89,8 +92,14 @@ class MyRecipesContentState extends State<MyRecipesContent> {
                 ? _buildEmptyState()
                 : ListView.builder(
                     padding: const EdgeInsets.symmetric(horizontal: 16),
-                    itemCount: userRecipes.length + 1,
+                    itemCount:
+                        userRecipes.length + (nextPageUrl != null ? 2 : 1),
                     itemBuilder: (context, index) {
+                      if (index > userRecipes.length) {
+                        return LoadMoreIndicator(
+                            key: ValueKey(nextPageUrl), // a new one per page
+                            onLoadMore: loadMoreRecipes);
+                      }
                       return index == 0
                           ? Padding(
                               padding: const EdgeInsets.symmetric(
@@ -0,0 +1,33 @@
+import 'dart:convert';
+
+import 'package:http/http.dart' as http;
+import 'package:spice_bazaar/models/recipe.dart';
+
+// One page of a cursor paginated recipe list: {next, previous, results}
+class RecipePage {
+  final List<Recipe> recipes;
+  final String? next; // full URL of the following page, null on the last one
+
+  RecipePage(this.recipes, this.next);
+}
+
+Future<RecipePage> fetchRecipePage(String url, String accessToken) async {
+  final response = await http.get(Uri.parse(url), headers: {
+    'Authorization': 'Bearer $accessToken',
+  });
+  if (response.statusCode != 200) {
+    print(response.body); // Log the response body for debugging
+    throw Exception('Failed to load recipes: ${response.statusCode}');
+  }
+
+  final dynamic decodedResponse = json.decode(response.body);
+  final dynamic results =
+      decodedResponse is Map ? decodedResponse['results'] : decodedResponse;
+  if (results is! List) {
+    throw Exception('Invalid response format');
+  }
+  return RecipePage(
+    results.map((recipeJson) => Recipe.fromJson(recipeJson)).toList(),
+    decodedResponse is Map ? decodedResponse['next'] as String? : null,
+  );
+}
@@ -0,0 +1,50 @@
+import 'package:flutter/material.dart';
+import 'package:spice_bazaar/constants.dart';
+
+// Last item of a paged list: loads the next page once it is built (scrolled into view), with a retry button if that fails
+class LoadMoreIndicator extends StatefulWidget {
+  final Future<void> Function() onLoadMore;
+
+  const LoadMoreIndicator({super.key, required this.onLoadMore});
+
+  @override
+  State<LoadMoreIndicator> createState() => _LoadMoreIndicatorState();
+}
+
+class _LoadMoreIndicatorState extends State<LoadMoreIndicator> {
+  bool failed = false;
+
+  @override
+  void initState() {
+    super.initState();
+    // not during build, loading the page calls setState on the list
+    WidgetsBinding.instance.addPostFrameCallback((_) => loadMore());
+  }
+
+  Future<void> loadMore() async {
+    if (!mounted) return;
+    setState(() => failed = false);
+    try {
+      await widget.onLoadMore();
+    } catch (e) {
+      print('Error fetching more recipes: $e');
+      if (mounted) setState(() => failed = true);
+    }
+  }
+
+  @override
+  Widget build(BuildContext context) {
+    return Padding(
+      padding: const EdgeInsets.symmetric(vertical: 16.0),
+      child: Center(
+        child: failed
+            ? TextButton(
+                onPressed: loadMore,
+                child: Text('Could not load more recipes. Tap to retry',
+                    style: poppins(style: const TextStyle(color: mainPurple))),
+              )
+            : const CircularProgressIndicator(),
+      ),
+    );
+  }
+}